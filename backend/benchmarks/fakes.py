@@ -0,0 +1,347 @@
+import re
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import numpy as np
+import pypdfium2 as pdfium
+
+EMBEDDING_DIM = 1536
+
+@dataclass
+class Latency:
+    """Injected latency per fake call, in seconds. scaled() multiplies all of them (0 = as fast as possible)."""
+    embedding: float = 0.15
+    chat: float = 0.6
+    chat_token: float = 0.004 # Per streamed token
+    mistral_upload: float = 0.3
+    ocr_page: float = 0.25
+    supabase_query: float = 0.02
+    supabase_rpc: float = 0.06
+    storage: float = 0.04
+
+    def scaled(self, factor: float) -> "Latency":
+        return Latency(**{k: v * factor for k, v in self.__dict__.items()})
+
+class CallLog:
+    """Thread-safe count of external calls by name ("openai.embeddings", "supabase.rpc.match_page_sections_v2", ...)."""
+
+    def __init__(self):
+        self.calls: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, name: str):
+        with self._lock: self.calls[name] += 1
+
+    def snapshot(self) -> Counter:
+        with self._lock: return Counter(self.calls)
+
+def _sleep(seconds: float):
+    if seconds > 0: time.sleep(seconds)
+
+def _tokens(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+def fake_embedding(text: str) -> List[float]:
+    """Deterministic hashed bag-of-words vector, so texts sharing words are actually similar."""
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for token in _tokens(text):
+        h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+        vector[h % EMBEDDING_DIM] += 1.0 if (h >> 32) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+# --- OPENAI ---
+def _completion_text(messages: List[dict]) -> str:
+    """A plausible reply for each prompt the backend sends, recognised by its system prompt."""
+    system, user = messages[0]["content"], messages[-1]["content"]
+    if "query optimizer" in system:
+        return json.dumps({"refined_query": user.rsplit("Current Question:", 1)[-1].strip()})
+    if "Research Assistant" in system:
+        return json.dumps({"selected_ids": re.findall(r"\[ID: ([^\]]+)\]", user)[:3]})
+    if "Relevance Judge" in system:
+        return json.dumps({"selected_indices": [int(i) for i in re.findall(r"\[ID:(\d+)\]", user)[:10]]})
+    if "document analyzer" in system:
+        words = _tokens(user)[:60]
+        return f"[TAG]: RESEARCH\n[DESC]: Synthetic report about {' '.join(words[5:10])}.\n[DETAILED]: {' '.join(words)}"
+    # Answer prompts: quote the first sentence of the context so citations get resolved
+    context = user.split("Context:", 1)[-1]
+    sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+|\n", context) if len(s.split()) >= 6]
+    quote = sentences[0] if sentences else ""
+    return json.dumps({"answer": "According to the documents, " + " ".join(_tokens(quote)[:40]) + ".", "quotes": [quote] if quote else []})
+
+def _usage(messages: List[dict], reply: str):
+    prompt = sum(len(m["content"]) for m in messages) // 4
+    return SimpleNamespace(prompt_tokens=prompt, completion_tokens=len(reply) // 4, total_tokens=prompt + len(reply) // 4)
+
+def _response(messages: List[dict]):
+    reply = _completion_text(messages)
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))], usage=_usage(messages, reply))
+
+class _Embeddings:
+    def __init__(self, owner): self.owner = owner
+
+    def create(self, input, model):
+        self.owner.log.record("openai.embeddings")
+        _sleep(self.owner.latency.embedding)
+        texts = [input] if isinstance(input, str) else list(input)
+        data = [SimpleNamespace(index=i, embedding=fake_embedding(t)) for i, t in enumerate(texts)]
+        return SimpleNamespace(data=data, usage=SimpleNamespace(total_tokens=sum(len(t) // 4 for t in texts)))
+
+class _SyncCompletions:
+    def __init__(self, owner): self.owner = owner
+
+    def create(self, model, messages, **kwargs):
+        self.owner.log.record("openai.chat")
+        _sleep(self.owner.latency.chat)
+        return _response(messages)
+
+class _Transcriptions:
+    def __init__(self, owner): self.owner = owner
+
+    def create(self, model, file):
+        self.owner.log.record("openai.transcriptions")
+        _sleep(self.owner.latency.chat)
+        return SimpleNamespace(text="What does the report say about revenue?")
+
+class FakeOpenAI:
+    def __init__(self, latency: Latency, log: CallLog):
+        self.latency, self.log = latency, log
+        self.embeddings = _Embeddings(self)
+        self.chat = SimpleNamespace(completions=_SyncCompletions(self))
+        self.audio = SimpleNamespace(transcriptions=_Transcriptions(self))
+
+class _AsyncCompletions:
+    def __init__(self, owner): self.owner = owner
+
+    async def create(self, model, messages, stream=False, **kwargs):
+        self.owner.log.record("openai.chat")
+        if not stream:
+            await asyncio.sleep(self.owner.latency.chat)
+            return _response(messages)
+        return self._stream(messages)
+
+    async def _stream(self, messages: List[dict]):
+        reply = _completion_text(messages)
+        await asyncio.sleep(self.owner.latency.chat) # Time to first token
+        for piece in re.findall(r"\S+\s*|\s+", reply):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))], usage=None)
+            if self.owner.latency.chat_token: await asyncio.sleep(self.owner.latency.chat_token)
+        yield SimpleNamespace(choices=[], usage=_usage(messages, reply))
+
+class FakeAsyncOpenAI:
+    def __init__(self, latency: Latency, log: CallLog):
+        self.latency, self.log = latency, log
+        self.chat = SimpleNamespace(completions=_AsyncCompletions(self))
+
+# --- MISTRAL ---
+class _Files:
+    def __init__(self, owner): self.owner = owner
+
+    def upload(self, file: dict, purpose: str):
+        self.owner.log.record("mistral.files.upload")
+        content = file["content"]
+        data = content if isinstance(content, (bytes, bytearray)) else content.read()
+        _sleep(self.owner.latency.mistral_upload)
+        file_id = uuid.uuid4().hex
+        with self.owner.lock: self.owner.uploads[file_id] = bytes(data)
+        return SimpleNamespace(id=file_id)
+
+    def get_signed_url(self, file_id: str, expiry: int = 1):
+        self.owner.log.record("mistral.files.signed_url")
+        return SimpleNamespace(url=f"fake://{file_id}")
+
+class _OCR:
+    def __init__(self, owner): self.owner = owner
+
+    def process(self, document: dict, model: str, include_image_base64: bool = False, pages: Optional[List[int]] = None, **kwargs):
+        """Extracts the real text layer of the uploaded PDF, one markdown string per page."""
+        self.owner.log.record("mistral.ocr")
+        with self.owner.lock: data = self.owner.uploads[document["document_url"].split("fake://", 1)[1]]
+        pdf = pdfium.PdfDocument(data)
+        indexes = pages if pages is not None else list(range(len(pdf)))
+        out = []
+        for i in indexes:
+            textpage = pdf[i].get_textpage()
+            text = textpage.get_text_range().replace("\r\n", "\n")
+            lines = text.split("\n")
+            # Synthetic pages start with a title line; render it as a heading like Mistral would
+            markdown = "\n".join([f"## {lines[0]}"] + lines[1:]) if lines and lines[0] else text
+            out.append(SimpleNamespace(index=i, markdown=markdown, images=[]))
+        pdf.close()
+        _sleep(self.owner.latency.ocr_page * len(indexes))
+        return SimpleNamespace(pages=out, usage_info=SimpleNamespace(pages_processed=len(indexes), doc_size_bytes=len(data)))
+
+class FakeMistral:
+    def __init__(self, latency: Latency, log: CallLog):
+        self.latency, self.log = latency, log
+        self.uploads: Dict[str, bytes] = {} # file id -> PDF bytes
+        self.lock = threading.Lock()
+        self.files = _Files(self)
+        self.ocr = _OCR(self)
+
+# --- SUPABASE ---
+class _Query:
+    """The subset of the postgrest query builder the backend uses, evaluated over in-memory rows."""
+
+    def __init__(self, db: "FakeSupabase", table: str):
+        self.db, self.table = db, table
+        self.op, self.payload, self.columns = "select", None, None
+        self.filters, self.orders = [], []
+        self.offset, self.limit_n, self.on_conflict = 0, None, None
+        self.count, self.head = None, False
+
+    def select(self, columns: str = "*", count: Optional[str] = None, head: Optional[bool] = None):
+        self.columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        self.count, self.head = count, bool(head)
+        return self
+
+    def insert(self, rows): self.op, self.payload = "insert", rows; return self
+    def upsert(self, rows, on_conflict: Optional[str] = None): self.op, self.payload, self.on_conflict = "upsert", rows, on_conflict; return self
+    def update(self, values: dict): self.op, self.payload = "update", values; return self
+    def delete(self): self.op = "delete"; return self
+
+    def eq(self, column, value): self.filters.append(lambda r: str(r.get(column)) == str(value)); return self
+    def in_(self, column, values): self.filters.append(lambda r: r.get(column) in set(values)); return self
+    def gt(self, column, value): self.filters.append(lambda r: r.get(column) is not None and str(r.get(column)) > str(value)); return self
+    def lt(self, column, value): self.filters.append(lambda r: r.get(column) is not None and str(r.get(column)) < str(value)); return self
+    def is_(self, column, value): self.filters.append(lambda r: r.get(column) is None if value == "null" else r.get(column) == value); return self
+    def or_(self, expression: str):
+        # Only the keyset form get_documents sends: a.lt."v",and(a.eq."v",b.lt.w)
+        match = re.fullmatch(r'(\w+)\.lt\."([^"]+)",and\(\1\.eq\."\2",(\w+)\.lt\.(.+)\)', expression)
+        if not match: raise ValueError(f"Unsupported or_ filter: {expression}")
+        column, value, tie, last = match.groups()
+        self.filters.append(lambda r: str(r.get(column)) < value or (str(r.get(column)) == value and str(r.get(tie)) < last))
+        return self
+    def order(self, column, desc: bool = False): self.orders.append((column, desc)); return self
+    def range(self, start: int, end: int): self.offset, self.limit_n = start, end - start + 1; return self
+    def limit(self, n: int): self.limit_n = n; return self
+
+    def _match(self, row: dict) -> bool:
+        return all(f(row) for f in self.filters)
+
+    def execute(self):
+        self.db.log.record(f"supabase.{self.op}.{self.table}")
+        _sleep(self.db.latency.supabase_query)
+        with self.db.lock:
+            rows = self.db.tables.setdefault(self.table, [])
+            if self.op in ("insert", "upsert"):
+                new = [dict(r) for r in (self.payload if isinstance(self.payload, list) else [self.payload])]
+                for row in new:
+                    row.setdefault("id", str(uuid.uuid4()))
+                    row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+                if self.op == "upsert" and self.on_conflict:
+                    keys = self.on_conflict.split(",")
+                    incoming = {tuple(r.get(k) for k in keys) for r in new}
+                    rows[:] = [r for r in rows if tuple(r.get(k) for k in keys) not in incoming]
+                rows.extend(new)
+                return SimpleNamespace(data=new)
+            if self.op == "update":
+                hit = [r for r in rows if self._match(r)]
+                for r in hit: r.update(self.payload)
+                return SimpleNamespace(data=[dict(r) for r in hit])
+            if self.op == "delete":
+                hit = [r for r in rows if self._match(r)]
+                rows[:] = [r for r in rows if not self._match(r)]
+                return SimpleNamespace(data=hit)
+            result = [r for r in rows if self._match(r)]
+        total = len(result) if self.count else None
+        for column, desc in reversed(self.orders): result.sort(key=lambda r: str(r.get(column) or ""), reverse=desc)
+        result = [] if self.head else result[self.offset:self.offset + self.limit_n if self.limit_n is not None else None]
+        if self.columns: result = [{c: r.get(c) for c in self.columns} for r in result]
+        return SimpleNamespace(data=[dict(r) for r in result], count=total)
+
+class _Rpc:
+    def __init__(self, db: "FakeSupabase", name: str, params: dict): self.db, self.name, self.params = db, name, params
+
+    def execute(self):
+        self.db.log.record(f"supabase.rpc.{self.name}")
+        _sleep(self.db.latency.supabase_rpc)
+        p = self.params
+        if self.name == "match_page_sections_v2": doc_ids, folder, per_doc = [p["filter_doc_id"]], None, p["match_count"]
+        elif self.name == "match_page_sections_multi": doc_ids, folder, per_doc = p.get("filter_doc_ids"), p.get("filter_folder"), p.get("per_doc_limit", 20)
+        else: raise ValueError(f"Unknown RPC {self.name}")
+        with self.db.lock:
+            rows = [r for r in self.db.tables.get("document_pages", [])
+                    if (doc_ids is None or r["document_id"] in doc_ids) and (folder is None or r.get("folder") == folder)]
+        if not rows: return SimpleNamespace(data=[])
+        query = np.asarray(p["query_embedding"], dtype=np.float32)
+        scores = np.asarray([r["embedding"] for r in rows], dtype=np.float32) @ query
+        taken: Counter = Counter()
+        out = []
+        for i in np.argsort(-scores):
+            row = rows[i]
+            if scores[i] <= p["match_threshold"] or taken[row["document_id"]] >= per_doc: continue
+            taken[row["document_id"]] += 1
+            out.append({k: row.get(k) for k in ("id", "document_id", "title", "content", "page_number", "bboxes")} | {"similarity": float(scores[i])})
+            if len(out) >= p["match_count"]: break
+        return SimpleNamespace(data=out)
+
+class _Bucket:
+    def __init__(self, db: "FakeSupabase", name: str): self.db, self.name = db, name
+
+    def _key(self, path: str) -> str: return f"{self.name}/{path}"
+
+    def upload(self, file, path: str, file_options: Optional[dict] = None):
+        self.db.log.record("storage.upload")
+        data = file if isinstance(file, (bytes, bytearray)) else file.read()
+        _sleep(self.db.latency.storage)
+        with self.db.lock: self.db.objects[self._key(path)] = bytes(data)
+        return SimpleNamespace(path=path)
+
+    def download(self, path: str) -> bytes:
+        self.db.log.record("storage.download")
+        _sleep(self.db.latency.storage)
+        with self.db.lock:
+            if self._key(path) not in self.db.objects: raise FileNotFoundError(f"Object not found: {path}")
+            return self.db.objects[self._key(path)]
+
+    def copy(self, src: str, dst: str):
+        self.db.log.record("storage.copy")
+        _sleep(self.db.latency.storage)
+        with self.db.lock: self.db.objects[self._key(dst)] = self.db.objects[self._key(src)]
+
+    def remove(self, paths: List[str]):
+        self.db.log.record("storage.remove")
+        with self.db.lock:
+            for path in paths: self.db.objects.pop(self._key(path), None)
+
+    def get_public_url(self, path: str) -> str: return f"fake://{self._key(path)}"
+
+class FakeSupabase:
+    def __init__(self, latency: Latency, log: CallLog):
+        self.latency, self.log = latency, log
+        self.tables: Dict[str, List[dict]] = {"folders": [{"id": 1, "name": "General"}]}
+        self.objects: Dict[str, bytes] = {}
+        self.lock = threading.Lock()
+        self.storage = SimpleNamespace(from_=lambda bucket: _Bucket(self, bucket))
+
+    def table(self, name: str) -> _Query: return _Query(self, name)
+
+    def rpc(self, name: str, params: dict) -> _Rpc: return _Rpc(self, name, params)
+
+# --- WIRING ---
+class FakeServices:
+    """One set of fakes sharing a latency profile and a call log."""
+
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self.log = CallLog()
+        self.openai = FakeOpenAI(latency, self.log)
+        self.async_openai = FakeAsyncOpenAI(latency, self.log)
+        self.mistral = FakeMistral(latency, self.log)
+        self.supabase = FakeSupabase(latency, self.log)
+
+    def install(self):
+        """Seeds the shared client registry, so every engine gets the fakes instead of building real clients."""
+        from services.clients import clients
+        with clients._lock:
+            clients._clients.update({"openai": self.openai, "async_openai": self.async_openai, "mistral": self.mistral, "supabase": self.supabase})
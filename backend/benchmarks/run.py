@@ -0,0 +1,188 @@
+"""Offline benchmark of ingestion and /chat against in-process fakes of OpenAI, Mistral and Supabase.
+
+    cd backend && python -m benchmarks.run --pages 1,10,50 --docs 2 --chats 30 --out bench.json
+
+Nothing leaves the machine: the fakes (benchmarks/fakes.py) are seeded into the shared client
+registry before main.app starts, and every fake call sleeps for its share of the latency
+profile (--latency-scale 0 measures pure backend overhead). The JSON report holds ingestion
+throughput, chat p50 / p99, external calls per operation and peak memory, so two runs on the
+same machine can be diffed.
+"""
+import os
+import sys
+import json
+import socket
+import time
+import argparse
+import platform
+import tempfile
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Dict, List
+
+import httpx
+import numpy as np
+import uvicorn
+
+from benchmarks.fakes import FakeServices, Latency
+from benchmarks.synthetic_pdf import document_pages, make_pdf, questions_for
+
+FOLDER = "Benchmark"
+INGEST_TIMEOUT = 600
+
+def _isolate_state(workdir: str):
+    """Keeps every on-disk cache in a throwaway directory; runs must not share warm state."""
+    for name, sub in (("PDF_CACHE_DIR", "pdf_cache"), ("UPLOAD_SPOOL_DIR", "spool"), ("VECTOR_INDEX_DIR", "vector_index")):
+        os.environ.setdefault(name, os.path.join(workdir, sub))
+    os.environ.setdefault("ANSWER_CACHE", "0") # Every chat runs the full path unless --answer-cache
+    for name in ("OPENAI_API_KEY", "MISTRAL_API_KEY", "SUPABASE_URL", "SUPABASE_KEY"): os.environ.setdefault(name, "offline")
+
+def _serve(app) -> "uvicorn.Server":
+    """Runs the app under uvicorn on a free loopback port in a background thread.
+    A real server (not an in-process test client) is what lets /chat/stream report time to first token."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="bench-server", daemon=True).start()
+    while not server.started: time.sleep(0.01)
+    return server
+
+def _diff(after: Counter, before: Counter, per: int = 1) -> Dict[str, float]:
+    return {k: round((after[k] - before[k]) / per, 2) for k in sorted(after) if after[k] != before[k]}
+
+def _percentiles(samples: List[float]) -> dict:
+    if not samples: return {}
+    ms = np.asarray(samples) * 1000
+    return {"n": len(samples), "p50_ms": round(float(np.percentile(ms, 50)), 1), "p99_ms": round(float(np.percentile(ms, 99)), 1), "mean_ms": round(float(ms.mean()), 1)}
+
+def _peak_memory() -> dict:
+    _, traced = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    out = {"python_peak_mb": round(traced / 2 ** 20, 1)}
+    try:
+        import resource # Unix only
+        scale = 1 if sys.platform == "darwin" else 1024 # ru_maxrss is bytes on macOS, KiB elsewhere
+        out["process_max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20, 1)
+    except ImportError: pass
+    return out
+
+def _wait_ready(status_events, doc_ids: List[str]) -> Dict[str, str]:
+    # Reads the in-process broadcaster rather than polling /status, so polling adds no database calls to the counts
+    pending, statuses, deadline = set(doc_ids), {}, time.monotonic() + INGEST_TIMEOUT
+    while pending and time.monotonic() < deadline:
+        for doc_id in list(pending):
+            status = status_events.latest.get(doc_id, {}).get("status")
+            if status in ("ready", "failed"):
+                statuses[doc_id] = status
+                pending.discard(doc_id)
+        time.sleep(0.05)
+    for doc_id in pending: statuses[doc_id] = "timeout"
+    return statuses
+
+def bench_ingestion(client, status_events, fakes: FakeServices, page_counts: List[int], docs: int, seed: int) -> tuple:
+    results, corpus = [], []
+    for n_pages in page_counts:
+        pdfs = []
+        for d in range(docs):
+            pages = document_pages(len(corpus) + d, n_pages, seed)
+            pdfs.append((f"synthetic-{n_pages}p-{d}.pdf", make_pdf(pages), pages))
+        before, start = fakes.log.snapshot(), time.perf_counter()
+        uploaded = []
+        for filename, data, pages in pdfs:
+            res = client.post("/upload", files={"file": (filename, data, "application/pdf")}, data={"folder": FOLDER})
+            res.raise_for_status()
+            uploaded.append((res.json()["doc_id"], pages))
+        statuses = _wait_ready(status_events, [doc_id for doc_id, _ in uploaded])
+        seconds = time.perf_counter() - start
+        corpus.extend((doc_id, pages) for doc_id, pages in uploaded if statuses[doc_id] == "ready")
+        results.append({
+            "pages": n_pages, "documents": docs, "seconds": round(seconds, 3),
+            "pages_per_second": round(n_pages * docs / seconds, 2), "megabytes": round(sum(len(d) for _, d, _ in pdfs) / 2 ** 20, 2),
+            "failed": sum(1 for s in statuses.values() if s != "ready"),
+            "calls_per_document": _diff(fakes.log.snapshot(), before, docs), "memory": _peak_memory(),
+        })
+        print(f"ingest {n_pages:>4}p x{docs}: {seconds:7.2f}s  {results[-1]['pages_per_second']:7.2f} pages/s", flush=True)
+    return results, corpus
+
+def _chat_requests(corpus, mode: str, n: int, seed: int) -> List[dict]:
+    out = []
+    for i in range(n):
+        doc_id, pages = corpus[i % len(corpus)]
+        question = questions_for(pages, 1, seed + i)[0]
+        if mode == "single_doc": out.append({"message": question, "document_id": doc_id})
+        else: out.append({"message": question, "folder_name": FOLDER, "mode": "deep" if mode == "folder_deep" else "simple"})
+    return out
+
+def bench_chat(client, fakes: FakeServices, corpus, chats: int, seed: int) -> dict:
+    results = {}
+    for mode in ("single_doc", "folder_fast", "folder_deep"):
+        requests = _chat_requests(corpus, mode, chats, seed)
+        before, latencies, errors = fakes.log.snapshot(), [], 0
+        for body in requests:
+            start = time.perf_counter()
+            res = client.post("/chat", json=body)
+            latencies.append(time.perf_counter() - start)
+            if res.status_code != 200 or res.json().get("answer") in (None, "", "Error generating response."): errors += 1
+        results[mode] = {**_percentiles(latencies), "errors": errors, "calls_per_chat": _diff(fakes.log.snapshot(), before, len(requests)), "memory": _peak_memory()}
+        print(f"chat {mode:<12} p50 {results[mode]['p50_ms']:8.1f} ms  p99 {results[mode]['p99_ms']:8.1f} ms", flush=True)
+
+    # Streaming: time to first token as well as to the end of the stream
+    before, first_token, total = fakes.log.snapshot(), [], []
+    for body in _chat_requests(corpus, "single_doc", chats, seed + 7919):
+        start, first = time.perf_counter(), None
+        with client.stream("POST", "/chat/stream", json=body) as res:
+            for line in res.iter_lines():
+                if first is None and line.startswith("event: token"): first = time.perf_counter() - start
+        total.append(time.perf_counter() - start)
+        if first is not None: first_token.append(first)
+    results["single_doc_stream"] = {**_percentiles(total), "first_token": _percentiles(first_token), "calls_per_chat": _diff(fakes.log.snapshot(), before, chats), "memory": _peak_memory()}
+    print(f"chat {'stream':<12} p50 {results['single_doc_stream']['p50_ms']:8.1f} ms  first token p50 {results['single_doc_stream']['first_token'].get('p50_ms', 0):8.1f} ms", flush=True)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--pages", default="1,10,50", help="comma-separated page counts of the synthetic PDFs")
+    parser.add_argument("--docs", type=int, default=2, help="documents ingested per page count")
+    parser.add_argument("--chats", type=int, default=20, help="chat requests per mode")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplier on the fake latency profile (0 = none)")
+    parser.add_argument("--answer-cache", action="store_true", help="leave the semantic answer cache on")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the JSON report here as well as to stdout")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    _isolate_state(workdir)
+    if args.answer_cache: os.environ["ANSWER_CACHE"] = "1"
+    tracemalloc.start()
+
+    latency = Latency().scaled(args.latency_scale)
+    fakes = FakeServices(latency)
+    fakes.install()
+    import main as app_module # Imported after the fakes are in place and the environment is set
+
+    started = time.perf_counter()
+    server = _serve(app_module.app)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{server.config.port}", timeout=120) as client:
+            ingestion, corpus = bench_ingestion(client, app_module.status_events, fakes, [int(p) for p in args.pages.split(",")], args.docs, args.seed)
+            chat = bench_chat(client, fakes, corpus, args.chats, args.seed) if corpus else {}
+            stage_metrics = client.get("/metrics").text
+    finally: server.should_exit = True
+
+    report = {
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {**vars(args), "latency": latency.__dict__},
+        "ingestion": ingestion, "chat": chat,
+        "total_external_calls": dict(sorted(fakes.log.snapshot().items())),
+        "wall_seconds": round(time.perf_counter() - started, 2),
+        "stage_seconds": {line.split("{", 1)[1].split('"')[1]: float(line.rsplit(" ", 1)[1]) for line in stage_metrics.splitlines() if line.startswith("rag_stage_seconds_sum")},
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f: f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import random
+from typing import List
+
+# Topic words are shared across documents so folder chat has to rank them; each document
+# also gets its own code words, which makes document-specific questions answerable.
+TOPICS = ["revenue", "margin", "pipeline", "latency", "warehouse", "forecast", "contract", "invoice",
+          "compliance", "battery", "turbine", "clinical", "dosage", "portfolio", "shipping", "tariff"]
+FILLER = ["the", "report", "shows", "that", "quarterly", "results", "were", "driven", "by", "strong", "demand",
+          "across", "regions", "while", "costs", "remained", "stable", "and", "management", "expects", "growth",
+          "next", "year", "according", "to", "analysis", "of", "operating", "data", "from", "several", "units"]
+
+LINES_PER_PAGE = 38
+WORDS_PER_LINE = 12
+
+def document_pages(doc_index: int, n_pages: int, seed: int = 0) -> List[List[str]]:
+    """Deterministic page text: a title line plus sentences mixing filler, topics, numbers and dates."""
+    rng = random.Random(seed * 100003 + doc_index)
+    codes = [f"{rng.choice(TOPICS)}{doc_index}x{k}" for k in range(4)]
+    pages = []
+    for p in range(n_pages):
+        lines = [f"Section {p + 1} {rng.choice(TOPICS).title()} Review {codes[p % len(codes)]}"]
+        for _ in range(LINES_PER_PAGE - 1):
+            words = [rng.choice(FILLER) for _ in range(WORDS_PER_LINE - 4)]
+            words += [rng.choice(TOPICS), rng.choice(codes), f"{rng.randint(1, 999)}.{rng.randint(0, 99):02d}", f"20{rng.randint(10, 25)}-{rng.randint(1, 12):02d}"]
+            rng.shuffle(words)
+            lines.append(" ".join(words).capitalize() + ".")
+        pages.append(lines)
+    return pages
+
+def questions_for(pages: List[List[str]], n: int, seed: int = 0) -> List[str]:
+    """Questions built from words that really occur in the document."""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        line = rng.choice(rng.choice(pages)[1:]).rstrip(".").split()
+        out.append(f"What does the document say about {' '.join(rng.sample(line, 3))}?")
+    return out
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def make_pdf(pages: List[List[str]]) -> bytes:
+    """A minimal text PDF (Helvetica, one line per string) with a real text layer for extraction."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        body = "BT /F1 10 Tf 14 TL 40 800 Td " + " ".join(f"({_escape(line)}) Tj T*" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(body.encode('latin-1'))} >>\nstream\n{body}\nendstream")
+        content_ref = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Resources << /Font << /F1 3 0 R >> >> /Contents {content_ref} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return bytes(out)
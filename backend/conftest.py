@@ -0,0 +1,23 @@
+# Lets tests import the backend packages (services, benchmarks) the way main.py does.
+import os
+
+import pytest
+
+from benchmarks.fakes import FakeServices, Latency
+
+@pytest.fixture
+def fakes() -> FakeServices:
+    """Fresh zero-latency stand-ins for OpenAI, Mistral and Supabase in the shared client registry."""
+    services = FakeServices(Latency().scaled(0))
+    services.install()
+    return services
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    """main, imported the way benchmarks/run.py does it: fakes installed, state in a throwaway directory."""
+    workdir = tmp_path_factory.mktemp("state")
+    for name in ("PDF_CACHE_DIR", "UPLOAD_SPOOL_DIR", "VECTOR_INDEX_DIR"): os.environ.setdefault(name, str(workdir / name.lower()))
+    for name in ("OPENAI_API_KEY", "MISTRAL_API_KEY", "SUPABASE_URL", "SUPABASE_KEY"): os.environ.setdefault(name, "offline")
+    FakeServices(Latency().scaled(0)).install()
+    import main
+    return main
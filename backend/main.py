@@ -1,13 +1,30 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse, JSONResponse, FileResponse, PlainTextResponse
 from typing import List, Optional, Dict
+from dataclasses import dataclass, field
 import io
+import os
+import json
+import asyncio
 import uuid
+import time
 from services.pdf_engine import PDFEngine
-from services.openai_service import OpenAIService
-from services.mistral_engine import MistralEngine
+from services.openai_service import OpenAIService, needs_rewrite, minor_rewrite
+from services.mistral_engine import MistralEngine, STAGE_QUEUED, decode_cursor
+from services.ingestion_queue import IngestionQueue, IngestJob, QueueFullError
+from services.embedding_cache import shared_embedding_cache
+from services.vector_index import shared_vector_index
+from services.lexical_index import shared_lexical_index
+from services.deadline import Deadline
+from services.answer_cache import shared_answer_cache
+from services.listing_cache import shared_listing_cache
+from services.status_events import shared_status_events
+from services.pdf_cache import SourcePDFCache
+from services.upload_spool import UploadSpooler, UploadBudgetError, UploadFormError
+from services.summary_index import SUMMARY_PRESELECT, SUMMARY_FAST_TOP, SUMMARY_BACKFILL
+from services.metrics import metrics, timed, start_request_timing, server_timing_header, SERVER_TIMING
 
 app = FastAPI()
 app.add_middleware(
@@ -16,11 +33,46 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Accept-Ranges", "Content-Range", "Content-Length", "ETag", "Server-Timing"], # pdf.js needs the range headers
 )
 
 pdf_engine = PDFEngine()
 ai_service = OpenAIService()
 ocr_engine = MistralEngine()
+ingest_queue = IngestionQueue(ocr_engine)
+
+vector_index = shared_vector_index()
+lexical_index = shared_lexical_index()
+answer_cache = shared_answer_cache()
+listing_cache = shared_listing_cache()
+status_events = shared_status_events()
+pdf_cache = SourcePDFCache(pdf_engine.get_pdf_bytes)
+upload_spooler = UploadSpooler()
+
+@app.middleware("http")
+async def add_server_timing(request: Request, call_next):
+    """Server-Timing header with the stages a request went through (SERVER_TIMING=1, or "X-Server-Timing: 1").
+    Streaming responses only report the stages that finished before their first byte."""
+    if not (SERVER_TIMING or request.headers.get("x-server-timing") == "1"): return await call_next(request)
+    timings, start = start_request_timing(), time.perf_counter()
+    response = await call_next(request)
+    timings.append(("total", time.perf_counter() - start))
+    header = server_timing_header(timings)
+    if header: response.headers["Server-Timing"] = header
+    return response
+
+@app.on_event("startup")
+async def start_ingestion(): await ingest_queue.start()
+
+@app.on_event("startup")
+def load_search_indexes():
+    # Rebuilt in the background; searches use the Supabase RPCs alone until they are ready
+    if vector_index: vector_index.start_rebuild(ocr_engine.supabase)
+    if lexical_index: lexical_index.start_rebuild(ocr_engine.supabase)
+    if SUMMARY_BACKFILL: ocr_engine.start_summary_backfill()
+
+@app.on_event("shutdown")
+async def stop_ingestion(): await ingest_queue.stop()
 
 class ChatRequest(BaseModel):
     message: str
@@ -35,11 +87,31 @@ class FolderRequest(BaseModel):
 @app.get("/")
 def read_root(): return {"status": "Backend is running", "message": "Ready"}
 
+def _cached_listing(request: Request, key: tuple, build):
+    """Serves a listing from the short-TTL cache; a matching If-None-Match gets a 304."""
+    try: etag, payload = listing_cache.get_or_build(key, build)
+    except Exception as e:
+        print(f"Listing {key[0]} failed: {e}")
+        raise HTTPException(status_code=502, detail="Could not load listing")
+    headers = {"ETag": etag, "Cache-Control": "no-cache"} # Browsers revalidate with If-None-Match on every fetch
+    if request.headers.get("if-none-match") == etag: return Response(status_code=304, headers=headers)
+    return JSONResponse(payload, headers=headers)
+
 @app.get("/documents")
-def get_documents(): return {"documents": ocr_engine.get_documents()}
+def get_documents(request: Request, folder: Optional[str] = None, status: Optional[str] = None, include_summary: bool = False,
+                  limit: int = Query(100, ge=1, le=500), cursor: Optional[str] = None, include_tags: bool = False):
+    if cursor:
+        try: decode_cursor(cursor)
+        except ValueError as e: raise HTTPException(status_code=400, detail=str(e))
+    key = ("documents", folder, status, include_summary, limit, cursor, include_tags)
+    return _cached_listing(request, key, lambda: ocr_engine.get_documents(folder, status, include_summary, limit, cursor, include_tags))
 
 @app.get("/folders")
-def get_folders(): return {"folders": pdf_engine.get_folders()}
+def get_folders(request: Request):
+    def build():
+        folders = pdf_engine.get_folders()
+        return {"folders": folders, "counts": pdf_engine.count_documents(folders)} # Folder cards show counts without listing documents
+    return _cached_listing(request, ("folders",), build)
 
 @app.post("/folders")
 def create_folder(req: FolderRequest):
@@ -56,6 +128,7 @@ def delete_folder(folder_name: str):
 @app.delete("/documents/{doc_id}")
 def delete_document(doc_id: str):
     ocr_engine.delete_document(doc_id)
+    pdf_cache.evict(doc_id)
     return {"status": "success"}
 
 @app.get("/documents/{doc_id}/debug_search")
@@ -65,91 +138,267 @@ def debug_search_endpoint(doc_id: str, query: str): return ocr_engine.debug_sear
 def debug_document(doc_id: str): return ocr_engine.debug_document(doc_id)
 
 @app.post("/upload")
-async def upload_document(background_tasks: BackgroundTasks, file: UploadFile = File(...), folder: str = Form("General")):
-    if not file.filename.endswith(".pdf"): raise HTTPException(status_code=400, detail="File must be a PDF")
-    file_bytes = await file.read()
-    doc_id = str(uuid.uuid4())
+async def upload_document(request: Request):
+    """multipart/form-data with `file` (a PDF) and optional `folder`. The body is streamed straight
+    into the upload spool rather than parsed by the framework first, so it is written to disk once."""
+    # Backpressure: refuse early instead of accepting work the workers cannot get to
+    if ingest_queue.full(): raise HTTPException(status_code=503, detail="Ingestion queue is full, try again shortly.", headers={"Retry-After": "5"})
+    try: source, fields = await upload_spooler.spool_form(request)
+    except UploadBudgetError as e: raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except UploadFormError as e: raise HTTPException(status_code=400, detail=str(e))
+    if not source.filename.endswith(".pdf"):
+        source.release()
+        raise HTTPException(status_code=400, detail="File must be a PDF")
+    doc_id, folder = str(uuid.uuid4()), fields.get("folder") or "General"
+    job = IngestJob(doc_id, source.filename, folder, source)
     try:
-        ocr_engine.supabase.table("documents").insert({"id": doc_id, "title": file.filename, "folder": folder, "status": "processing"}).execute()
-        background_tasks.add_task(ocr_engine.process_pdf_background, doc_id, file_bytes, file.filename, folder)
+        with timed("supabase.insert.documents"):
+            ocr_engine.supabase.table("documents").insert({"id": doc_id, "title": source.filename, "folder": folder, "status": "processing", "ingest_stage": STAGE_QUEUED, **ingest_queue.lease()}).execute()
+        listing_cache.invalidate()
+        status_events.publish(doc_id, title=source.filename, folder=folder, stage=STAGE_QUEUED, status="processing")
+        ingest_queue.submit(job) # Last step: once the queue owns the job, only the worker releases its upload
         return {"status": "processing", "doc_id": doc_id}
-    except Exception as e: raise HTTPException(status_code=500, detail=str(e))
+    except QueueFullError as e:
+        job.release()
+        ocr_engine.supabase.table("documents").delete().eq("id", doc_id).execute()
+        listing_cache.invalidate()
+        status_events.forget(doc_id)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        job.release()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/ingestion/stats")
+def get_ingestion_stats(): return {**ingest_queue.stats(), "events": status_events.stats(), "uploads": upload_spooler.stats()}
+
+@app.get("/ingestion/events")
+async def ingestion_events(doc_id: Optional[str] = None):
+    """Server-Sent Events with ingestion progress ("status" events: stage, status, pages_ocr / pages_total,
+    chunks_embedded / chunks_indexed, summary, error), for one document or all of them.
+    Served from the in-process broadcaster, so subscribers cost no database queries."""
+    async def events():
+        async for event in status_events.subscribe(doc_id):
+            yield _sse("status", event) if event is not None else ": keepalive\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/metrics")
+def get_metrics(): return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+def get_cache_stats(): return {"embeddings": shared_embedding_cache().stats(), "answers": answer_cache.stats() if answer_cache else None, "listings": listing_cache.stats(), "pdfs": pdf_cache.stats(), "summaries": ocr_engine.summary_index.stats()}
 
 @app.get("/documents/{doc_id}/status")
 def get_document_status(doc_id: str):
-    res = ocr_engine.supabase.table("documents").select("status, summary").eq("id", doc_id).execute()
+    res = ocr_engine.supabase.table("documents").select("status, summary, ingest_stage, ingest_error, cache_hit").eq("id", doc_id).execute()
     if not res.data: raise HTTPException(status_code=404, detail="Document not found")
     return res.data[0]
 
 # --- SOTA CHAT ENDPOINT ---
-@app.post("/chat")
-async def chat(request: ChatRequest):
-    relevant_chunks = []
-    mode_arg = "single_doc"
+@dataclass
+class ChatTurn:
+    """What a chat turn is answered from; scope + fingerprint + query_vector are the answer cache key."""
+    mode_arg: str
+    refined_query: str
+    query_vector: Optional[List[float]] = None
+    scope: Optional[str] = None
+    fingerprint: str = ""
+    files: List[dict] = field(default_factory=list)
+    select_task: Optional[asyncio.Task] = None
+
+async def _plan(request: ChatRequest, deadline: Deadline) -> ChatTurn:
+    """Query rewrite, embedding and document scope of a chat turn, everything needed before the cache lookup.
 
-    # 1. CONTEXTUAL REWRITING
-    refined_query = ai_service.generate_refined_query(request.history, request.message)
+    Supabase / embedding calls are blocking and run in threads; each stage is bounded by the deadline.
+    """
+    # 1. CONTEXTUAL REWRITING (skipped by generate_refined_query when the question stands alone)
+    def rewrite(): return deadline.run("rewrite", ai_service.generate_refined_query(request.history, request.message), request.message)
+    # None when the embedding runs out of time: searches then embed for themselves and the turn is not cached
+    def embed(text): return deadline.run("embed", asyncio.to_thread(ocr_engine.get_embedding, text), None)
+
+    async def summaries(vector, limit):
+        if vector is None: return [], ""
+        return await deadline.run("search", asyncio.to_thread(ocr_engine.find_folder_files, request.folder_name, vector, limit), ([], ""))
 
     # 2. INDIVIDUAL DOCUMENT CHAT
     if request.document_id:
-        relevant_chunks = ocr_engine.search_single_doc(refined_query, request.document_id)
+        turn = ChatTurn("single_doc", request.message, scope=f"doc:{request.document_id}")
+        if answer_cache:
+            # The document's version is read alongside the rewrite; "" (not ready, or too slow) keeps the turn out of the cache
+            version = deadline.run("search", asyncio.to_thread(ocr_engine.document_fingerprint, request.document_id), "")
+            turn.refined_query, turn.fingerprint = await asyncio.gather(rewrite(), version)
+        else: turn.refined_query = await rewrite()
+
+    # 3. FOLDER CHAT
+    elif request.folder_name and request.mode == "deep":
+        # One embedding of the question serves summary preselection, the cache and the chunk search.
+        # Only the SUMMARY_PRESELECT closest summaries reach the file-selection prompt, however large the folder is.
+        async def preselect(query):
+            vector = await embed(query)
+            files, fingerprint = await summaries(vector, SUMMARY_PRESELECT)
+            select = asyncio.create_task(deadline.run("select", ai_service.select_relevant_files(files, query), [f['id'] for f in files[:3]]))
+            return vector, files, fingerprint, select
+
+        turn = ChatTurn("folder_deep", request.message, scope=f"folder:{request.folder_name}:deep")
+        if needs_rewrite(request.history, request.message):
+            # The rewrite is a model round trip: preselect and select on the raw question meanwhile,
+            # and keep that work when the rewrite barely changes the question
+            speculative = asyncio.create_task(preselect(request.message))
+            turn.refined_query = await rewrite()
+            if minor_rewrite(request.message, turn.refined_query): plan = await speculative
+            else:
+                if not speculative.cancel() and speculative.exception() is None: speculative.result()[3].cancel()
+                plan = await preselect(turn.refined_query)
+        else:
+            turn.refined_query = await rewrite()
+            plan = await preselect(turn.refined_query)
+        turn.query_vector, turn.files, turn.fingerprint, turn.select_task = plan
+        return turn
+
+    elif request.folder_name:
+        # Summaries only: no rewrite or search, just the SUMMARY_FAST_TOP summaries closest to the question
+        turn = ChatTurn("folder_fast", request.message, scope=f"folder:{request.folder_name}:fast")
+        turn.query_vector = await embed(turn.refined_query)
+        turn.files, turn.fingerprint = await summaries(turn.query_vector, SUMMARY_FAST_TOP)
+        return turn
+
+    else: return ChatTurn("single_doc", request.message)
+
+    turn.query_vector = await embed(turn.refined_query) # Embed once, reuse for cache + every document
+    return turn
+
+async def _retrieve(request: ChatRequest, turn: ChatTurn, deadline: Deadline) -> List[dict]:
+    relevant_chunks = []
+
+    if turn.mode_arg == "single_doc" and request.document_id:
+        relevant_chunks = await deadline.run("search", asyncio.to_thread(ocr_engine.search_single_doc, turn.refined_query, request.document_id, turn.query_vector), [])
         # INJECT DOC ID
         for chunk in relevant_chunks:
             chunk['document_id'] = request.document_id
-        mode_arg = "single_doc"
 
-    # 3. FOLDER CHAT
-    elif request.folder_name:
-        if request.mode == "deep":
-            mode_arg = "folder_deep"
-            all_files = ocr_engine.get_folder_files(request.folder_name)
-            
-            selected_ids = ai_service.select_relevant_files(all_files, refined_query)
-            
-            for doc_id in selected_ids:
-                title = next((f['title'] for f in all_files if f['id'] == doc_id), "Unknown")
-                doc_chunks = ocr_engine.search_single_doc(refined_query, doc_id)
-                for chunk in doc_chunks:
-                    chunk['source'] = title 
-                    chunk['document_id'] = doc_id # INJECT DOC ID
-                    relevant_chunks.append(chunk)
-            
-            # Fallback
-            if not relevant_chunks and all_files:
-                 for f in all_files[:3]:
-                     doc_chunks = ocr_engine.search_single_doc(refined_query, f['id'])
-                     for chunk in doc_chunks:
-                         chunk['source'] = f['title']
-                         chunk['document_id'] = f['id'] # INJECT DOC ID
-                         relevant_chunks.append(chunk)
+    elif turn.mode_arg == "folder_deep":
+        selected_ids = await turn.select_task
+        titles = {f['id']: f['title'] for f in turn.files}
 
-        else:
-            mode_arg = "folder_fast"
-            raw_files = ocr_engine.get_folder_files(request.folder_name)
-            for f in raw_files:
-                relevant_chunks.append({
-                    "content": f['summary'],
-                    "source": f['title'],
-                    "document_id": f['id'], # INJECT DOC ID
-                    "page": 1,
-                    "type": "summary"
-                })
+        # One merged search across the selected documents
+        relevant_chunks = await deadline.run("search", asyncio.to_thread(ocr_engine.search_documents, turn.refined_query, selected_ids, request.folder_name, turn.query_vector), [])
+
+        # Fallback
+        if not relevant_chunks and turn.files:
+            relevant_chunks = await deadline.run("search", asyncio.to_thread(ocr_engine.search_documents, turn.refined_query, [f['id'] for f in turn.files[:3]], request.folder_name, turn.query_vector), [])
+
+        for chunk in relevant_chunks:
+            chunk['source'] = titles.get(chunk['document_id'], "Unknown")
+
+    elif turn.mode_arg == "folder_fast":
+        for f in turn.files:
+            relevant_chunks.append({
+                "content": f['summary'],
+                "source": f['title'],
+                "document_id": f['id'], # INJECT DOC ID
+                "page": 1,
+                "type": "summary"
+            })
+
+    return relevant_chunks
+
+def _cacheable(request: ChatRequest, turn: ChatTurn) -> bool:
+    """Only turns whose key says what was asked are cached: a known set of documents and a query embedding
+    (a search or embedding that timed out leaves them unset) and a question that stands alone or was rewritten into one.
+    A follow-up keyed on its raw text would match other conversations' follow-ups."""
+    if answer_cache is None or turn.scope is None or not turn.fingerprint or turn.query_vector is None: return False
+    return turn.refined_query != request.message or not needs_rewrite(request.history, request.message)
+
+def _cached_answer(request: ChatRequest, turn: ChatTurn) -> Optional[dict]:
+    if not _cacheable(request, turn): return None
+    cached = answer_cache.get(turn.scope, turn.fingerprint, turn.query_vector)
+    if cached and turn.select_task: turn.select_task.cancel() # File selection is not needed any more
+    return cached
+
+def _cache_answer(request: ChatRequest, turn: ChatTurn, result: dict):
+    if not _cacheable(request, turn) or not result.get("answer") or result["answer"] == "Error generating response.": return
+    doc_ids = [request.document_id] if request.document_id else [f['id'] for f in turn.files]
+    answer_cache.put(turn.scope, turn.fingerprint, turn.query_vector, result, doc_ids)
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/chat")
+async def chat(request: ChatRequest):
+    deadline = Deadline()
+    turn = await _plan(request, deadline)
+    cached = _cached_answer(request, turn)
+    if cached: return cached
+    relevant_chunks = await _retrieve(request, turn, deadline)
 
     # 4. GENERATE ANSWER
-    result = ai_service.get_answer(
+    result = await deadline.run("answer", ai_service.get_answer(
         relevant_chunks, 
         request.message,
-        mode=mode_arg,
+        mode=turn.mode_arg,
         history=request.history
-    )
+    ), {"answer": "Error generating response.", "citations": []})
     
+    _cache_answer(request, turn, result)
     return result
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Same answer as /chat as Server-Sent Events: "token" events while the answer is generated,
+    then "citations" and "done" (with the full answer), or "error"."""
+    async def events():
+        answer = ""
+        try:
+            deadline = Deadline()
+            turn = await _plan(request, deadline)
+            cached = _cached_answer(request, turn)
+            if cached:
+                yield _sse("token", {"text": cached["answer"]})
+                yield _sse("citations", {"citations": cached["citations"]})
+                yield _sse("done", {"answer": cached["answer"], "cached": True})
+                return
+            relevant_chunks = await _retrieve(request, turn, deadline)
+            citations = []
+            async for kind, payload in ai_service.stream_answer(relevant_chunks, request.message, mode=turn.mode_arg, history=request.history):
+                if deadline.remaining() <= 0: raise TimeoutError("chat deadline exceeded while streaming")
+                if kind == "token":
+                    answer += payload
+                    yield _sse("token", {"text": payload})
+                else:
+                    citations = payload
+                    yield _sse("citations", {"citations": payload})
+            yield _sse("done", {"answer": answer})
+            _cache_answer(request, turn, {"answer": answer, "citations": citations})
+        except Exception as e:
+            print(f"Chat stream error: {e}")
+            yield _sse("error", {"message": "Error generating response."})
+
+    # X-Accel-Buffering stops reverse proxies from holding the stream back
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+class _PinnedFileResponse(FileResponse):
+    """FileResponse that unpins its cached file however the response ends (sent, 416, disconnect)."""
+
+    def __init__(self, path: str, doc_id: str, **kwargs):
+        super().__init__(path, **kwargs)
+        self.doc_id = doc_id
+
+    async def __call__(self, scope, receive, send):
+        try: await super().__call__(scope, receive, send)
+        finally: pdf_cache.unpin(self.doc_id)
+
 @app.get("/documents/{doc_id}/download")
-def download_pdf(doc_id: str):
-    pdf_bytes = pdf_engine.get_pdf_bytes(doc_id)
-    if not pdf_bytes: raise HTTPException(status_code=404, detail="PDF not found")
-    return Response(content=pdf_bytes, media_type="application/pdf")
+def download_pdf(doc_id: str, request: Request):
+    # Pinned so cache eviction cannot delete the file before FileResponse has streamed it
+    try: path = pdf_cache.get(doc_id, pin=True)
+    except Exception as e: raise HTTPException(status_code=503, detail=f"PDF temporarily unavailable: {e}", headers={"Retry-After": "5"})
+    if not path: raise HTTPException(status_code=404, detail="PDF not found")
+    # Sources are immutable once uploaded, so id + size identifies the bytes
+    headers = {"ETag": f'"{doc_id}-{os.path.getsize(path)}"', "Cache-Control": "private, max-age=86400"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        pdf_cache.unpin(doc_id)
+        return Response(status_code=304, headers=headers)
+    return _PinnedFileResponse(path, doc_id, media_type="application/pdf", headers=headers) # Handles Range / If-Range, 206 and 416
 
 @app.post("/transcribe")
 async def transcribe_audio(file: UploadFile = File(...)):
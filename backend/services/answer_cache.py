@@ -0,0 +1,111 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+ANSWER_CACHE = os.environ.get("ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", str(24 * 3600)))
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.95")) # cosine between refined queries
+
+def fingerprint(files: Iterable[dict]) -> str:
+    """Identity of a document set: ids plus summaries, so new, moved or re-summarised files change it."""
+    parts = sorted(f"{f['id']}:{hashlib.sha1((f.get('summary') or '').encode('utf-8')).hexdigest()}" for f in files)
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+class _Entry:
+    __slots__ = ("scope", "fingerprint", "doc_ids", "vector", "result", "created_at")
+
+    def __init__(self, scope, fingerprint, doc_ids, vector, result, created_at):
+        self.scope, self.fingerprint, self.doc_ids = scope, fingerprint, doc_ids
+        self.vector, self.result, self.created_at = vector, result, created_at
+
+class AnswerCache:
+    """Semantic cache of chat answers.
+
+    Entries are keyed by scope ("doc:<id>" or "folder:<name>:<mode>"), the fingerprint of
+    the document set the answer was built from, and the refined query embedding. A lookup
+    hits when a cached query in the same scope and fingerprint is at least `threshold`
+    cosine-similar. Ingest and delete paths invalidate by document and folder; eviction is LRU.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL, threshold: float = ANSWER_CACHE_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._by_scope: Dict[str, List[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def get(self, scope: str, fingerprint: str, query_vector: List[float]) -> Optional[dict]:
+        query = np.asarray(query_vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        now = time.time()
+        with self._lock:
+            best_id, best_score = None, self.threshold
+            for entry_id in list(self._by_scope.get(scope, [])):
+                entry = self._entries[entry_id]
+                if now - entry.created_at > self.ttl:
+                    self._drop(entry_id)
+                    continue
+                if entry.fingerprint != fingerprint: continue
+                score = float(entry.vector @ query)
+                if score >= best_score: best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return dict(self._entries[best_id].result)
+
+    def put(self, scope: str, fingerprint: str, query_vector: List[float], result: dict, doc_ids: Iterable[str]):
+        vector = np.asarray(query_vector, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(scope, fingerprint, frozenset(doc_ids), vector, dict(result), time.time())
+            self._by_scope.setdefault(scope, []).append(entry_id)
+            while len(self._entries) > self.max_entries: self._drop(next(iter(self._entries)))
+
+    def _drop(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        ids = self._by_scope[entry.scope]
+        ids.remove(entry_id)
+        if not ids: del self._by_scope[entry.scope]
+
+    def invalidate(self, doc_id: Optional[str] = None, folder: Optional[str] = None):
+        """Drops answers built from doc_id, and every answer scoped to folder."""
+        prefix = f"folder:{folder}:" if folder is not None else None
+        with self._lock:
+            stale = [i for i, e in self._entries.items()
+                     if (doc_id is not None and doc_id in e.doc_ids) or (prefix is not None and e.scope.startswith(prefix))]
+            for entry_id in stale: self._drop(entry_id)
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_scope.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / total, 4) if total else 0.0, "invalidations": self.invalidations}
+
+_shared: Optional[AnswerCache] = None
+_shared_lock = threading.Lock()
+
+def shared_answer_cache() -> Optional[AnswerCache]:
+    """The process-wide answer cache, or None when ANSWER_CACHE=0."""
+    global _shared
+    with _shared_lock:
+        if ANSWER_CACHE and _shared is None: _shared = AnswerCache()
+        return _shared
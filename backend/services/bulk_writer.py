@@ -0,0 +1,108 @@
+import os
+import json
+import time
+from typing import List, Optional
+
+from services.metrics import timed
+
+# Upsert key for document_pages rows (see sql/001_document_pages_chunk_index.sql)
+PAGE_UPSERT_KEY = "document_id,page_number,chunk_index"
+IDEMPOTENT_INGEST = os.environ.get("IDEMPOTENT_INGEST", "0") == "1"
+
+# SQLSTATE classes caused by the rows themselves: 22 (data exception) and 23 (integrity constraint)
+ROW_ERROR_CLASSES = ("22", "23")
+NOT_ROW_ERRORS = (401, 403, 408, 429) # 4xx statuses that say nothing about the rows
+
+def is_row_error(error: Exception) -> bool:
+    """True when a failed write was rejected because of its rows, so a smaller batch may succeed.
+    Connection errors, timeouts and 5xx responses are not: splitting would only multiply requests."""
+    code = str(getattr(error, "code", "") or "")
+    if len(code) == 5 and code[:2] in ROW_ERROR_CLASSES: return True
+    return len(code) == 3 and code.isdigit() and 400 <= int(code) < 500 and int(code) not in NOT_ROW_ERRORS
+
+class BulkWriteError(Exception):
+    def __init__(self, table: str, failed_rows: List[dict], last_error: Exception):
+        super().__init__(f"{len(failed_rows)} row(s) could not be written to '{table}': {last_error}")
+        self.failed_rows = failed_rows
+        self.last_error = last_error
+
+class BulkWriter:
+    """Buffers rows for one table and writes them in size-limited batches.
+
+    A batch rejected for its rows (constraint or data errors) is split in half, so one bad
+    row only costs its own sub-batch; those rows are raised together from flush(). Any other
+    error is retried max_attempts times and then raised at once for the whole batch, leaving
+    the retry to the ingestion queue. A batch never costs more than max_requests requests.
+    Pass on_conflict to upsert instead of insert, which makes re-runs idempotent.
+    """
+
+    def __init__(self, supabase, table: str, batch_size: int = 200, max_bytes: int = 4_000_000,
+                 on_conflict: Optional[str] = None, max_attempts: int = 3, max_requests: int = 32):
+        self.supabase = supabase
+        self.table = table
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.on_conflict = on_conflict
+        self.max_attempts = max_attempts
+        self.max_requests = max_requests
+        self.rows_written = 0
+        self._buffer: List[dict] = []
+        self._buffer_bytes = 0
+        self._failed: List[dict] = []
+        self._last_error: Optional[Exception] = None
+        self._requests_left = 0
+
+    def add(self, row: dict):
+        size = len(json.dumps(row, default=str))
+        if self._buffer and (len(self._buffer) >= self.batch_size or self._buffer_bytes + size > self.max_bytes):
+            self._write_buffer()
+        self._buffer.append(row)
+        self._buffer_bytes += size
+
+    def extend(self, rows: List[dict]):
+        for row in rows: self.add(row)
+
+    def flush(self):
+        if self._buffer: self._write_buffer()
+        if self._failed:
+            failed, self._failed = self._failed, []
+            raise BulkWriteError(self.table, failed, self._last_error)
+
+    def _write_buffer(self):
+        rows, nbytes, self._buffer, self._buffer_bytes = self._buffer, self._buffer_bytes, [], 0
+        with timed(f"supabase.write.{self.table}") as sample:
+            sample["bytes"] = nbytes
+            self._requests_left = self.max_requests
+            self._write(rows)
+
+    def _execute(self, rows: List[dict]):
+        table = self.supabase.table(self.table)
+        if self.on_conflict: table.upsert(rows, on_conflict=self.on_conflict).execute()
+        else: table.insert(rows).execute()
+
+    def _write(self, rows: List[dict]):
+        for attempt in range(self.max_attempts):
+            if self._requests_left <= 0: break
+            self._requests_left -= 1
+            try:
+                self._execute(rows)
+                self.rows_written += len(rows)
+                return
+            except Exception as e:
+                self._last_error = e
+                if is_row_error(e): break
+                if attempt < self.max_attempts - 1: time.sleep(0.5 * 2 ** attempt)
+        else: raise BulkWriteError(self.table, rows, self._last_error) # Not caused by the rows; fail the batch now
+        if len(rows) == 1 or self._requests_left <= 0:
+            print(f"Bulk write to {self.table} dropped {len(rows)} row(s): {self._last_error}")
+            self._failed.extend(rows)
+            return
+        mid = len(rows) // 2
+        self._write(rows[:mid])
+        self._write(rows[mid:])
+
+    def __enter__(self): return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None: self.flush()
+        return False
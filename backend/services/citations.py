@@ -0,0 +1,93 @@
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+SHINGLE_WORDS = 3 # Quotes are matched on overlapping 3-word shingles
+MIN_COVERAGE = 0.5 # Share of a quote's shingles that must be found in the context at all
+
+_WORD = re.compile(r"\S+")
+_QUOTE_MARKS = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+
+def _words(text: str) -> List[Tuple[str, int, int]]:
+    """(normalized word, start, end) for each whitespace-separated word, offsets into text."""
+    return [(m.group().translate(_QUOTE_MARKS).lower().strip('"\''), m.start(), m.end()) for m in _WORD.finditer(text)]
+
+class CitationResolver:
+    """Maps model quotes back to the context chunks they came from.
+
+    Built once per answer: every chunk is lowercased, split on whitespace and indexed by
+    3-word shingle, so resolving a quote costs a dictionary lookup per shingle instead of
+    a scan over every chunk. Quotes that run past a chunk boundary resolve to the chunk
+    holding most of them. Offsets are character positions in the chunk's original content.
+    """
+
+    def __init__(self, chunks: List[dict], n: int = SHINGLE_WORDS):
+        self.chunks = chunks
+        self.n = n
+        self.words = [_words(c.get("content", "")) for c in chunks]
+        self.shingles: Dict[tuple, List[Tuple[int, int]]] = {} # shingle -> [(chunk index, word index)]
+        for ci, words in enumerate(self.words):
+            tokens = [w[0] for w in words]
+            for wi in range(len(tokens) - n + 1):
+                self.shingles.setdefault(tuple(tokens[wi:wi + n]), []).append((ci, wi))
+
+    def locate(self, quote: str) -> Optional[Tuple[int, int, int]]:
+        """(chunk index, start, end) of the best match for quote, or None."""
+        tokens = [w[0] for w in _words(quote)]
+        if not tokens: return None
+        n = min(self.n, len(tokens))
+        grams = [tuple(tokens[i:i + n]) for i in range(len(tokens) - n + 1)]
+
+        # Word positions of matched shingles, per chunk; only exact-length shingles are indexed
+        hits: Dict[int, List[int]] = {}
+        votes: Counter = Counter()
+        found = 0
+        for gram in grams:
+            seen = set()
+            for ci, wi in (self.shingles.get(gram, []) if n == self.n else self._short(gram)):
+                hits.setdefault(ci, []).append(wi)
+                if ci in seen: continue
+                votes[ci] += 1
+                seen.add(ci)
+            if seen: found += 1
+        if found / len(grams) < MIN_COVERAGE: return None
+
+        # A quote crossing a chunk boundary belongs to the chunk holding most of it
+        ci = max(votes.items(), key=lambda v: (v[1], -v[0]))[0]
+        positions = sorted(hits[ci])
+        first, last = self._densest_span(positions, len(tokens))
+        words = self.words[ci]
+        return ci, words[first][1], words[min(last + n - 1, len(words) - 1)][2]
+
+    def _short(self, gram: tuple) -> List[Tuple[int, int]]:
+        # Quotes shorter than a shingle: scan word lists (rare, and only a few words long)
+        size = len(gram)
+        return [(ci, wi) for ci, words in enumerate(self.words) for wi in range(len(words) - size + 1)
+                if tuple(w[0] for w in words[wi:wi + size]) == gram]
+
+    @staticmethod
+    def _densest_span(positions: List[int], quote_len: int) -> Tuple[int, int]:
+        """First / last matched word positions of the window (at most quote_len words wide) holding most hits."""
+        best, lo = (positions[0], positions[0], 1), 0
+        for hi in range(len(positions)):
+            while positions[hi] - positions[lo] >= quote_len: lo += 1
+            if hi - lo + 1 > best[2]: best = (positions[lo], positions[hi], hi - lo + 1)
+        return best[0], best[1]
+
+    def resolve(self, quotes: List[str]) -> List[dict]:
+        citations = []
+        for quote in quotes:
+            match = self.locate(quote)
+            if match is None: continue
+            ci, start, end = match
+            chunk = self.chunks[ci]
+            citations.append({
+                "content": quote,
+                "page": chunk.get('page', 1),
+                "source": chunk.get('source', 'Document'),
+                "id": chunk.get('id', 0),
+                "document_id": chunk.get('document_id', None), # PASS THROUGH
+                "start": start,
+                "end": end
+            })
+        return citations
@@ -0,0 +1,89 @@
+import os
+import threading
+import importlib.util
+from typing import Any, Callable, Dict
+
+import httpx
+
+# --- CONNECTION POOLS ---
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP2 = os.environ.get("HTTP2", "1") == "1" and importlib.util.find_spec("h2") is not None
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+
+# --- PER-SERVICE TIMEOUTS (seconds) ---
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", "60"))
+MISTRAL_TIMEOUT = float(os.environ.get("MISTRAL_TIMEOUT", "180")) # OCR of a page window can be slow
+SUPABASE_TIMEOUT = float(os.environ.get("SUPABASE_TIMEOUT", "30"))
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE, keepalive_expiry=HTTP_KEEPALIVE_EXPIRY)
+
+def _timeout(total: float) -> httpx.Timeout:
+    return httpx.Timeout(total, connect=HTTP_CONNECT_TIMEOUT)
+
+def _require(name: str) -> str:
+    value = os.environ.get(name)
+    if not value: raise ValueError(f"{name} is missing!")
+    return value
+
+class ClientRegistry:
+    """Process-wide, lazily created API clients.
+
+    Each client is built on first use with a pooled httpx transport (keep-alive, HTTP/2
+    when the h2 package is installed) and its service's timeout, then shared by every
+    engine. Nothing is created at import, so a missing credential only fails the calls
+    that need it.
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name: str, factory: Callable[[], Any]) -> Any:
+        client = self._clients.get(name)
+        if client is not None: return client
+        with self._lock:
+            if name not in self._clients: self._clients[name] = factory()
+            return self._clients[name]
+
+    def supabase(self):
+        def build():
+            from supabase import create_client, ClientOptions
+            url, key = _require("SUPABASE_URL"), _require("SUPABASE_KEY")
+            # One pooled client for PostgREST, storage and auth; they send absolute URLs and their own auth headers
+            http_client = httpx.Client(limits=_limits(), http2=HTTP2, timeout=_timeout(SUPABASE_TIMEOUT))
+            options = ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT, storage_client_timeout=int(SUPABASE_TIMEOUT), httpx_client=http_client)
+            return create_client(url, key, options=options)
+        return self._get("supabase", build)
+
+    def openai(self):
+        def build():
+            from openai import OpenAI
+            http_client = httpx.Client(limits=_limits(), http2=HTTP2, timeout=_timeout(OPENAI_TIMEOUT))
+            return OpenAI(api_key=_require("OPENAI_API_KEY"), http_client=http_client, timeout=_timeout(OPENAI_TIMEOUT))
+        return self._get("openai", build)
+
+    def async_openai(self):
+        def build():
+            from openai import AsyncOpenAI
+            http_client = httpx.AsyncClient(limits=_limits(), http2=HTTP2, timeout=_timeout(OPENAI_TIMEOUT))
+            return AsyncOpenAI(api_key=_require("OPENAI_API_KEY"), http_client=http_client, timeout=_timeout(OPENAI_TIMEOUT))
+        return self._get("async_openai", build)
+
+    def mistral(self):
+        def build():
+            from mistralai import Mistral
+            return Mistral(
+                api_key=_require("MISTRAL_API_KEY"),
+                client=httpx.Client(limits=_limits(), http2=HTTP2, timeout=_timeout(MISTRAL_TIMEOUT)),
+                async_client=httpx.AsyncClient(limits=_limits(), http2=HTTP2, timeout=_timeout(MISTRAL_TIMEOUT)),
+                timeout_ms=int(MISTRAL_TIMEOUT * 1000)
+            )
+        return self._get("mistral", build)
+
+    def created(self) -> list:
+        return sorted(self._clients)
+
+clients = ClientRegistry()
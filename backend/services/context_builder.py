@@ -0,0 +1,78 @@
+import os
+from typing import Callable, Dict, List, Tuple
+
+from services.embeddings import count_tokens
+
+ANSWER_CONTEXT_TOKENS = int(os.environ.get("ANSWER_CONTEXT_TOKENS", "6000")) # source material
+ANSWER_HISTORY_TOKENS = int(os.environ.get("ANSWER_HISTORY_TOKENS", "1200"))
+ANSWER_HISTORY_TURNS = 6
+MIN_PARTIAL_TOKENS = 150 # A chunk is cut to fit only when at least this much room is left
+DUPLICATE_OVERLAP = 0.8 # Share of the smaller chunk's shingles found in a kept chunk
+_SHINGLE = 5
+
+def _shingles(text: str) -> set:
+    words = text.lower().split()
+    return {" ".join(words[i:i + _SHINGLE]) for i in range(max(len(words) - _SHINGLE + 1, 1))}
+
+def _clip_tokens(text: str, tokens: int) -> str:
+    # Cut on a word boundary; count_tokens may be the ~3 chars/token estimate
+    words, out, used = text.split(" "), [], 0
+    for word in words:
+        cost = count_tokens(word + " ")
+        if used + cost > tokens: break
+        out.append(word)
+        used += cost
+    return " ".join(out) + " ..."
+
+class ContextBuilder:
+    """Packs reranked chunks and chat history into fixed token budgets.
+
+    Chunks arrive best first. Near-duplicates (overlapping chunks, the same page from two
+    retrieval paths) are dropped, then chunks are taken in order while they fit; the first
+    one that does not fit is cut to the room left. History keeps the newest turns.
+    """
+
+    def __init__(self, budget: int = ANSWER_CONTEXT_TOKENS, history_budget: int = ANSWER_HISTORY_TOKENS, max_turns: int = ANSWER_HISTORY_TURNS):
+        self.budget = budget
+        self.history_budget = history_budget
+        self.max_turns = max_turns
+
+    def dedupe(self, chunks: List[dict]) -> List[dict]:
+        kept, kept_shingles = [], []
+        for chunk in chunks:
+            shingles = _shingles(chunk.get("content", ""))
+            if any(len(shingles & other) >= DUPLICATE_OVERLAP * min(len(shingles), len(other)) for other in kept_shingles): continue
+            kept.append(chunk)
+            kept_shingles.append(shingles)
+        return kept
+
+    def pack(self, chunks: List[dict], render: Callable[[int, dict], str]) -> Tuple[List[dict], str, Dict[str, int]]:
+        """Returns (chunks used, context text, stats). render(i, chunk) formats one context entry."""
+        unique = self.dedupe(chunks)
+        used, parts, total = [], [], 0
+        for chunk in unique:
+            entry = render(len(used), chunk)
+            cost = count_tokens(entry)
+            if total + cost > self.budget:
+                room = self.budget - total
+                if room < MIN_PARTIAL_TOKENS: continue
+                overhead = cost - count_tokens(chunk["content"])
+                chunk = {**chunk, "content": _clip_tokens(chunk["content"], max(room - overhead, 0))}
+                entry = render(len(used), chunk)
+                cost = count_tokens(entry)
+            used.append(chunk)
+            parts.append(entry)
+            total += cost
+        stats = {"context_tokens": total, "chunks_in": len(chunks), "chunks_used": len(used), "duplicates": len(chunks) - len(unique)}
+        return used, "".join(parts), stats
+
+    def trim_history(self, history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Newest turns first until the history budget is spent; returned oldest first."""
+        kept, total = [], 0
+        for msg in reversed(history[-self.max_turns:]):
+            content = msg.get("content", "")
+            cost = count_tokens(content)
+            if total + cost > self.history_budget: break
+            kept.append(msg)
+            total += cost
+        return kept[::-1]
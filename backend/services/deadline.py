@@ -0,0 +1,45 @@
+import os
+import time
+import asyncio
+import inspect
+from typing import Any, Awaitable
+
+from services.metrics import timed
+
+# Per-request budget for a chat turn, and the most any single stage may take of it (seconds)
+CHAT_DEADLINE = float(os.environ.get("CHAT_DEADLINE", "60"))
+STAGE_TIMEOUTS = {
+    "rewrite": float(os.environ.get("CHAT_REWRITE_TIMEOUT", "3")),
+    "embed": float(os.environ.get("CHAT_EMBED_TIMEOUT", "5")),
+    "select": float(os.environ.get("CHAT_SELECT_TIMEOUT", "5")),
+    "search": float(os.environ.get("CHAT_SEARCH_TIMEOUT", "10")),
+    "answer": float(os.environ.get("CHAT_ANSWER_TIMEOUT", "45")),
+}
+
+class Deadline:
+    """Time budget shared by the stages of one request.
+
+    run() gives a stage the smaller of its own timeout and what is left of the budget,
+    and returns the fallback instead of raising when the stage runs out of time.
+    """
+
+    def __init__(self, total: float = CHAT_DEADLINE):
+        self.expires_at = time.monotonic() + total
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def timeout(self, stage: str) -> float:
+        return min(STAGE_TIMEOUTS.get(stage, CHAT_DEADLINE), self.remaining())
+
+    async def run(self, stage: str, awaitable: Awaitable, fallback: Any = None) -> Any:
+        timeout = self.timeout(stage)
+        if timeout <= 0:
+            if inspect.iscoroutine(awaitable): awaitable.close()
+            print(f"Chat stage '{stage}' skipped: request budget spent")
+            return fallback
+        try:
+            with timed(f"chat.{stage}"): return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            print(f"Chat stage '{stage}' timed out after {timeout:.1f}s, using fallback")
+            return fallback
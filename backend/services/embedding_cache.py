@@ -0,0 +1,106 @@
+import os
+import time
+import array
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "5000"))
+EMBEDDING_CACHE_TTL = float(os.environ.get("EMBEDDING_CACHE_TTL", str(7 * 24 * 3600)))
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH") # e.g. /var/cache/insightkai/embeddings.sqlite3
+
+def normalize(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+class EmbeddingCache:
+    """Query embedding cache keyed by (model, normalized text).
+
+    In-memory LRU with a TTL, optionally backed by a SQLite file so entries survive
+    restarts. Vectors are stored on disk as float32, which is plenty for cosine search.
+    """
+
+    def __init__(self, max_entries: int = EMBEDDING_CACHE_SIZE, ttl: float = EMBEDDING_CACHE_TTL, path: Optional[str] = EMBEDDING_CACHE_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict() # key -> (created_at, vector)
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL)")
+                self._db.commit()
+            except Exception as e:
+                print(f"Embedding cache disk backend disabled: {e}")
+                self._db = None
+
+    def _key(self, text: str, model: str) -> str:
+        return hashlib.sha1(f"{model}\x00{normalize(text)}".encode("utf-8")).hexdigest()
+
+    def get(self, text: str, model: str) -> Optional[List[float]]:
+        key = self._key(text, model)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry: del self._entries[key]
+            if self._db is not None:
+                row = self._db.execute("SELECT vector, created_at FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row and now - row[1] <= self.ttl:
+                    vector = array.array("f", row[0]).tolist()
+                    self._remember(key, row[1], vector)
+                    self.hits += 1
+                    return vector
+            self.misses += 1
+            return None
+
+    def put(self, text: str, model: str, vector: List[float]):
+        key = self._key(text, model)
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, vector)
+            if self._db is not None:
+                try:
+                    self._db.execute("INSERT OR REPLACE INTO embeddings (key, vector, created_at) VALUES (?, ?, ?)", (key, array.array("f", vector).tobytes(), now))
+                    self._db.commit()
+                except Exception as e: print(f"Embedding cache write failed: {e}")
+
+    def _remember(self, key: str, created_at: float, vector: List[float]):
+        self._entries[key] = (created_at, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries: self._entries.popitem(last=False)
+
+    def get_or_create(self, text: str, model: str, create: Callable[[str], List[float]]) -> List[float]:
+        vector = self.get(text, model)
+        if vector is None:
+            vector = create(text)
+            self.put(text, model, vector)
+        return vector
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / total, 4) if total else 0.0, "persistent": self._db is not None}
+
+_shared: Optional[EmbeddingCache] = None
+_shared_lock = threading.Lock()
+
+def shared_embedding_cache() -> EmbeddingCache:
+    """The process-wide cache used by every engine's get_embedding."""
+    global _shared
+    with _shared_lock:
+        if _shared is None: _shared = EmbeddingCache()
+        return _shared
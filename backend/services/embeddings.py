@@ -0,0 +1,79 @@
+from functools import lru_cache
+from typing import List, Sequence
+from tenacity import retry, stop_after_attempt, wait_random_exponential
+
+from services.metrics import timed, usage_tokens
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# OpenAI limits for a single embeddings.create request
+MAX_BATCH_INPUTS = 2048
+MAX_BATCH_TOKENS = 300000
+MAX_INPUT_TOKENS = 8191
+
+@lru_cache(maxsize=None)
+def _encoder():
+    """cl100k_base, loaded on first use: tiktoken may download the encoding, which must not happen at import."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"tiktoken unavailable, estimating ~3 characters per token: {e}")
+        return None
+
+def count_tokens(text: str) -> int:
+    encoder = _encoder()
+    if encoder: return len(encoder.encode(text, disallowed_special=()))
+    # Conservative fallback: ~3 characters per token for mixed prose / numbers
+    return len(text) // 3 + 1
+
+def _clip(text: str) -> str:
+    text = text.replace("\n", " ")
+    if not text.strip(): return " "
+    encoder = _encoder()
+    if encoder:
+        tokens = encoder.encode(text, disallowed_special=())
+        return encoder.decode(tokens[:MAX_INPUT_TOKENS]) if len(tokens) > MAX_INPUT_TOKENS else text
+    return text[:MAX_INPUT_TOKENS * 3]
+
+class EmbeddingBatcher:
+    """Packs many texts into as few multi-input embeddings.create calls as the API limits allow.
+
+    Output order always matches input order, so callers can zip vectors back onto their chunks.
+    Bulk embed() calls bypass the cache; ingestion text is rarely embedded twice.
+    """
+
+    def __init__(self, client, model: str = EMBEDDING_MODEL, max_inputs: int = MAX_BATCH_INPUTS, max_tokens: int = MAX_BATCH_TOKENS, cache=None):
+        self.client = client
+        self.cache = cache # Optional EmbeddingCache, consulted by embed_one (query path) only
+        self.model = model
+        self.max_inputs = max_inputs
+        self.max_tokens = max_tokens
+
+    def _batches(self, texts: List[str]):
+        batch, batch_tokens = [], 0
+        for text in texts:
+            tokens = count_tokens(text)
+            if batch and (len(batch) >= self.max_inputs or batch_tokens + tokens > self.max_tokens):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch: yield batch
+
+    @retry(wait=wait_random_exponential(min=1, max=30), stop=stop_after_attempt(5))
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        with timed("embedding") as sample:
+            res = self.client.embeddings.create(input=batch, model=self.model)
+            sample["tokens"] = usage_tokens(res)
+        return [d.embedding for d in sorted(res.data, key=lambda d: d.index)]
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        vectors = []
+        for batch in self._batches([_clip(t) for t in texts]):
+            vectors.extend(self._embed_batch(batch))
+        return vectors
+
+    def embed_one(self, text: str) -> List[float]:
+        if self.cache is None: return self.embed([text])[0]
+        return self.cache.get_or_create(text, self.model, lambda t: self.embed([t])[0])
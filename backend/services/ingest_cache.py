@@ -0,0 +1,74 @@
+import json
+import hashlib
+from typing import List, Optional, Any, Tuple
+
+def content_hash(file_bytes: bytes) -> str:
+    return hashlib.sha256(file_bytes).hexdigest()
+
+def _version_tag(*versions: str) -> str:
+    return hashlib.sha1("|".join(versions).encode("utf-8")).hexdigest()[:12]
+
+class IngestCache:
+    """Content-addressed cache of ingestion artifacts, kept in storage under _cache/<sha256>/.
+
+    Each artifact is keyed by the file hash plus the versions of everything that
+    produced it (OCR model, chunker, embedding model, summary model), so changing a
+    model invalidates only the artifacts that depend on it.
+    """
+
+    def __init__(self, supabase, ocr_model: str, chunker_version: str, embedding_model: str, summary_model: str, bucket: str = "document-pages"):
+        self.supabase = supabase
+        self.bucket = bucket
+        self.ocr_tag = _version_tag(ocr_model)
+        self.chunks_tag = _version_tag(ocr_model, chunker_version, embedding_model)
+        self.summary_tag = _version_tag(ocr_model, summary_model)
+        self.summary_embedding_tag = _version_tag(embedding_model)
+
+    def _path(self, key: str, name: str, tag: str) -> str:
+        return f"_cache/{key}/{name}-{tag}.json"
+
+    def _load(self, path: str) -> Optional[Any]:
+        try: return json.loads(self.supabase.storage.from_(self.bucket).download(path))
+        except Exception: return None
+
+    def _save(self, path: str, value: Any):
+        try:
+            self.supabase.storage.from_(self.bucket).upload(file=json.dumps(value).encode("utf-8"), path=path, file_options={"content-type": "application/json", "upsert": "true"})
+        except Exception as e: print(f"Ingest cache write failed ({path}): {e}")
+
+    # --- SOURCE FILE ---
+    def find_source(self, key: str) -> Optional[str]:
+        """Storage path of an already-stored copy of this file, if any."""
+        data = self._load(f"_cache/{key}/source.json")
+        return data.get("path") if data else None
+
+    def save_source(self, key: str, path: str): self._save(f"_cache/{key}/source.json", {"path": path})
+
+    # --- OCR MARKDOWN (one string per page) ---
+    def load_ocr(self, key: str) -> Optional[List[str]]: return self._load(self._path(key, "ocr", self.ocr_tag))
+
+    def save_ocr(self, key: str, pages: List[str]): self._save(self._path(key, "ocr", self.ocr_tag), pages)
+
+    # --- FIGURE ANNOTATIONS (visual mode; one list of VisualContext JSON strings per page) ---
+    def load_figures(self, key: str) -> Optional[List[List[str]]]: return self._load(self._path(key, "figures", self.ocr_tag))
+
+    def save_figures(self, key: str, figures: List[List[str]]): self._save(self._path(key, "figures", self.ocr_tag), figures)
+
+    # --- CHUNKS WITH EMBEDDINGS ({page_number, chunk_index, content, embedding}) ---
+    def load_chunks(self, key: str) -> Optional[List[dict]]: return self._load(self._path(key, "chunks", self.chunks_tag))
+
+    def save_chunks(self, key: str, chunks: List[dict]): self._save(self._path(key, "chunks", self.chunks_tag), chunks)
+
+    # --- SUMMARY (with the embedding of its fields, when made by the current embedding model) ---
+    def load_summary(self, key: str) -> Optional[str]: return self.load_summary_with_embedding(key)[0]
+
+    def load_summary_with_embedding(self, key: str) -> Tuple[Optional[str], Optional[List[float]]]:
+        data = self._load(self._path(key, "summary", self.summary_tag))
+        if not data: return None, None
+        embedding = data.get("embedding") if data.get("embedding_tag") == self.summary_embedding_tag else None
+        return data.get("summary"), embedding
+
+    def save_summary(self, key: str, summary: str, embedding: Optional[List[float]] = None):
+        value = {"summary": summary}
+        if embedding is not None: value.update(embedding=embedding, embedding_tag=self.summary_embedding_tag)
+        self._save(self._path(key, "summary", self.summary_tag), value)
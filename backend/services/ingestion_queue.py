@@ -0,0 +1,175 @@
+import os
+import uuid
+import socket
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from services.mistral_engine import STAGE_QUEUED, SourceMissingError
+from services.upload_spool import Source
+
+INGEST_CONCURRENCY = int(os.environ.get("INGEST_CONCURRENCY", "2"))
+INGEST_MAX_PENDING = int(os.environ.get("INGEST_MAX_PENDING", "20"))
+INGEST_MAX_ATTEMPTS = int(os.environ.get("INGEST_MAX_ATTEMPTS", "3"))
+INGEST_HEARTBEAT_SECONDS = float(os.environ.get("INGEST_HEARTBEAT_SECONDS", "30"))
+INGEST_LEASE_SECONDS = float(os.environ.get("INGEST_LEASE_SECONDS", "180")) # A job whose owner missed heartbeats this long is reclaimed
+
+# Owner recorded on the documents this process ingests (documents.ingest_owner)
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+def _timestamp(offset: float = 0.0) -> str:
+    return (datetime.now(timezone.utc) + timedelta(seconds=offset)).isoformat()
+
+class QueueFullError(Exception):
+    pass
+
+@dataclass
+class IngestJob:
+    doc_id: str
+    filename: str
+    folder: str
+    source: Optional[Source] = None  # None when resuming from stored source after a restart
+
+    def release(self):
+        # Spooled uploads hold disk space and in-flight budget until the job is done with them
+        if self.source is not None and not isinstance(self.source, bytes): self.source.release()
+        self.source = None
+
+class IngestionQueue:
+    """Bounded queue of ingestion jobs drained by a fixed pool of async workers.
+
+    The blocking engine call runs in a worker thread, so ingestion never stalls the
+    event loop. Job progress lives in the documents table (status / ingest_stage),
+    which is what lets recover() pick up unfinished jobs after a restart.
+
+    Every document this process queues carries a lease (ingest_owner / ingest_heartbeat)
+    that it keeps refreshing; recover() only takes over documents whose lease expired,
+    so sibling workers and rolling deploys never pick up each other's live jobs.
+    """
+
+    def __init__(self, engine, concurrency: int = INGEST_CONCURRENCY, max_pending: int = INGEST_MAX_PENDING, max_attempts: int = INGEST_MAX_ATTEMPTS):
+        self.engine = engine
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.workers: List[asyncio.Task] = []
+        self.active = 0
+        self.owner = WORKER_ID
+        self.lease_seconds = INGEST_LEASE_SECONDS
+        self._maintainers: List[asyncio.Task] = []
+
+    def full(self) -> bool:
+        return self.queue.full()
+
+    def submit(self, job: IngestJob):
+        try: self.queue.put_nowait(job)
+        except asyncio.QueueFull: raise QueueFullError("Ingestion queue is full, try again shortly.")
+
+    def lease(self) -> dict:
+        """documents columns that mark a job as owned by this process; set them when inserting the row."""
+        return {"ingest_owner": self.owner, "ingest_heartbeat": _timestamp()}
+
+    def stats(self) -> dict:
+        return {"pending": self.queue.qsize(), "active": self.active, "concurrency": self.concurrency, "capacity": self.queue.maxsize, "owner": self.owner}
+
+    async def start(self):
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        # Separate tasks, so nothing recovery waits on can hold up the heartbeats that keep our own leases alive
+        self._maintainers = [asyncio.create_task(self._heartbeats()), asyncio.create_task(self._recoveries())]
+
+    async def stop(self):
+        tasks = self.workers + self._maintainers
+        for t in tasks: t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.workers, self._maintainers = [], []
+
+    async def _heartbeats(self):
+        while True:
+            await asyncio.sleep(INGEST_HEARTBEAT_SECONDS)
+            try: await asyncio.to_thread(self._heartbeat)
+            except Exception as e: print(f"Ingestion heartbeat failed: {e}")
+
+    async def _recoveries(self):
+        # Every lease period, look for jobs whose owner stopped heartbeating
+        while True:
+            await self.recover()
+            await asyncio.sleep(self.lease_seconds)
+
+    def _heartbeat(self):
+        (self.engine.supabase.table("documents").update({"ingest_heartbeat": _timestamp()})
+            .eq("ingest_owner", self.owner).eq("status", "processing").execute())
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            self.active += 1
+            try: await self._run(job)
+            finally:
+                job.release()
+                self.active -= 1
+                self.queue.task_done()
+
+    async def _run(self, job: IngestJob):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await asyncio.to_thread(self.engine.process_pdf_background, job.doc_id, job.source, job.filename, job.folder)
+                return
+            except Exception as e:
+                print(f"Ingestion Error ({job.doc_id}, attempt {attempt}/{self.max_attempts}): {e}")
+                try: await asyncio.to_thread(self._record_error, job.doc_id, str(e))
+                except Exception as db_error: print(f"Could not record ingestion error: {db_error}")
+                if attempt == self.max_attempts or isinstance(e, SourceMissingError): break
+                await asyncio.sleep(2 ** attempt)
+        try: await asyncio.to_thread(self._mark_failed, job.doc_id)
+        except Exception as e: print(f"Could not mark {job.doc_id} as failed: {e}")
+
+    def _record_error(self, doc_id: str, error: str):
+        self.engine.supabase.table("documents").update({"ingest_error": error[:500]}).eq("id", doc_id).execute()
+        self.engine.status_events.publish(doc_id, error=error[:500])
+
+    def _mark_failed(self, doc_id: str):
+        self.engine.supabase.table("documents").update({"status": "failed"}).eq("id", doc_id).execute()
+        self.engine.listing_cache.invalidate()
+        self.engine.status_events.publish(doc_id, status="failed")
+
+    async def recover(self):
+        """Re-enqueues documents left in 'processing' by a process whose lease has expired."""
+        cutoff = _timestamp(-self.lease_seconds)
+        try:
+            res = await asyncio.to_thread(lambda: self.engine.supabase.table("documents")
+                .select("id, title, folder, ingest_stage, ingest_attempts, ingest_owner")
+                .eq("status", "processing")
+                .lt("ingest_heartbeat", cutoff)
+                .execute())
+        except Exception as e:
+            print(f"Ingestion recovery skipped: {e}")
+            return
+        for row in res.data or []:
+            if row.get("ingest_owner") == self.owner: continue # Our own job; a missed heartbeat does not make it abandoned
+            if self.queue.full(): break # Leave the rest to a worker with room; we look again next lease period
+            if not await asyncio.to_thread(self._claim, row, cutoff): continue
+            if (row.get("ingest_stage") or STAGE_QUEUED) == STAGE_QUEUED:
+                # The upload never reached storage, so there is nothing to resume from
+                await asyncio.to_thread(self._mark_failed, row["id"])
+                continue
+            try: self.queue.put_nowait(IngestJob(row["id"], row.get("title") or "document.pdf", row.get("folder") or "General"))
+            except asyncio.QueueFull:
+                # Uploads filled the queue while we claimed; hand the job back rather than wait with a lease we cannot honour
+                await asyncio.to_thread(self._release, row)
+                break
+
+    def _claim(self, row: dict, cutoff: str) -> bool:
+        # Compare-and-set on ingest_attempts and the expired lease, so only one worker process
+        # resumes a given job and never one whose owner heartbeated since we looked
+        attempts = row.get("ingest_attempts") or 0
+        query = (self.engine.supabase.table("documents").update({"ingest_attempts": attempts + 1, **self.lease()})
+            .eq("id", row["id"]).lt("ingest_heartbeat", cutoff))
+        query = query.eq("ingest_attempts", attempts) if row.get("ingest_attempts") is not None else query.is_("ingest_attempts", "null")
+        return bool(query.execute().data)
+
+    def _release(self, row: dict):
+        # Undo _claim: no owner, an already expired heartbeat and the attempt count as it was
+        (self.engine.supabase.table("documents")
+            .update({"ingest_owner": None, "ingest_heartbeat": _timestamp(-2 * self.lease_seconds), "ingest_attempts": row.get("ingest_attempts")})
+            .eq("id", row["id"]).eq("ingest_owner", self.owner).execute())
@@ -0,0 +1,175 @@
+import os
+import re
+import math
+import hashlib
+import threading
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+# Opt-in, like LOCAL_VECTOR_INDEX: every worker holds the text of all document_pages rows in memory
+LEXICAL_INDEX = os.environ.get("LEXICAL_INDEX", "0") == "1"
+REBUILD_PAGE_SIZE = 1000
+
+# Keeps identifiers whole: "INV-2023-001", "1,234.56", "2023/08/01", "acme.com"
+_TOKEN = re.compile(r"[a-z0-9]+(?:[.,/\-_][a-z0-9]+)*")
+_STOPWORDS = set("a an and are as at be by for from has have how in is it its of on or that the this to was were what when where which who why with".split())
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in _STOPWORDS: continue
+        tokens.append(token)
+        # Also index the parts of compound tokens so "2023" matches "INV-2023-001"
+        parts = re.split(r"[.,/\-_]", token)
+        if len(parts) > 1: tokens.extend(p for p in parts if p and p not in _STOPWORDS)
+    return tokens
+
+def chunk_key(row: dict) -> str:
+    """Identity of a chunk that is stable across the RPC, the local indexes and fresh ingests."""
+    page = row.get("page_number", row.get("page"))
+    return hashlib.sha1(f"{row.get('document_id')}|{page}|{row.get('content', '')}".encode("utf-8")).hexdigest()
+
+def reciprocal_rank_fusion(result_lists: List[List[dict]], key: Callable[[dict], str] = chunk_key, k: int = 60) -> List[dict]:
+    """Merges ranked lists by sum(1 / (k + rank)); the first list's copy of a chunk wins."""
+    scores: Dict[str, float] = {}
+    items: Dict[str, dict] = {}
+    for results in result_lists:
+        for rank, item in enumerate(results):
+            item_key = key(item)
+            scores[item_key] = scores.get(item_key, 0.0) + 1.0 / (k + rank + 1)
+            items.setdefault(item_key, item)
+    fused = sorted(items, key=lambda item_key: scores[item_key], reverse=True)
+    return [{**items[item_key], "rrf": round(scores[item_key], 6)} for item_key in fused]
+
+class _DocPostings:
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, int]] = {} # term -> chunk key -> term frequency
+        self.lengths: Dict[str, int] = {}
+        self.rows: Dict[str, dict] = {}
+
+class BM25Index:
+    """In-process BM25 index over document_pages.content.
+
+    Postings are kept per document, because almost every query is scoped to one
+    document or a handful, while document frequencies are global so IDF stays
+    meaningful. Built from document_pages on startup and kept current by ingest
+    and delete; changes made while a rebuild runs are replayed onto the rebuilt index.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ready = False
+        self.docs: Dict[str, _DocPostings] = {}
+        self.df: Counter = Counter()
+        self.total_chunks = 0
+        self.total_length = 0
+        self._journal: Optional[List[tuple]] = None # Adds / removes seen while rebuild() runs
+        self._lock = threading.RLock()
+
+    def has_document(self, doc_id: str) -> bool:
+        return self.ready and doc_id in self.docs
+
+    def add(self, doc_id: str, rows: List[dict]):
+        with self._lock:
+            if self._journal is not None: self._journal.append((doc_id, rows))
+            doc = self.docs.setdefault(doc_id, _DocPostings())
+            for row in rows:
+                content = row.get("content")
+                if not content: continue
+                key = chunk_key({**row, "document_id": doc_id})
+                if key in doc.rows: continue
+                terms = Counter(tokenize(content))
+                for term, tf in terms.items():
+                    doc.postings.setdefault(term, {})[key] = tf
+                    self.df[term] += 1
+                length = sum(terms.values())
+                doc.lengths[key] = length
+                doc.rows[key] = {k: row.get(k) for k in ("id", "page_number", "content", "bboxes")}
+                self.total_chunks += 1
+                self.total_length += length
+
+    def remove_document(self, doc_id: str):
+        with self._lock:
+            if self._journal is not None: self._journal.append((doc_id, None))
+            doc = self.docs.pop(doc_id, None)
+            if doc is None: return
+            for term, chunks in doc.postings.items():
+                self.df[term] -= len(chunks)
+                if self.df[term] <= 0: del self.df[term]
+            self.total_chunks -= len(doc.lengths)
+            self.total_length -= sum(doc.lengths.values())
+
+    def search(self, query: str, doc_ids: Optional[List[str]] = None, limit: int = 20) -> List[dict]:
+        terms = set(tokenize(query))
+        if not terms: return []
+        with self._lock:
+            if not self.total_chunks: return []
+            avg_length = self.total_length / self.total_chunks
+            idf = {t: math.log(1 + (self.total_chunks - self.df.get(t, 0) + 0.5) / (self.df.get(t, 0) + 0.5)) for t in terms}
+            scored = []
+            for doc_id in (doc_ids if doc_ids is not None else list(self.docs)):
+                doc = self.docs.get(doc_id)
+                if doc is None: continue
+                scores: Dict[str, float] = {}
+                for term in terms:
+                    for key, tf in doc.postings.get(term, {}).items():
+                        norm = self.k1 * (1 - self.b + self.b * doc.lengths[key] / avg_length)
+                        scores[key] = scores.get(key, 0.0) + idf[term] * tf * (self.k1 + 1) / (tf + norm)
+                scored.extend((score, doc_id, key) for key, score in scores.items())
+            scored.sort(key=lambda s: s[0], reverse=True)
+            results = []
+            for score, doc_id, key in scored[:limit]:
+                row = self.docs[doc_id].rows[key]
+                results.append({
+                    "content": row["content"],
+                    "page": row.get("page_number") or 1,
+                    "similarity": 0,
+                    "bm25": round(score, 4),
+                    "bboxes": row.get("bboxes") or [],
+                    "id": row.get("id") or key,
+                    "document_id": doc_id
+                })
+            return results
+
+    def rebuild(self, supabase):
+        fresh = BM25Index(self.k1, self.b)
+        with self._lock: self._journal = []
+        try:
+            start = 0
+            while True:
+                res = supabase.table("document_pages")\
+                    .select("id, document_id, page_number, content, bboxes")\
+                    .order("id")\
+                    .range(start, start + REBUILD_PAGE_SIZE - 1)\
+                    .execute()
+                by_doc: Dict[str, List[dict]] = {}
+                for row in res.data or []: by_doc.setdefault(str(row["document_id"]), []).append(row)
+                for doc_id, rows in by_doc.items(): fresh.add(doc_id, rows)
+                if len(res.data or []) < REBUILD_PAGE_SIZE: break
+                start += REBUILD_PAGE_SIZE
+            with self._lock:
+                # Ingests and deletes that ran during the scan may be missing from (or stale in) the pages read
+                for doc_id, rows in self._journal:
+                    if rows is None: fresh.remove_document(doc_id)
+                    else: fresh.add(doc_id, rows)
+                self.docs, self.df = fresh.docs, fresh.df
+                self.total_chunks, self.total_length = fresh.total_chunks, fresh.total_length
+                self.ready = True
+        finally:
+            with self._lock: self._journal = None
+        print(f"Lexical index ready: {self.total_chunks} chunks in {len(self.docs)} documents")
+
+    def start_rebuild(self, supabase):
+        def run():
+            try: self.rebuild(supabase)
+            except Exception as e: print(f"Lexical index rebuild failed, using vector search only: {e}")
+        threading.Thread(target=run, name="lexical-index-rebuild", daemon=True).start()
+
+_shared: Optional[BM25Index] = None
+
+def shared_lexical_index() -> Optional[BM25Index]:
+    """The process-wide BM25 index, or None when LEXICAL_INDEX is off."""
+    global _shared
+    if LEXICAL_INDEX and _shared is None: _shared = BM25Index()
+    return _shared
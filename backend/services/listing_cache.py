@@ -0,0 +1,58 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+LISTING_CACHE_TTL = float(os.environ.get("LISTING_CACHE_TTL", "10"))
+
+class ListingCache:
+    """Short-TTL cache of the /documents and /folders payloads, with an ETag per payload.
+
+    Ingestion, deletes and folder changes call invalidate(). A build that was running
+    while an invalidation happened is returned but not stored, so a stale listing can
+    never outlive the change that made it stale.
+    """
+
+    def __init__(self, ttl: float = LISTING_CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[tuple, Tuple[float, str, Any]] = {} # key -> (expires_at, etag, payload)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key: tuple, build: Callable[[], Any]) -> Tuple[str, Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self.hits += 1
+                return entry[1], entry[2]
+            self.misses += 1
+            generation = self._generation
+        payload = build()
+        etag = '"' + hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest() + '"'
+        with self._lock:
+            if generation == self._generation: self._entries[key] = (time.time() + self.ttl, etag, payload)
+        return etag, payload
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / total, 4) if total else 0.0}
+
+_shared: Optional[ListingCache] = None
+_shared_lock = threading.Lock()
+
+def shared_listing_cache() -> ListingCache:
+    """The process-wide listing cache; every path that changes documents or folders invalidates it."""
+    global _shared
+    with _shared_lock:
+        if _shared is None: _shared = ListingCache()
+        return _shared
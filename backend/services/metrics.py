@@ -0,0 +1,108 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+METRICS = os.environ.get("METRICS", "1") == "1"
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "0") == "1" # Also on for any request sending "X-Server-Timing: 1"
+
+# Seconds. External calls range from a few ms (cached Supabase reads) to minutes (OCR of a large window).
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Stage timings of the current request, appended by timed() and read by the Server-Timing middleware
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.total += seconds
+        self.count += 1
+
+class MetricsRegistry:
+    """Per-stage latency histograms plus token / byte / error counters, in process memory.
+
+    Stages are free-form names ("embedding", "supabase.rpc.match_page_sections_v2", "ocr", ...).
+    render() writes the Prometheus text format; with several worker processes each one
+    reports its own numbers, so scrape them per process or sum in the query.
+    """
+
+    def __init__(self):
+        self._histograms: Dict[str, _Histogram] = {}
+        self._counters: Dict[Tuple[str, str], float] = {} # (metric, stage) -> value
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float, tokens: int = 0, nbytes: int = 0, error: bool = False):
+        with self._lock:
+            self._histograms.setdefault(stage, _Histogram()).observe(seconds)
+            for metric, value in (("tokens", tokens), ("bytes", nbytes), ("errors", int(error))):
+                if value: self._counters[(metric, stage)] = self._counters.get((metric, stage), 0) + value
+
+    @contextmanager
+    def timed(self, stage: str) -> Iterator[dict]:
+        """Times the block as `stage`. The block may set sample["tokens"] / sample["bytes"]."""
+        sample, start = {}, time.perf_counter()
+        error = False
+        try: yield sample
+        except BaseException:
+            error = True
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            if METRICS: self.observe(stage, seconds, sample.get("tokens", 0), sample.get("bytes", 0), error)
+            timings = _request_timings.get()
+            if timings is not None: timings.append((stage, seconds))
+
+    def render(self) -> str:
+        with self._lock:
+            histograms = {stage: (list(h.counts), h.total, h.count) for stage, h in self._histograms.items()}
+            counters = dict(self._counters)
+        lines = ["# HELP rag_stage_seconds Duration of pipeline stages and external calls.", "# TYPE rag_stage_seconds histogram"]
+        for stage in sorted(histograms):
+            counts, total, count = histograms[stage]
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS, counts):
+                cumulative += n
+                lines.append(f'rag_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'rag_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'rag_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'rag_stage_seconds_count{{stage="{stage}"}} {count}')
+        for metric, help_text in (("tokens", "Tokens sent to or received from model APIs."), ("bytes", "Bytes uploaded or downloaded."), ("errors", "Stage calls that raised.")):
+            lines += [f"# HELP rag_stage_{metric}_total {help_text}", f"# TYPE rag_stage_{metric}_total counter"]
+            lines += [f'rag_stage_{metric}_total{{stage="{stage}"}} {value:g}' for (m, stage), value in sorted(counters.items()) if m == metric]
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+def timed(stage: str):
+    return metrics.timed(stage)
+
+def usage_tokens(response) -> int:
+    """total_tokens of an OpenAI response, 0 when it reports no usage."""
+    return getattr(getattr(response, "usage", None), "total_tokens", 0) or 0
+
+def start_request_timing() -> List[Tuple[str, float]]:
+    """Starts collecting stage timings for the current request; threads started via to_thread inherit it."""
+    timings: List[Tuple[str, float]] = []
+    _request_timings.set(timings)
+    return timings
+
+def server_timing_header(timings: List[Tuple[str, float]]) -> str:
+    """Server-Timing value with one entry per stage: total milliseconds, and how many calls it took."""
+    totals: Dict[str, List[float]] = {}
+    for stage, seconds in timings:
+        entry = totals.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+    return ", ".join(f'{stage};dur={total * 1000:.1f};desc="{int(n)}x"' for stage, (total, n) in totals.items())
@@ -2,12 +2,84 @@ import os
 import io
 import uuid
 import json
-from typing import List, Any
-from mistralai import Mistral
+import base64
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from typing import List, Any, Optional, Tuple
+import pypdfium2 as pdfium
 from mistralai.extra import response_format_from_pydantic_model
-from openai import OpenAI
-from supabase import create_client, Client
+from supabase import Client
 from pydantic import BaseModel, Field
+from services.embeddings import EmbeddingBatcher, EMBEDDING_MODEL
+from services.ingest_cache import IngestCache, content_hash
+from services.pipeline import StagePipeline
+from services.embedding_cache import shared_embedding_cache
+from services.vector_index import shared_vector_index
+from services.lexical_index import shared_lexical_index, reciprocal_rank_fusion
+from services.answer_cache import shared_answer_cache
+from services.clients import clients
+from services.listing_cache import shared_listing_cache
+from services.status_events import shared_status_events
+from services.bulk_writer import BulkWriter, PAGE_UPSERT_KEY, IDEMPOTENT_INGEST
+from services.upload_spool import Source
+from services.metrics import timed, usage_tokens
+from services.summary_index import shared_summary_index, parse_summary, summary_text, summary_columns, summary_entry
+
+# --- INGESTION STAGES (documents.ingest_stage) ---
+STAGE_QUEUED = "queued"
+STAGE_STORED = "stored"
+STAGE_OCR = "ocr"
+STAGE_INDEXED = "indexed"
+STAGE_DONE = "done"
+
+OCR_MODEL = "mistral-ocr-latest"
+SUMMARY_MODEL = "gpt-4o-mini"
+FALLBACK_SUMMARY = "[TAG]: OTHER\n[DESC]: Processed document.\n[DETAILED]: No summary available."
+CHUNKER_VERSION = "markdown-v1" # Bump when _chunk_markdown changes so cached chunks are not reused
+
+# --- INGESTION PIPELINE TUNING ---
+OCR_WINDOW_PAGES = int(os.environ.get("OCR_WINDOW_PAGES", "8"))
+OCR_CONCURRENCY = int(os.environ.get("OCR_CONCURRENCY", "3"))
+EMBED_CONCURRENCY = int(os.environ.get("EMBED_CONCURRENCY", "2"))
+WRITE_CONCURRENCY = int(os.environ.get("WRITE_CONCURRENCY", "2"))
+EMBED_BATCH_CHUNKS = int(os.environ.get("EMBED_BATCH_CHUNKS", "64"))
+PIPELINE_QUEUE_SIZE = 8
+
+# Figure understanding: off by default. When on, Mistral annotates every extracted
+# figure with VisualContext and each annotation is indexed as an extra chunk.
+VISUAL_EXTRACTION = os.environ.get("VISUAL_EXTRACTION", "0") == "1"
+SUMMARY_PREVIEW_CHARS = 8000
+
+# --- MULTI-DOCUMENT SEARCH (folder deep mode) ---
+MULTI_MATCH_COUNT = 60
+MULTI_PER_DOC_LIMIT = 20
+MULTI_SEARCH_CONCURRENCY = 8
+
+# --- HYBRID RETRIEVAL (vector + BM25, fused with RRF) ---
+HYBRID_VECTOR_COUNT = 30
+HYBRID_LEXICAL_COUNT = 20
+HYBRID_RESULT_COUNT = 30
+
+# --- DOCUMENT LISTING ---
+DOCUMENTS_PAGE_SIZE = 100
+SUMMARY_PAGE_SIZE = 1000 # Rows per request when a folder is loaded into the summary index
+SUMMARY_BACKFILL_BATCH = 64 # Older documents embedded per request by backfill_summaries()
+
+def _encode_cursor(created_at: str, doc_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([created_at, doc_id]).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """(created_at, id) of a listing cursor, normalised so both are safe to put in a PostgREST filter.
+    Raises ValueError for anything that is not an ISO timestamp and a UUID."""
+    try:
+        created_at, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(created_at).isoformat(), str(uuid.UUID(doc_id))
+    except (ValueError, TypeError, AttributeError) as e: raise ValueError(f"Invalid cursor: {e}")
+
+class SourceMissingError(Exception):
+    pass
 
 # --- SCHEMA DEFINITION ---
 class VisualContext(BaseModel):
@@ -17,71 +89,178 @@ class VisualContext(BaseModel):
 
 class MistralEngine:
     def __init__(self):
-        url: str = os.environ.get("SUPABASE_URL")
-        key: str = os.environ.get("SUPABASE_KEY")
-        self.supabase: Client = create_client(url, key)
-        self.openai = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-        api_key = os.environ.get("MISTRAL_API_KEY")
-        if not api_key:
-            raise ValueError("MISTRAL_API_KEY is missing!")
-        self.client = Mistral(api_key=api_key)
+        # API clients come from the shared registry on first use (see services/clients.py)
+        self.vector_index = shared_vector_index() # None unless LOCAL_VECTOR_INDEX=1
+        self.lexical_index = shared_lexical_index() # None unless LEXICAL_INDEX=1
+        self.answer_cache = shared_answer_cache() # None when ANSWER_CACHE=0
+        self.listing_cache = shared_listing_cache()
+        self.status_events = shared_status_events() # Progress pushed to /ingestion/events subscribers
+        self.summary_index = shared_summary_index() # Embedded document summaries for folder chat
+
+    @property
+    def supabase(self) -> Client: return clients.supabase()
+
+    @property
+    def openai(self): return clients.openai()
+
+    @property
+    def client(self): return clients.mistral() # Raises ValueError when MISTRAL_API_KEY is missing
+
+    @cached_property
+    def embedder(self) -> EmbeddingBatcher: return EmbeddingBatcher(self.openai, cache=shared_embedding_cache())
+
+    @cached_property
+    def cache(self) -> IngestCache:
+        chunker = CHUNKER_VERSION + ("+visual" if VISUAL_EXTRACTION else "")
+        return IngestCache(self.supabase, OCR_MODEL, chunker, EMBEDDING_MODEL, SUMMARY_MODEL)
 
     def get_embedding(self, text: str) -> List[float]:
-        text = text.replace("\n", " ")
-        return self.openai.embeddings.create(input=[text], model="text-embedding-3-small").data[0].embedding
+        return self.embedder.embed_one(text)
 
-    def get_folder_files(self, folder_name: str) -> List[dict]:
-        try:
+    # --- FOLDER SUMMARIES ---
+    # Summaries are parsed into [TAG] / [DESC] / [DETAILED] columns and embedded once, at
+    # ingestion; folder chat ranks them in the in-process SummaryIndex instead of prompting
+    # with every file in the folder.
+    def _load_folder_summaries(self, folder_name: str) -> List[dict]:
+        rows, start = [], 0
+        while True:
             res = self.supabase.table("documents")\
-                .select("id, title, summary")\
+                .select("id, title, summary, summary_tag, summary_desc, summary_detailed, summary_embedding")\
                 .eq("folder", folder_name)\
+                .order("id")\
+                .range(start, start + SUMMARY_PAGE_SIZE - 1)\
                 .execute()
-            
-            files = []
-            for doc in res.data:
-                raw = doc.get("summary", "")
-                if not raw: continue
-                clean = raw.split("---_SEPARATOR_---")[0].replace("**Content Summary:**", "").strip()
-                files.append({
-                    "id": doc["id"],
-                    "title": doc["title"],
-                    "summary": clean
-                })
-            return files
+            rows.extend(r for r in (res.data or []) if r.get("summary"))
+            if len(res.data or []) < SUMMARY_PAGE_SIZE: break
+            start += SUMMARY_PAGE_SIZE
+        for row in rows:
+            if row.get("summary_embedding"): continue
+            # Not backfilled yet: parse the text now (cheap) and leave the embedding to backfill_summaries()
+            f = parse_summary(row["summary"])
+            row.update(summary_tag=f["tag"], summary_desc=f["desc"], summary_detailed=f["detailed"])
+        return [summary_entry(r) for r in rows]
+
+    def backfill_summaries(self) -> int:
+        """Parses, embeds (one request per batch) and stores the summary fields of documents ingested
+        before summaries were indexed. Runs once in the background at startup, never inside a chat."""
+        done, last_id = 0, None
+        while True:
+            query = self.supabase.table("documents").select("id, title, folder, summary").is_("summary_embedding", "null")
+            if last_id: query = query.gt("id", last_id)
+            batch = query.order("id").limit(SUMMARY_BACKFILL_BATCH).execute().data or []
+            if not batch: return done
+            last_id = batch[-1]["id"]
+            rows = [r for r in batch if r.get("summary")] # Still ingesting: the summary fields are written with the summary
+            fields = [parse_summary(r["summary"]) for r in rows]
+            vectors = self.embedder.embed([summary_text(f) for f in fields]) if rows else []
+            for row, f, vector in zip(rows, fields, vectors):
+                columns = summary_columns(f, vector)
+                try: self.supabase.table("documents").update(columns).eq("id", row["id"]).execute()
+                except Exception as e:
+                    print(f"Could not store summary fields for {row['id']}: {e}")
+                    continue
+                self.summary_index.add(row.get("folder") or "General", summary_entry({**row, **columns}))
+                done += 1
+            if len(batch) < SUMMARY_BACKFILL_BATCH: return done
+
+    def start_summary_backfill(self):
+        def run():
+            try:
+                done = self.backfill_summaries()
+                if done: print(f"Summary backfill: embedded {done} document summaries")
+            except Exception as e: print(f"Summary backfill failed, older documents rank last in folder chat: {e}")
+        threading.Thread(target=run, name="summary-backfill", daemon=True).start()
+
+    def find_folder_files(self, folder_name: str, query_vector: List[float], limit: int) -> Tuple[List[dict], str]:
+        """The `limit` files whose summaries best match the query, and the fingerprint of the whole folder."""
+        try: return self.summary_index.search(folder_name, query_vector, limit, self._load_folder_summaries)
         except Exception as e:
-            print(f"Error getting folder files: {e}")
-            return []
+            print(f"Error searching folder summaries: {e}")
+            return [], ""
 
     # --- SOTA UPGRADE: V2 Function + Coord Retrieval ---
-    def search_single_doc(self, query: str, doc_id: str) -> List[dict]:
-        query_vector = self.get_embedding(query)
+    def _rows_to_chunks(self, rows: List[dict]) -> List[dict]:
+        chunks = []
+        for row in rows:
+            content = row.get('content')
+            if not content: continue
+            chunks.append({
+                "content": content,
+                "page": row.get('page_number', 1),
+                "similarity": row.get('similarity', 0),
+                "bboxes": row.get('bboxes') or [], # Retrieve coordinates (default empty)
+                "id": row.get('id') or uuid.uuid4().hex,
+                "document_id": str(row['document_id']) if row.get('document_id') is not None else None
+            })
+        return chunks
+
+    def _vector_search_single(self, doc_id: str, query_vector: List[float], match_count: int) -> List[dict]:
+        if self.vector_index and self.vector_index.has_document(doc_id):
+            return self._rows_to_chunks(self.vector_index.search(query_vector, [doc_id], match_count=match_count, match_threshold=0.01))
         params = {
             "query_embedding": query_vector, 
             "match_threshold": 0.01, 
-            "match_count": 45, 
+            "match_count": match_count, 
             "filter_doc_id": doc_id
         }
         
         try:
             # Calling the updated V2 function
-            res = self.supabase.rpc("match_page_sections_v2", params).execute()
-            chunks = []
-            if res.data:
-                for row in res.data:
-                    content = row.get('content')
-                    if not content: continue
-                    chunks.append({
-                        "content": content,
-                        "page": row.get('page_number', 1),
-                        "similarity": row.get('similarity', 0),
-                        "bboxes": row.get('bboxes', []), # Retrieve coordinates (default empty)
-                        "id": row.get('id', uuid.uuid4().hex) 
-                    })
-            return chunks
+            with timed("supabase.rpc.match_page_sections_v2"): res = self.supabase.rpc("match_page_sections_v2", params).execute()
+            return self._rows_to_chunks([{"document_id": doc_id, **row} for row in res.data or []])
         except Exception as e:
             print(f"Search Error: {e}")
             return []
 
+    def _hybrid(self, query: str, doc_ids: List[str], vector_chunks: List[dict], limit: int) -> List[dict]:
+        """Fuses vector hits with BM25 hits over the same documents using reciprocal rank fusion."""
+        lexical_chunks = self.lexical_index.search(query, doc_ids, HYBRID_LEXICAL_COUNT)
+        return reciprocal_rank_fusion([vector_chunks, lexical_chunks])[:limit]
+
+    def search_single_doc(self, query: str, doc_id: str, query_vector: Optional[List[float]] = None) -> List[dict]:
+        if query_vector is None: query_vector = self.get_embedding(query)
+        # With exact-term recall from BM25 the vector stage can return fewer rows
+        hybrid = self.lexical_index is not None and self.lexical_index.has_document(doc_id)
+        chunks = self._vector_search_single(doc_id, query_vector, HYBRID_VECTOR_COUNT if hybrid else 45)
+        if not hybrid: return chunks
+        return self._hybrid(query, [doc_id], chunks, HYBRID_RESULT_COUNT)
+
+    def _vector_search_documents(self, doc_ids: List[str], folder: Optional[str], query_vector: List[float], match_count: int, per_doc_limit: int) -> List[dict]:
+        if self.vector_index and all(self.vector_index.has_document(d) for d in doc_ids):
+            rows = self.vector_index.search(query_vector, doc_ids, folder, match_count, 0.01, per_doc_limit)
+            return self._rows_to_chunks(rows)
+        params = {
+            "query_embedding": query_vector,
+            "match_threshold": 0.01,
+            "match_count": match_count,
+            "filter_doc_ids": doc_ids,
+            "filter_folder": folder,
+            "per_doc_limit": per_doc_limit
+        }
+        try:
+            with timed("supabase.rpc.match_page_sections_multi"): res = self.supabase.rpc("match_page_sections_multi", params).execute()
+            return self._rows_to_chunks(res.data or [])
+        except Exception as e:
+            print(f"Multi-doc search unavailable, searching documents concurrently: {e}")
+
+        with ThreadPoolExecutor(max_workers=min(len(doc_ids), MULTI_SEARCH_CONCURRENCY)) as pool:
+            merged = [c for chunks in pool.map(lambda d: self._vector_search_single(d, query_vector, per_doc_limit), doc_ids) for c in chunks]
+        return sorted(merged, key=lambda c: c.get('similarity', 0), reverse=True)[:match_count]
+
+    def search_documents(self, query: str, doc_ids: List[str], folder: Optional[str] = None, query_vector: Optional[List[float]] = None,
+                         match_count: int = MULTI_MATCH_COUNT, per_doc_limit: int = MULTI_PER_DOC_LIMIT) -> List[dict]:
+        """Merged top-k chunks across several documents (optionally restricted to a folder) in one query.
+
+        Each document contributes at most per_doc_limit vector hits. Uses the local index when it
+        knows every document, else the match_page_sections_multi RPC, else concurrent per-document
+        searches. BM25 hits are fused in when the lexical index covers the documents.
+        """
+        if not doc_ids: return []
+        if query_vector is None: query_vector = self.get_embedding(query)
+        chunks = self._vector_search_documents(doc_ids, folder, query_vector, match_count, per_doc_limit)
+        if self.lexical_index is None or not all(self.lexical_index.has_document(d) for d in doc_ids): return chunks
+        return self._hybrid(query, doc_ids, chunks, match_count)
+
     def _chunk_markdown(self, text: str) -> List[str]:
         chunks = []
         current_chunk = ""
@@ -107,86 +286,347 @@ class MistralEngine:
                 "[DESC]: <A single, concise sentence describing the file (e.g. 'August 2023 Power Bill for $150')>\n"
                 "[DETAILED]: <A dense, 5-10 line summary containing specific entities (company names, authors), dates, key outcomes, core themes, and numerical data. This will be used for search retrieval, so be specific.>"
             )
-            response = self.openai.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Analyze this document content:\n\n{preview_text}"}
-                ],
-                max_tokens=300
-            )
+            with timed("summary") as sample:
+                response = self.openai.chat.completions.create(
+                    model=SUMMARY_MODEL,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": f"Analyze this document content:\n\n{preview_text}"}
+                    ],
+                    max_tokens=300
+                )
+                sample["tokens"] = usage_tokens(response)
             return response.choices[0].message.content.strip()
         except Exception as e:
-            return "[TAG]: OTHER\n[DESC]: Processed document.\n[DETAILED]: No summary available."
+            return FALLBACK_SUMMARY
 
-    async def process_pdf_background(self, doc_id: str, file_bytes: bytes, filename: str, folder: str):
-        try:
-            # 1. Upload file
-            self.supabase.storage.from_("document-pages").upload(file=file_bytes, path=f"{doc_id}/source.pdf", file_options={"content-type": "application/pdf"})
-            
-            # 2. Get Signed URL for Mistral
-            uploaded_file = self.client.files.upload(file={"file_name": filename, "content": file_bytes}, purpose="ocr")
+    # --- INGESTION STAGES ---
+    # Each completed stage is recorded in documents.ingest_stage, so a retried or
+    # restarted job resumes from the last stage that finished instead of from scratch.
+    # Stage outputs are also kept in the content-addressed IngestCache, which is what
+    # lets a duplicate upload skip OCR, embedding and summarisation entirely.
+    def _set_stage(self, doc_id: str, stage: str, **fields) -> str:
+        self.supabase.table("documents").update({"ingest_stage": stage, **fields}).eq("id", doc_id).execute()
+        if "status" in fields: self.listing_cache.invalidate()
+        self.status_events.publish(doc_id, stage=stage, status=fields.get("status", "processing"))
+        return stage
+
+    def _get_job_state(self, doc_id: str) -> dict:
+        res = self.supabase.table("documents").select("ingest_stage, content_hash").eq("id", doc_id).execute()
+        return res.data[0] if res.data else {}
+
+    def _store_source(self, doc_id: str, source: Source, key: str):
+        bucket = self.supabase.storage.from_("document-pages")
+        path = f"{doc_id}/source.pdf"
+        existing = self.cache.find_source(key)
+        if existing:
+            try:
+                bucket.copy(existing, path) # Server-side copy, no re-upload
+                return
+            except Exception as e: print(f"Source copy failed, uploading instead: {e}")
+        with timed("storage.upload") as sample:
+            sample["bytes"] = len(source) if isinstance(source, bytes) else source.size
+            if isinstance(source, bytes): bucket.upload(file=source, path=path, file_options={"content-type": "application/pdf", "upsert": "true"})
+            else:
+                with source.open() as f: bucket.upload(file=f, path=path, file_options={"content-type": "application/pdf", "upsert": "true"})
+        self.cache.save_source(key, path)
+
+    def _load_source(self, doc_id: str) -> bytes:
+        with timed("storage.download") as sample:
+            data = self.supabase.storage.from_("document-pages").download(f"{doc_id}/source.pdf")
+            sample["bytes"] = len(data or b"")
+        return data
+
+    def _prepare_ocr(self, source: Source, filename: str):
+        """Uploads the file to Mistral once and splits it into page windows that can be OCR'd in parallel.
+
+        A spooled upload is streamed from its file and opened in place by pdfium; it is never read into memory.
+        """
+        with timed("mistral.upload") as sample:
+            sample["bytes"] = len(source) if isinstance(source, bytes) else source.size
+            if isinstance(source, bytes): uploaded_file = self.client.files.upload(file={"file_name": filename, "content": source}, purpose="ocr")
+            else:
+                with source.open() as f: uploaded_file = self.client.files.upload(file={"file_name": filename, "content": f}, purpose="ocr")
             signed_url = self.client.files.get_signed_url(file_id=uploaded_file.id, expiry=1)
-            
-            # 3. Process with Mistral OCR
+        try:
+            pdf = pdfium.PdfDocument(source if isinstance(source, bytes) else source.path)
+            n_pages = len(pdf)
+            pdf.close()
+        except Exception: n_pages = 0
+        windows = [list(range(s, min(s + OCR_WINDOW_PAGES, n_pages))) for s in range(0, n_pages, OCR_WINDOW_PAGES)]
+        return signed_url.url, windows or [None] # None = whole document in one call
+
+    def _ocr_window(self, document_url: str, page_indexes: Optional[List[int]]) -> List[tuple]:
+        """Returns (page_index, markdown, figure_annotations) per page.
+
+        Page images are never requested as base64. In visual mode Mistral annotates each
+        figure with the VisualContext schema server-side and only that JSON comes back.
+        """
+        kwargs = {"pages": page_indexes} if page_indexes is not None else {}
+        if VISUAL_EXTRACTION: kwargs["bbox_annotation_format"] = response_format_from_pydantic_model(VisualContext)
+        with timed("mistral.ocr") as sample:
             ocr_response = self.client.ocr.process(
-                document={"type": "document_url", "document_url": signed_url.url}, 
-                model="mistral-ocr-latest", 
-                include_image_base64=True
+                document={"type": "document_url", "document_url": document_url}, 
+                model=OCR_MODEL, 
+                include_image_base64=False,
+                **kwargs
             )
-            
-            full_document_text = ""
-            
-            # 4. Iterate over pages and extract MARKDOWN (Reliable)
-            for i, page in enumerate(ocr_response.pages):
-                page_num = i + 1
-                markdown = page.markdown # Use the reliable markdown field
-                
-                if not markdown.strip(): continue
-                
-                full_document_text += markdown + "\n"
-                
-                # Chunk the markdown
-                chunks = self._chunk_markdown(markdown)
-                
-                for chunk in chunks:
-                    if not chunk.strip(): continue
-                    vector = self.get_embedding(chunk)
-                    
-                    # Insert into DB (bboxes is empty [] for now as Mistral Markdown doesn't provide them directly)
-                    self.supabase.table("document_pages").insert({
-                        "document_id": doc_id, 
-                        "page_number": page_num, 
-                        "folder": folder,
-                        "content": chunk, 
-                        "embedding": vector, 
-                        "title": filename, 
-                        "image_url": "",
-                        "bboxes": [] # Safe empty list to satisfy the schema
-                    }).execute()
-            
-            # 5. Generate Summary
-            summary = self._generate_summary(full_document_text)
-            final_summary = f"**Content Summary:** {summary}\n\n---_SEPARATOR_---\n\nVerified."
-            self.supabase.table("documents").update({"status": "ready", "summary": final_summary}).eq("id", doc_id).execute()
-            
+            sample["bytes"] = getattr(getattr(ocr_response, "usage_info", None), "doc_size_bytes", 0) or 0
+        return [(
+            page.index,
+            page.markdown or "", # Use the reliable markdown field
+            [img.image_annotation for img in (page.images or []) if getattr(img, "image_annotation", None)] if VISUAL_EXTRACTION else []
+        ) for page in ocr_response.pages]
+
+    def _figure_chunk(self, annotation: str) -> Optional[str]:
+        try: ctx = VisualContext.model_validate_json(annotation)
         except Exception as e:
-            print(f"Ingestion Error: {e}")
-            self.supabase.table("documents").update({"status": "failed"}).eq("id", doc_id).execute()
+            print(f"Skipping unreadable figure annotation: {e}")
+            return None
+        return f"[Figure] {ctx.image_description}\nData: {ctx.data_extraction}\nTakeaway: {ctx.comparative_analysis}"
+
+    def _page_row(self, doc_id: str, filename: str, folder: str, chunk: dict) -> dict:
+        # bboxes is empty [] for now as Mistral Markdown doesn't provide them directly
+        row = {
+            "document_id": doc_id, 
+            "page_number": chunk["page_number"], 
+            "folder": folder,
+            "content": chunk["content"], 
+            "embedding": chunk["embedding"], 
+            "title": filename, 
+            "image_url": "",
+            "bboxes": [] # Safe empty list to satisfy the schema
+        }
+        if IDEMPOTENT_INGEST: row["chunk_index"] = chunk["chunk_index"]
+        return row
+
+    def _new_writer(self) -> BulkWriter:
+        return BulkWriter(self.supabase, "document_pages", on_conflict=PAGE_UPSERT_KEY if IDEMPOTENT_INGEST else None)
+
+    def _index_pages(self, doc_id: str, filename: str, folder: str, chunks: List[dict]):
+        rows = [self._page_row(doc_id, filename, folder, chunk) for chunk in chunks]
+        writer = self._new_writer()
+        writer.extend(rows)
+        writer.flush()
+        if self.vector_index: self.vector_index.add(folder, rows)
+        if self.lexical_index: self.lexical_index.add(doc_id, rows)
+        if self.answer_cache: self.answer_cache.invalidate(doc_id, folder)
+
+    def _clear_pages(self, doc_id: str):
+        self.supabase.table("document_pages").delete().eq("document_id", doc_id).execute()
+        if self.vector_index: self.vector_index.remove_document(doc_id)
+        if self.lexical_index: self.lexical_index.remove_document(doc_id)
+        if self.answer_cache: self.answer_cache.invalidate(doc_id)
+
+    def _run_pipeline(self, doc_id: str, filename: str, folder: str, key: str, source: Optional[Source], pages: Optional[List[str]], figures: Optional[List[List[str]]] = None) -> str:
+        """OCR -> chunk -> embed -> persist with every stage overlapped. Returns the summary.
+
+        pages (and figures, in visual mode) are the cached OCR output when resuming; otherwise
+        the source is OCR'd window by window. Each figure becomes its own chunk.
+        The summary call starts as soon as the first SUMMARY_PREVIEW_CHARS of text are known.
+        """
+        lock = threading.Lock()
+        collected = {} # page index -> markdown
+        collected_figures = {} # page index -> figure annotations (visual mode)
+        indexed = []
+        embedded = [0]
+        pending_batch = []
+        summary_pool = ThreadPoolExecutor(max_workers=1)
+        summary_future = [None]
+        cached_summary = self.cache.load_summary(key)
 
-    def get_documents(self):
+        def start_summary(final: bool = False):
+            # Caller holds the lock. Only the in-order prefix counts, as windows finish out of order.
+            if summary_future[0] or cached_summary is not None: return
+            preview, i = "", 0
+            while i in collected and len(preview) < SUMMARY_PREVIEW_CHARS:
+                if collected[i].strip(): preview += collected[i] + "\n"
+                i += 1
+            if final: preview = "\n".join(collected[i] for i in sorted(collected) if collected[i].strip())
+            if final or len(preview) >= SUMMARY_PREVIEW_CHARS:
+                summary_future[0] = summary_pool.submit(self._generate_summary, preview)
+
+        def ocr(window):
+            result = self._ocr_window(document_url, window)
+            with lock:
+                for index, markdown, annotations in result:
+                    collected[index] = markdown
+                    if annotations: collected_figures[index] = annotations
+                start_summary()
+                pages_done = len(collected)
+            self.status_events.publish(doc_id, pages_ocr=pages_done)
+            return result
+
+        def ocr_done():
+            with lock:
+                n_pages = max(collected, default=-1) + 1
+                ocr_pages = [collected.get(i, "") for i in range(n_pages)]
+                ocr_figures = [collected_figures.get(i, []) for i in range(n_pages)]
+            if VISUAL_EXTRACTION: self.cache.save_figures(key, ocr_figures)
+            self.cache.save_ocr(key, ocr_pages)
+            self._set_stage(doc_id, STAGE_OCR)
+
+        def chunk(page):
+            index, markdown, annotations = page
+            parts = [c for c in self._chunk_markdown(markdown) if c.strip()] if markdown.strip() else []
+            # Figures are handled one at a time, so memory does not grow with their number
+            parts.extend(c for c in map(self._figure_chunk, annotations) if c)
+            return [{"page_number": index + 1, "chunk_index": n, "content": c} for n, c in enumerate(parts)]
+
+        def batch(item):
+            pending_batch.append(item)
+            if len(pending_batch) < EMBED_BATCH_CHUNKS: return None
+            full = pending_batch[:]
+            pending_batch.clear()
+            return [full]
+
+        def embed(items):
+            # Embed a whole batch of chunks in as few requests as possible
+            for item, vector in zip(items, self.embedder.embed([c["content"] for c in items])): item["embedding"] = vector
+            with lock:
+                embedded[0] += len(items)
+                count = embedded[0]
+            self.status_events.publish(doc_id, chunks_embedded=count)
+            return [items]
+
+        def persist(items):
+            self._index_pages(doc_id, filename, folder, items)
+            with lock:
+                indexed.extend(items)
+                count = len(indexed)
+            self.status_events.publish(doc_id, chunks_indexed=count)
+
+        # Drop chunks left behind by an earlier attempt that died mid-write
+        self._clear_pages(doc_id)
+
+        pipeline = StagePipeline(queue_size=PIPELINE_QUEUE_SIZE)
+        if pages is None:
+            document_url, windows = self._prepare_ocr(source, filename)
+            self.status_events.publish(doc_id, pages_total=sum(len(w) for w in windows if w) or None, pages_ocr=0)
+            pipeline.add_stage("ocr", ocr, workers=OCR_CONCURRENCY, flush=ocr_done)
+            source = windows
+        else:
+            collected.update(enumerate(pages))
+            self.status_events.publish(doc_id, pages_total=len(pages), pages_ocr=len(pages))
+            with lock: start_summary()
+            figures = figures or [[] for _ in pages]
+            source = [(i, markdown, figures[i] if i < len(figures) else []) for i, markdown in enumerate(pages)]
+        pipeline.add_stage("chunk", chunk)
+        pipeline.add_stage("batch", batch, flush=lambda: [pending_batch[:]] if pending_batch else None)
+        pipeline.add_stage("embed", embed, workers=EMBED_CONCURRENCY)
+        pipeline.add_stage("persist", persist, workers=WRITE_CONCURRENCY)
         try:
-            res = self.supabase.table("documents").select("*").order("created_at", desc=True).execute()
-            return [{
+            pipeline.run(source)
+            self.cache.save_chunks(key, sorted(indexed, key=lambda c: (c["page_number"], c["chunk_index"])))
+            with lock: start_summary(final=True)
+            return cached_summary if cached_summary is not None else summary_future[0].result()
+        finally: summary_pool.shutdown(wait=False)
+
+    def process_pdf_background(self, doc_id: str, source: Optional[Source], filename: str, folder: str):
+        """Runs (or resumes) ingestion for one document. Blocking; raises on failure so the caller can retry.
+
+        source is raw bytes or a SpooledUpload (whose streamed sha256 is reused as the content hash).
+        It may be None when resuming a job after a restart; the stored source is used instead.
+        """
+        state = self._get_job_state(doc_id)
+        stage = state.get("ingest_stage") or STAGE_QUEUED
+        key = state.get("content_hash")
+        summary = None
+        if stage == STAGE_QUEUED and source is None: raise SourceMissingError("Source PDF was never stored; please upload the file again.")
+
+        if not key:
+            if source is None: source = self._load_source(doc_id)
+            key = content_hash(source) if isinstance(source, bytes) else source.sha256
+            self.supabase.table("documents").update({"content_hash": key}).eq("id", doc_id).execute()
+
+        # 1. Upload file
+        if stage == STAGE_QUEUED:
+            with timed("ingest.store"): self._store_source(doc_id, source, key)
+            stage = self._set_stage(doc_id, STAGE_STORED)
+
+        # 2-3. OCR, chunk, embed and store. Known files reuse cached OCR pages and vectors.
+        if stage in (STAGE_STORED, STAGE_OCR):
+            pages = self.cache.load_ocr(key)
+            figures = None
+            if VISUAL_EXTRACTION and pages is not None:
+                figures = self.cache.load_figures(key)
+                if figures is None: pages = None # OCR'd before visual mode was on; redo it to get figures
+            chunks = self.cache.load_chunks(key) if pages is not None else None
+            if chunks is not None:
+                self._clear_pages(doc_id)
+                self._index_pages(doc_id, filename, folder, chunks)
+                self.status_events.publish(doc_id, pages_total=len(pages), pages_ocr=len(pages), chunks_embedded=len(chunks), chunks_indexed=len(chunks), cache_hit=True)
+            else:
+                if pages is None and source is None: source = self._load_source(doc_id)
+                with timed("ingest.index"): summary = self._run_pipeline(doc_id, filename, folder, key, source, pages, figures)
+            stage = self._set_stage(doc_id, STAGE_INDEXED, cache_hit=chunks is not None)
+        source = None
+
+        # 4. Generate Summary (usually already produced by the pipeline)
+        if stage == STAGE_INDEXED:
+            vector = None # Duplicate uploads get the cached summary and its embedding: no model calls at all
+            if summary is None: summary, vector = self.cache.load_summary_with_embedding(key)
+            cached = vector is not None
+            if summary is None:
+                pages = self.cache.load_ocr(key)
+                if pages is None: # Cache entry vanished; redo OCR on the next attempt
+                    self._set_stage(doc_id, STAGE_STORED)
+                    raise RuntimeError("OCR output missing for resumed job.")
+                summary = self._generate_summary("\n".join(p for p in pages if p.strip()))
+            final_summary = f"**Content Summary:** {summary}\n\n---_SEPARATOR_---\n\nVerified."
+            fields, columns = parse_summary(summary), {}
+            try:
+                if vector is None: vector = self.embedder.embed([summary_text(fields)])[0]
+                columns = summary_columns(fields, vector)
+            except Exception as e: print(f"Summary embedding failed, the startup backfill will retry it: {e}")
+            if summary != FALLBACK_SUMMARY and not cached: self.cache.save_summary(key, summary, vector)
+            self.status_events.publish(doc_id, summary="fallback" if summary == FALLBACK_SUMMARY else "done")
+            self._set_stage(doc_id, STAGE_DONE, status="ready", summary=final_summary, ingest_error=None, **columns)
+            if columns: self.summary_index.add(folder, summary_entry({"id": doc_id, "title": filename, **columns}))
+
+    def get_documents(self, folder: Optional[str] = None, status: Optional[str] = None, include_summary: bool = False,
+                      limit: int = DOCUMENTS_PAGE_SIZE, cursor: Optional[str] = None, include_tags: bool = False) -> dict:
+        """One page of documents, newest first. Keyset pagination on (created_at, id): pass
+        the returned next_cursor back to get the following page. include_tags adds just the
+        short summary_tag / summary_desc fields, for lists that do not need the full summary."""
+        columns = "id, title, folder, status, created_at" + (", summary" if include_summary else "") + (", summary_tag, summary_desc" if include_tags else "")
+        query = self.supabase.table("documents").select(columns)
+        if folder: query = query.eq("folder", folder)
+        if status: query = query.eq("status", status)
+        if cursor:
+            created_at, last_id = decode_cursor(cursor)
+            query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{last_id})')
+        res = query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1).execute()
+        rows = res.data[:limit]
+        documents = []
+        for r in rows:
+            doc = {
                 "id": r['id'], "title": r.get('title','Untitled'), "folder": r.get('folder','General'),
-                "status": r.get('status','ready'), "summary": r.get('summary',''),
+                "status": r.get('status','ready'),
                 "upload_date": r['created_at'].split("T")[0] if r.get('created_at') else "N/A"
-            } for r in res.data]
-        except: return []
+            }
+            if include_summary: doc["summary"] = r.get('summary','')
+            if include_tags: doc.update(summary_tag=r.get('summary_tag'), summary_desc=r.get('summary_desc'))
+            documents.append(doc)
+        next_cursor = _encode_cursor(rows[-1]['created_at'], rows[-1]['id']) if len(res.data) > limit else None
+        return {"documents": documents, "next_cursor": next_cursor}
+
+    def document_fingerprint(self, doc_id: str) -> str:
+        """Version of a document for the answer cache: its id and content hash once it is ready, "" before.
+        Read from the database, so answers cached by any worker stop matching when the document changes."""
+        try: res = self.supabase.table("documents").select("status, content_hash").eq("id", doc_id).execute()
+        except Exception as e:
+            print(f"Could not read the version of {doc_id}: {e}")
+            return ""
+        row = res.data[0] if res.data else {}
+        return f"{doc_id}:{row['content_hash']}" if row.get("status") == "ready" and row.get("content_hash") else ""
 
     def delete_document(self, doc_id: str):
-        self.supabase.table("document_pages").delete().eq("document_id", doc_id).execute()
+        self._clear_pages(doc_id)
         self.supabase.table("documents").delete().eq("id", doc_id).execute()
+        self.listing_cache.invalidate()
+        self.summary_index.remove(doc_id)
+        self.status_events.forget(doc_id)
 
     def debug_document(self, doc_id: str):
         return {"status": "ok"} 
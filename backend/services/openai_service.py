@@ -1,22 +1,132 @@
-from openai import OpenAI
+from openai import BadRequestError
 import os
 import json
 import re
-from typing import List, Dict, Any, Optional
-from tenacity import retry, stop_after_attempt, wait_random_exponential
+import time
+import asyncio
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
+from services.reranker import build_reranker, LLMReranker
+from services.citations import CitationResolver
+from services.context_builder import ContextBuilder
+from services.embeddings import count_tokens
+from services.clients import clients
+from services.metrics import metrics, timed, usage_tokens
+
+# Words that only make sense with the chat history ("why is it low?", "what about 2022?")
+_REFERENCE_WORDS = set("it its this that these those they them their he she his her him there such same former latter above below previous earlier mentioned".split())
+_FOLLOW_UP_PREFIXES = ("and ", "also ", "what about", "how about", "same ")
+# Word overlap (Jaccard) above which a rewrite counts as the same query, so work started on the raw question is kept
+REWRITE_KEEP_OVERLAP = float(os.environ.get("REWRITE_KEEP_OVERLAP", "0.8"))
+
+def needs_rewrite(history: List[Dict[str, str]], question: str) -> bool:
+    """Cheap check for whether a question depends on the history and needs the rewrite call."""
+    if not history: return False
+    words = re.findall(r"[a-z']+", question.lower())
+    if len(words) <= 3: return True # Fragments lean on the previous turn
+    return question.lower().lstrip().startswith(_FOLLOW_UP_PREFIXES) or any(w in _REFERENCE_WORDS for w in words)
+
+def minor_rewrite(question: str, refined: str) -> bool:
+    """Whether the rewrite left the question's words (nearly) as they were."""
+    before, after = set(re.findall(r"[a-z0-9']+", question.lower())), set(re.findall(r"[a-z0-9']+", refined.lower()))
+    if not before or not after: return before == after
+    return len(before & after) / len(before | after) >= REWRITE_KEEP_OVERLAP
+
+class AnswerFieldParser:
+    """Incrementally decodes the "answer" string of a streamed {"answer": ..., "quotes": [...]} JSON object.
+
+    feed() takes raw model deltas and returns the newly decoded answer text (possibly empty).
+    Escapes split across deltas are held back until complete, and \\u surrogate pairs are
+    combined into one character (a lone surrogate becomes U+FFFD).
+    """
+
+    _ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+    def __init__(self):
+        self.buffer = ""
+        self.state = "key" # key -> value -> string -> done
+
+    def feed(self, delta: str) -> str:
+        self.buffer += delta
+        out = []
+        if self.state == "key":
+            match = re.search(r'"answer"\s*:\s*', self.buffer)
+            if not match: return ""
+            self.buffer = self.buffer[match.end():]
+            self.state = "value"
+        if self.state == "value":
+            stripped = self.buffer.lstrip()
+            if not stripped: return ""
+            if stripped[0] != '"': # Not a string; nothing to stream
+                self.state = "done"
+                return ""
+            self.buffer = stripped[1:]
+            self.state = "string"
+        if self.state == "string":
+            i = 0
+            while i < len(self.buffer):
+                ch = self.buffer[i]
+                if ch == '"':
+                    self.state = "done"
+                    i += 1
+                    break
+                if ch != '\\':
+                    out.append(ch)
+                    i += 1
+                    continue
+                if i + 1 >= len(self.buffer): break # Escape continues in the next delta
+                code = self.buffer[i + 1]
+                if code == 'u':
+                    if i + 6 > len(self.buffer): break
+                    unit = int(self.buffer[i + 2:i + 6], 16)
+                    if 0xD800 <= unit < 0xDC00: # High surrogate: combine with the \uDC00-\uDFFF escape that should follow
+                        rest = self.buffer[i + 6:i + 12]
+                        if len(rest) < 6 and '\\u'.startswith(rest[:2]): break # The low half may still arrive
+                        low = int(rest[2:], 16) if rest[:2] == '\\u' else 0
+                        if 0xDC00 <= low < 0xE000:
+                            out.append(chr(0x10000 + ((unit - 0xD800) << 10) + (low - 0xDC00)))
+                            i += 12
+                            continue
+                        unit = 0xFFFD
+                    elif 0xDC00 <= unit < 0xE000: unit = 0xFFFD # Lone surrogates cannot be encoded as UTF-8
+                    out.append(chr(unit))
+                    i += 6
+                else:
+                    out.append(self._ESCAPES.get(code, code))
+                    i += 2
+            self.buffer = self.buffer[i:]
+        return "".join(out)
+
+def _is_retryable(error: BaseException) -> bool:
+    # 400s (context length exceeded, invalid request) fail the same way every time
+    return not isinstance(error, BadRequestError)
 
 class OpenAIService:
     def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.reranker = build_reranker(self) # RERANK_MODE: local (default), onnx or llm
+        self.llm_reranker = LLMReranker(self)
+        self.context_builder = ContextBuilder() # ANSWER_CONTEXT_TOKENS / ANSWER_HISTORY_TOKENS
+
+    @property
+    def client(self): return clients.openai() # Sync: LLM rerank fallback and transcription, which run in threads
+
+    @property
+    def async_client(self): return clients.async_openai() # Chat path
 
-    @retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
+    @retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6), retry=retry_if_exception(_is_retryable), reraise=True)
     def get_answer_with_backoff(self, messages, model="gpt-4o-mini", json_mode=True):
         kwargs = {"model": model, "messages": messages, "max_tokens": 1500}
         if json_mode: kwargs["response_format"] = {"type": "json_object"}
         return self.client.chat.completions.create(**kwargs)
 
-    def generate_refined_query(self, history: List[Dict[str, str]], current_question: str) -> str:
-        if not history: return current_question
+    @retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6), retry=retry_if_exception(_is_retryable), reraise=True)
+    async def get_answer_with_backoff_async(self, messages, model="gpt-4o-mini", json_mode=True):
+        kwargs = {"model": model, "messages": messages, "max_tokens": 1500}
+        if json_mode: kwargs["response_format"] = {"type": "json_object"}
+        return await self.async_client.chat.completions.create(**kwargs)
+
+    async def generate_refined_query(self, history: List[Dict[str, str]], current_question: str) -> str:
+        if not needs_rewrite(history, current_question): return current_question
         short_history = history[-3:] 
         prompt = (
             "You are a query optimizer. Rewrite the 'Current Question' into a specific, standalone search query using the 'Chat History'.\n"
@@ -25,10 +135,12 @@ class OpenAIService:
         )
         history_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in short_history])
         try:
-            response = self.get_answer_with_backoff([
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": f"Chat History:\n{history_text}\n\nCurrent Question: {current_question}"}
-            ])
+            with timed("rewrite") as sample:
+                response = await self.get_answer_with_backoff_async([
+                    {"role": "system", "content": prompt},
+                    {"role": "user", "content": f"Chat History:\n{history_text}\n\nCurrent Question: {current_question}"}
+                ])
+                sample["tokens"] = usage_tokens(response)
             data = json.loads(response.choices[0].message.content)
             return data.get("refined_query", current_question)
         except: return current_question
@@ -36,62 +148,46 @@ class OpenAIService:
     def rerank_chunks(self, chunks: List[dict], query: str) -> List[dict]:
         if not chunks: return []
         if len(chunks) <= 5: return chunks 
-        
-        chunk_text = ""
-        for i, c in enumerate(chunks):
-            preview = c['content'][:300].replace("\n", " ")
-            chunk_text += f"[ID:{i}] {preview}...\n"
-
-        prompt = (
-            "You are a Relevance Judge. Select the Top 20 chunks that help answer the query.\n"
-            "Prioritize chunks with: specific numbers, dates, names, or explanations.\n"
-            "Return JSON: { \"selected_indices\": [0, 4, 12, ...] }"
-        )
-
         try:
-            response = self.get_answer_with_backoff([
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": f"Query: {query}\n\nChunks:\n{chunk_text}"}
-            ])
-            data = json.loads(response.choices[0].message.content)
-            indices = data.get("selected_indices", [])
-            selected_chunks = [chunks[i] for i in indices if 0 <= i < len(chunks)]
-            return selected_chunks if selected_chunks else chunks[:10]
-        except: return chunks[:15]
+            with timed("rerank"): return self.reranker.rerank(chunks, query)
+        except Exception as e:
+            print(f"Rerank Error, falling back to LLM judge: {e}")
+            with timed("rerank.llm"): return self.llm_reranker.rerank(chunks, query)
 
-    def select_relevant_files(self, file_summaries: List[dict], question: str) -> List[str]:
+    async def select_relevant_files(self, file_summaries: List[dict], question: str) -> List[str]:
         if not file_summaries: return []
         context = "AVAILABLE FILES:\n"
         for f in file_summaries:
-            context += f"- [ID: {f['id']}] Title: {f['title']}\n  Summary: {f['summary'][:300]}...\n\n"
+            context += f"- [ID: {f['id']}] Title: {f['title']} ({f.get('tag', 'OTHER')})\n  Summary: {f.get('desc', '')} {f.get('detailed', f['summary'])[:300]}\n\n"
 
         prompt = (
             "You are a Research Assistant. Select the top 3-4 documents that are most likely to contain the answer.\n"
             "Return JSON: { \"selected_ids\": [\"id_1\", \"id_2\"] }"
         )
         try:
-            res = self.get_answer_with_backoff([
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": f"{context}\n\nQuestion: {question}"}
-            ])
+            with timed("select") as sample:
+                res = await self.get_answer_with_backoff_async([
+                    {"role": "system", "content": prompt},
+                    {"role": "user", "content": f"{context}\n\nQuestion: {question}"}
+                ])
+                sample["tokens"] = usage_tokens(res)
             return json.loads(res.choices[0].message.content).get("selected_ids", [])
         except: return []
 
-    def get_answer(self, context_chunks: List[dict], question: str, mode: str = "single_doc", history: List[Dict[str, str]] = []) -> Dict[str, Any]:
-        
+    def _prepare_answer(self, context_chunks: List[dict], question: str, mode: str, history: List[Dict[str, str]]):
+        """Reranks the context and packs it into the token budget. Returns (chunks in the prompt, messages)."""
         final_chunks = context_chunks
         if mode in ["folder_deep", "single_doc"] and len(context_chunks) > 0:
             final_chunks = self.rerank_chunks(context_chunks, question)
 
+        started = time.perf_counter()
         context_text = ""
         system_prompt = ""
 
         if mode in ["single_doc", "folder_deep"]:
             if final_chunks:
-                context_text += "--- SOURCE MATERIAL ---\n"
-                for i, chunk in enumerate(final_chunks):
-                    source_label = chunk.get('source', 'Document')
-                    context_text += f"[ID:{i}] [Source: {source_label} | Page {chunk.get('page', '?')}] {chunk['content']}\n\n"
+                final_chunks, body, _ = self.context_builder.pack(final_chunks, lambda i, chunk: f"[ID:{i}] [Source: {chunk.get('source', 'Document')} | Page {chunk.get('page', '?')}] {chunk['content']}\n\n")
+                context_text = "--- SOURCE MATERIAL ---\n" + body
             else:
                 context_text = "No specific document context found."
 
@@ -112,10 +208,8 @@ class OpenAIService:
 
         elif mode == "folder_fast" or mode == "simple":
             if final_chunks:
-                context_text += "--- FILE SUMMARIES ---\n"
-                for i, chunk in enumerate(final_chunks):
-                    filename = chunk.get('source', 'Unknown File')
-                    context_text += f"[ID:{i}] [File: {filename}] {chunk['content']}\n\n"
+                final_chunks, body, _ = self.context_builder.pack(final_chunks, lambda i, chunk: f"[ID:{i}] [File: {chunk.get('source', 'Unknown File')}] {chunk['content']}\n\n")
+                context_text = "--- FILE SUMMARIES ---\n" + body
             else:
                 context_text = "No file summaries found."
 
@@ -128,41 +222,52 @@ class OpenAIService:
 
         messages = [{"role": "system", "content": system_prompt}]
         if history:
-            for msg in history[-6:]:
+            for msg in self.context_builder.trim_history(history):
                 role = "user" if msg.get("role") == "user" else "assistant"
                 messages.append({"role": role, "content": msg.get("content", "")})
         messages.append({"role": "user", "content": f"Context:\n{context_text}\n\nQuestion: {question}"})
+        # Prompt size per request shows up as rag_stage_tokens_total{stage="answer.prompt"}
+        metrics.observe("answer.prompt", time.perf_counter() - started, tokens=sum(count_tokens(m["content"]) for m in messages))
+        return final_chunks, messages
 
+    def _resolve_citations(self, raw_quotes: List[str], final_chunks: List[dict]) -> List[dict]:
+        return CitationResolver(final_chunks).resolve(raw_quotes)
+
+    async def get_answer(self, context_chunks: List[dict], question: str, mode: str = "single_doc", history: List[Dict[str, str]] = []) -> Dict[str, Any]:
+        final_chunks, messages = await asyncio.to_thread(self._prepare_answer, context_chunks, question, mode, history)
         try:
-            response = self.get_answer_with_backoff(messages=messages)
+            with timed("answer") as sample:
+                response = await self.get_answer_with_backoff_async(messages=messages)
+                sample["tokens"] = usage_tokens(response)
             data = json.loads(response.choices[0].message.content)
-            
-            raw_quotes = data.get("quotes", [])
-            formatted_citations = []
-            
-            for ai_quote in raw_quotes:
-                best_match = None
-                for c in final_chunks:
-                    if ai_quote[:30].lower() in c['content'].lower():
-                        best_match = c
-                        break
-                
-                if best_match:
-                    formatted_citations.append({
-                        "content": ai_quote,
-                        "page": best_match.get('page', 1),
-                        "source": best_match.get('source', 'Document'),
-                        "id": best_match.get('id', 0),
-                        "document_id": best_match.get('document_id', None) # PASS THROUGH
-                    })
-
-            return {"answer": data.get("answer", ""), "citations": formatted_citations}
+            return {"answer": data.get("answer", ""), "citations": self._resolve_citations(data.get("quotes", []), final_chunks)}
         except Exception as e:
             print(f"AI Error: {e}")
             return {"answer": "Error generating response.", "citations": []}
 
+    async def stream_answer(self, context_chunks: List[dict], question: str, mode: str = "single_doc", history: List[Dict[str, str]] = []) -> AsyncIterator[Tuple[str, Any]]:
+        """Same answer as get_answer, as ("token", text) events while the model writes the
+        'answer' field, then one ("citations", [...]) event once the quotes are resolved."""
+        final_chunks, messages = await asyncio.to_thread(self._prepare_answer, context_chunks, question, mode, history)
+        parser = AnswerFieldParser()
+        raw = ""
+        with timed("answer.stream") as sample:
+            stream = await self.async_client.chat.completions.create(model="gpt-4o-mini", messages=messages, max_tokens=1500, response_format={"type": "json_object"},
+                                                                      stream=True, stream_options={"include_usage": True})
+            async for event in stream:
+                if event.usage: sample["tokens"] = event.usage.total_tokens # Final event, no choices
+                if not event.choices: continue
+                delta = event.choices[0].delta.content or ""
+                raw += delta
+                text = parser.feed(delta)
+                if text: yield "token", text
+        data = json.loads(raw)
+        yield "citations", self._resolve_citations(data.get("quotes", []), final_chunks)
+
     def transcribe_audio(self, audio_file):
         try:
-            transcript = self.client.audio.transcriptions.create(model="whisper-1", file=audio_file)
+            with timed("transcription") as sample:
+                sample["bytes"] = audio_file.getbuffer().nbytes if hasattr(audio_file, "getbuffer") else 0
+                transcript = self.client.audio.transcriptions.create(model="whisper-1", file=audio_file)
             return transcript.text
         except: return "Error transcribing audio."
\ No newline at end of file
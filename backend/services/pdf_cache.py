@@ -0,0 +1,124 @@
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+PDF_CACHE_DIR = os.environ.get("PDF_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "pdf_cache")
+PDF_CACHE_MAX_BYTES = int(os.environ.get("PDF_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+class SourcePDFCache:
+    """Size-bounded on-disk cache of source PDFs, evicted LRU by bytes.
+
+    A document's source never changes after upload, so cached files need no revalidation;
+    delete_document evicts them. Concurrent misses for one document share a single
+    storage download. Survives restarts: existing files are picked up oldest-access first.
+    Files handed out with get(pin=True) stay on disk until unpin(), so eviction never
+    deletes a file that is still being served.
+
+    `fetch` returns None when the document has no source PDF and raises on any other
+    failure; requests that waited on a failed download retry it once themselves.
+    """
+
+    def __init__(self, fetch: Callable[[str], Optional[bytes]], directory: str = PDF_CACHE_DIR, max_bytes: int = PDF_CACHE_MAX_BYTES):
+        self.fetch = fetch
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._sizes: "OrderedDict[str, int]" = OrderedDict() # doc_id -> bytes, least recently used first
+        self._total = 0
+        self._inflight: Dict[str, threading.Event] = {}
+        self._failed: Dict[str, threading.Event] = {} # Downloads that raised, so their waiters retry instead of reporting a 404
+        self._pins: Dict[str, int] = {} # key -> responses still reading the file
+        self._lock = threading.Lock()
+        existing = [e for e in os.scandir(directory) if e.is_file() and e.name.endswith(".pdf")] if os.path.isdir(directory) else []
+        for entry in sorted(existing, key=lambda e: e.stat().st_atime):
+            self._sizes[entry.name[:-4]] = entry.stat().st_size
+            self._total += entry.stat().st_size
+
+    def _path(self, doc_id: str) -> str:
+        # doc ids come from the URL; never let them pick the file name directly
+        return os.path.join(self.directory, hashlib.sha1(doc_id.encode("utf-8")).hexdigest() + ".pdf")
+
+    def _key(self, doc_id: str) -> str:
+        return os.path.basename(self._path(doc_id))[:-4]
+
+    def get(self, doc_id: str, pin: bool = False) -> Optional[str]:
+        """Local path of the document's source PDF, downloading it first if needed; None if missing.
+        Raises when the download fails for any other reason. With pin=True a returned path stays
+        valid until unpin(doc_id)."""
+        key, path = self._key(doc_id), self._path(doc_id)
+        retried = False
+        while True:
+            with self._lock:
+                if key in self._sizes and os.path.exists(path):
+                    self._sizes.move_to_end(key)
+                    self.hits += 1
+                    if pin: self._pins[key] = self._pins.get(key, 0) + 1
+                    return path
+                waiter = self._inflight.get(key)
+                if waiter is None:
+                    self._inflight[key] = threading.Event()
+                    self.misses += 1
+                    break
+            waiter.wait() # Another request is downloading this document; reuse its result
+            with self._lock:
+                if key in self._sizes: continue
+                failed = self._failed.get(key) is waiter
+            if not failed: return None # The shared download found no source PDF
+            if retried: raise RuntimeError(f"Source PDF of {doc_id} could not be downloaded")
+            retried = True # A transient failure of someone else's download: try again ourselves
+
+        event = self._inflight[key]
+        try:
+            data = self.fetch(doc_id)
+            if not data: return None
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f: f.write(data)
+            os.replace(tmp, path)
+            with self._lock:
+                self._total += len(data) - self._sizes.pop(key, 0)
+                self._sizes[key] = len(data)
+                if pin: self._pins[key] = self._pins.get(key, 0) + 1
+                self._evict()
+            return path
+        except Exception:
+            with self._lock: self._failed[key] = event
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key)
+                if self._failed.get(key) is not event: self._failed.pop(key, None)
+            event.set()
+
+    def _evict(self):
+        # Caller holds the lock. The newest file and pinned files are kept even past the budget.
+        for key in [k for k in list(self._sizes)[:-1] if k not in self._pins]:
+            if self._total <= self.max_bytes: break
+            self._total -= self._sizes.pop(key)
+            self._remove(key)
+
+    def _remove(self, key: str):
+        try: os.remove(os.path.join(self.directory, key + ".pdf"))
+        except OSError: pass
+
+    def evict(self, doc_id: str):
+        key = self._key(doc_id)
+        with self._lock:
+            self._total -= self._sizes.pop(key, 0)
+            if key not in self._pins: self._remove(key) # Otherwise the last unpin() removes it
+
+    def unpin(self, doc_id: str):
+        key = self._key(doc_id)
+        with self._lock:
+            self._pins[key] -= 1
+            if self._pins[key]: return
+            del self._pins[key]
+            if key not in self._sizes: self._remove(key) # Evicted while it was being served
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"files": len(self._sizes), "bytes": self._total, "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / total, 4) if total else 0.0}
@@ -1,25 +1,98 @@
 import io
 import uuid
 import os
-from typing import List, Optional
+import asyncio
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
 from datetime import datetime
 
 import pypdfium2 as pdfium
 from PIL import Image
-from supabase import create_client, Client
-from openai import OpenAI
+from functools import cached_property
+from supabase import Client
+from services.embeddings import EmbeddingBatcher
+from services.embedding_cache import shared_embedding_cache
+from services.vector_index import shared_vector_index
+from services.answer_cache import shared_answer_cache
+from services.clients import clients
+from services.listing_cache import shared_listing_cache
+from services.summary_index import shared_summary_index
+from services.bulk_writer import BulkWriter, PAGE_UPSERT_KEY, IDEMPOTENT_INGEST
+
+# --- PAGE RENDERING ---
+PDF_MAX_PAGES = int(os.environ.get("PDF_MAX_PAGES", "1000")) # 0 = no limit
+PDF_RENDER_WORKERS = int(os.environ.get("PDF_RENDER_WORKERS", str(os.cpu_count() or 2)))
+PDF_RENDER_SCALE = float(os.environ.get("PDF_RENDER_SCALE", "1"))
+PDF_RENDER_FORMAT = os.environ.get("PDF_RENDER_FORMAT", "JPEG").upper() # JPEG or WEBP
+PDF_RENDER_QUALITY = int(os.environ.get("PDF_RENDER_QUALITY", "80"))
+PDF_THUMB_WIDTH = int(os.environ.get("PDF_THUMB_WIDTH", "0")) # > 0 also stores {doc_id}/thumbs/{page}
+PDF_UPLOAD_CONCURRENCY = int(os.environ.get("PDF_UPLOAD_CONCURRENCY", "8"))
+
+_IMAGE_TYPES = {"JPEG": ("jpg", "image/jpeg"), "WEBP": ("webp", "image/webp")}
+
+def _partition(n_pages: int, parts: int) -> List[range]:
+    """Splits pages into contiguous ranges, several per worker so results stream back early."""
+    size = max(1, -(-n_pages // max(parts * 4, 1)))
+    return [range(s, min(s + size, n_pages)) for s in range(0, n_pages, size)]
+
+def _encode(image: Image.Image, fmt: str, quality: int) -> bytes:
+    out = io.BytesIO()
+    image.save(out, format=fmt, quality=quality)
+    return out.getvalue()
+
+def _render_pages(pdf_path: str, pages: range, filename: str, scale: float, fmt: str, quality: int, thumb_width: int) -> List[tuple]:
+    """Runs in a worker process: (page index, text, image bytes, thumbnail bytes or None) per page.
+    Takes a path rather than the PDF bytes, so a task only pickles its arguments and results."""
+    pdf = pdfium.PdfDocument(pdf_path)
+    results = []
+    for i in pages:
+        page = pdf[i]
+        text = page.get_textpage().get_text_bounded()
+        if len(text.strip()) < 10:
+            text = f"Image based page {i+1} of document {filename}. Contains visual data."
+        image = page.render(scale=scale).to_pil().convert("RGB")
+        thumb = None
+        if thumb_width and image.width > thumb_width:
+            small = image.copy()
+            small.thumbnail((thumb_width, thumb_width * 4))
+            thumb = _encode(small, fmt, quality)
+        results.append((i, text, _encode(image, fmt, quality), thumb))
+    return results
+
+def _is_missing(error: Exception) -> bool:
+    # Supabase Storage reports a missing object as 404, or as 400 with error "not_found"
+    if isinstance(error, FileNotFoundError): return True
+    return str(getattr(error, "status", "")) == "404" or "not_found" in str(getattr(error, "code", "")).lower()
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def _render_pool() -> ProcessPoolExecutor:
+    # spawn, not fork: the server process has live threads and HTTP pools
+    global _pool
+    with _pool_lock:
+        if _pool is None: _pool = ProcessPoolExecutor(max_workers=PDF_RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
 
 class PDFEngine:
     def __init__(self):
-        # Initialize Supabase
-        url: str = os.environ.get("SUPABASE_URL")
-        key: str = os.environ.get("SUPABASE_KEY")
-        if not url or not key:
-            raise ValueError("Supabase credentials missing in environment variables.")
-        self.supabase: Client = create_client(url, key)
-        
-        # Initialize OpenAI for Embeddings
-        self.openai = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        # Supabase / OpenAI clients come from the shared registry on first use (see services/clients.py)
+        self.vector_index = shared_vector_index() # None unless LOCAL_VECTOR_INDEX=1
+        self.answer_cache = shared_answer_cache() # None when ANSWER_CACHE=0
+        self.listing_cache = shared_listing_cache()
+        self.summary_index = shared_summary_index()
+
+    @property
+    def supabase(self) -> Client: return clients.supabase()
+
+    @property
+    def openai(self): return clients.openai()
+
+    @cached_property
+    def embedder(self) -> EmbeddingBatcher: return EmbeddingBatcher(self.openai, cache=shared_embedding_cache())
 
     def get_folders(self) -> List[str]:
         # Fetch actual folders from the new table
@@ -27,9 +100,18 @@ class PDFEngine:
         # Return a list of names like ["General", "Finance", "Receipts"]
         return sorted([row['name'] for row in response.data])
 
+    def count_documents(self, folders: List[str]) -> Dict[str, int]:
+        """Documents per folder: one count-only query each, answered from the (folder, created_at) index."""
+        counts = {}
+        for name in folders:
+            res = self.supabase.table("documents").select("id", count="exact", head=True).eq("folder", name).execute()
+            counts[name] = res.count or 0
+        return counts
+
     def create_folder(self, folder_name: str):
         try:
             self.supabase.table("folders").insert({"name": folder_name}).execute()
+            self.listing_cache.invalidate()
         except Exception as e:
             print(f"Folder might already exist: {e}")
 
@@ -46,85 +128,97 @@ class PDFEngine:
             
             # 2. Delete the folder itself
             self.supabase.table("folders").delete().eq("name", folder_name).execute()
+            if self.vector_index: self.vector_index.move_folder(folder_name, "General")
+            self.listing_cache.invalidate()
+            self.summary_index.invalidate(folder_name)
+            self.summary_index.invalidate("General")
+            if self.answer_cache:
+                self.answer_cache.invalidate(folder=folder_name)
+                self.answer_cache.invalidate(folder="General")
         except Exception as e:
             print(f"Error deleting folder: {e}")
             raise e
 
     def get_embedding(self, text: str) -> List[float]:
         # Generate vector for text search (Cost: extremely cheap)
-        text = text.replace("\n", " ")
-        return self.openai.embeddings.create(input=[text], model="text-embedding-3-small").data[0].embedding
+        return self.embedder.embed_one(text)
 
     async def process_pdf(self, file_content: bytes, filename: str, folder: str = "General") -> str:
+        """Renders, uploads and indexes every page.
+
+        Text extraction, rendering and image encoding run in the render process pool, one
+        contiguous page range per task, reading the PDF from a temp file. Uploads and embeddings
+        run here as each range comes back; the rows are written in one bulk write at the end.
+        """
+        pdf_path = None
         try:
-            pdf = pdfium.PdfDocument(io.BytesIO(file_content))
-            n_pages = len(pdf)
-            
-            if n_pages > 50: 
-                raise ValueError(f"Page limit exceeded. Max 50 pages allowed.")
+            n_pages = len(pdfium.PdfDocument(file_content))
+            if PDF_MAX_PAGES and n_pages > PDF_MAX_PAGES:
+                raise ValueError(f"Page limit exceeded. Max {PDF_MAX_PAGES} pages allowed.")
 
             doc_id = str(uuid.uuid4())
+            bucket = self.supabase.storage.from_("document-pages")
 
             # Save the ORIGINAL PDF file for the previewer
-            self.supabase.storage.from_("document-pages").upload(
-                file=file_content,
-                path=f"{doc_id}/source.pdf",
-                file_options={"content-type": "application/pdf"}
-            )
+            await asyncio.to_thread(bucket.upload, file=file_content, path=f"{doc_id}/source.pdf", file_options={"content-type": "application/pdf"})
 
             print(f"Processing {filename} ({n_pages} pages)...")
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+                f.write(file_content)
+                pdf_path = f.name
+            loop = asyncio.get_running_loop()
+            pool = _render_pool()
+            ranges = _partition(n_pages, PDF_RENDER_WORKERS)
+            tasks = [loop.run_in_executor(pool, _render_pages, pdf_path, r, filename, PDF_RENDER_SCALE, PDF_RENDER_FORMAT, PDF_RENDER_QUALITY, PDF_THUMB_WIDTH) for r in ranges]
+            uploads = asyncio.Semaphore(PDF_UPLOAD_CONCURRENCY)
+            ext, content_type = _IMAGE_TYPES[PDF_RENDER_FORMAT]
 
-            for i in range(n_pages):
-                page = pdf[i]
-                
-                # A. Extract Text (For the Search Index)
-                text_page = page.get_textpage()
-                extracted_text = text_page.get_text_bounded()
-                
-                if len(extracted_text.strip()) < 10:
-                    extracted_text = f"Image based page {i+1} of document {filename}. Contains visual data."
+            async def upload(path: str, data: bytes):
+                async with uploads: await asyncio.to_thread(bucket.upload, file=data, path=path, file_options={"content-type": content_type})
 
-                # B. Generate Embedding (The "Search Fingerprint")
-                vector = self.get_embedding(extracted_text)
+            async def handle(pages) -> List[dict]:
+                # Embed the range (one batched request) while its images upload
+                texts = [text for _, text, _, _ in pages]
+                transfers = [upload(f"{doc_id}/{i}.{ext}", image) for i, _, image, _ in pages]
+                transfers += [upload(f"{doc_id}/thumbs/{i}.{ext}", thumb) for i, _, _, thumb in pages if thumb]
+                vectors, *_ = await asyncio.gather(asyncio.to_thread(self.embedder.embed, texts), *transfers)
+                rows = []
+                for (i, _, _, _), vector in zip(pages, vectors):
+                    data = {
+                        "document_id": doc_id,
+                        "page_number": i + 1,
+                        "folder": folder,
+                        "image_url": bucket.get_public_url(f"{doc_id}/{i}.{ext}"),
+                        "embedding": vector,
+                        "title": filename
+                    }
+                    if IDEMPOTENT_INGEST: data["chunk_index"] = 0
+                    rows.append(data)
+                return rows
 
-                # C. Render Image (For the Vision AI)
-                bitmap = page.render(scale=1) # High Res
-                pil_image = bitmap.to_pil()
-                
-                # Convert to Bytes
-                img_byte_arr = io.BytesIO()
-                pil_image.save(img_byte_arr, format='JPEG', quality=80)
-                img_bytes = img_byte_arr.getvalue()
-
-                # D. Upload Image to Supabase Storage
-                file_path = f"{doc_id}/{i}.jpg"
-                self.supabase.storage.from_("document-pages").upload(
-                    file=img_bytes,
-                    path=file_path,
-                    file_options={"content-type": "image/jpeg"}
-                )
-
-                public_url = self.supabase.storage.from_("document-pages").get_public_url(file_path)
-
-                # E. Save Metadata to DB Table
-                data = {
-                    "document_id": doc_id,
-                    "page_number": i + 1,
-                    "folder": folder,
-                    "image_url": public_url,
-                    "embedding": vector,
-                    "title": filename
-                }
-                self.supabase.table("document_pages").insert(data).execute()
+            async def rendered(task) -> List[dict]: return await handle(await task)
+            handled = await asyncio.gather(*(rendered(task) for task in tasks))
+            rows = sorted((row for batch in handled for row in batch), key=lambda r: r["page_number"])
+            await asyncio.to_thread(self._write_pages, rows)
 
+            if self.vector_index: self.vector_index.add(folder, rows)
+            if self.answer_cache: self.answer_cache.invalidate(doc_id, folder)
             return doc_id
 
         except Exception as e:
             print(f"Error processing PDF: {e}")
             raise e
+        finally:
+            if pdf_path: os.unlink(pdf_path)
+
+    def _write_pages(self, rows: List[dict]):
+        with BulkWriter(self.supabase, "document_pages", on_conflict=PAGE_UPSERT_KEY if IDEMPOTENT_INGEST else None) as writer:
+            writer.extend(rows)
 
     def get_relevant_folder_pages(self, query: str, folder_name: str) -> List[dict]:
         query_vector = self.get_embedding(query)
+        if self.vector_index and self.vector_index.ready:
+            return self.vector_index.search(query_vector, folder=folder_name, match_count=5, match_threshold=0.25)
         params = {
             "query_embedding": query_vector,
             "match_threshold": 0.25,
@@ -136,6 +230,8 @@ class PDFEngine:
 
     def get_relevant_pages(self, query: str, doc_id: str) -> List[dict]:
         query_vector = self.get_embedding(query)
+        if self.vector_index and self.vector_index.has_document(doc_id):
+            return self.vector_index.search(query_vector, [doc_id], match_count=5, match_threshold=0.25)
         params = {
             "query_embedding": query_vector,
             "match_threshold": 0.25,
@@ -147,15 +243,17 @@ class PDFEngine:
 
     def delete_document(self, doc_id: str):
         self.supabase.table("document_pages").delete().eq("document_id", doc_id).execute()
+        if self.vector_index: self.vector_index.remove_document(doc_id)
+        if self.answer_cache: self.answer_cache.invalidate(doc_id)
         pass
 
     def get_pdf_bytes(self, doc_id: str) -> Optional[bytes]:
-            try:
-                response = self.supabase.storage.from_("document-pages").download(f"{doc_id}/source.pdf")
-                return response
-            except Exception as e:
-                print(f"Error downloading PDF: {e}")
-                return None
+        """The stored source PDF, or None when there is none. Other storage errors are raised."""
+        try: return self.supabase.storage.from_("document-pages").download(f"{doc_id}/source.pdf")
+        except Exception as e:
+            if _is_missing(e): return None
+            print(f"Error downloading PDF: {e}")
+            raise
 
     def get_all_documents(self) -> List[dict]:
         try:
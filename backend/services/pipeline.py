@@ -0,0 +1,88 @@
+import queue
+import threading
+from typing import Callable, Iterable, List, Optional
+
+_DONE = object()
+
+class _Stage:
+    def __init__(self, name: str, fn: Callable, workers: int, flush: Optional[Callable]):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.flush = flush
+        self.finished = 0
+
+class StagePipeline:
+    """Runs items through a chain of stages connected by bounded queues.
+
+    Every stage has its own worker threads, so a slow stage (OCR, embeddings, DB
+    writes) overlaps with the others and wall-clock time tends towards the slowest
+    stage instead of the sum. A stage function takes one item and returns an
+    iterable of items for the next stage (or None). An optional flush() runs once
+    after the stage's last input, for stages that buffer (e.g. batching).
+    The first error stops every stage and is re-raised from run().
+    """
+
+    def __init__(self, queue_size: int = 8):
+        self.queue_size = queue_size
+        self.stages: List[_Stage] = []
+        self._lock = threading.Lock()
+        self._failed = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def add_stage(self, name: str, fn: Callable, workers: int = 1, flush: Optional[Callable] = None) -> "StagePipeline":
+        self.stages.append(_Stage(name, fn, max(1, workers), flush))
+        return self
+
+    def _put(self, q: queue.Queue, item):
+        while not self._failed.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full: continue
+
+    def _get(self, q: queue.Queue):
+        while not self._failed.is_set():
+            try: return q.get(timeout=0.1)
+            except queue.Empty: continue
+        return _DONE
+
+    def _emit(self, out_q: Optional[queue.Queue], results: Optional[Iterable]):
+        if results is None or out_q is None: return
+        for result in results: self._put(out_q, result)
+
+    def _work(self, stage: _Stage, in_q: queue.Queue, out_q: Optional[queue.Queue], next_workers: int):
+        try:
+            while True:
+                item = self._get(in_q)
+                if item is _DONE: break
+                self._emit(out_q, stage.fn(item))
+            if self._failed.is_set(): return
+            with self._lock:
+                stage.finished += 1
+                last = stage.finished == stage.workers
+            if last:
+                # Only the last worker of a stage flushes and tells the next stage to stop
+                if stage.flush: self._emit(out_q, stage.flush())
+                if out_q is not None:
+                    for _ in range(next_workers): self._put(out_q, _DONE)
+        except BaseException as e:
+            print(f"Pipeline stage '{stage.name}' failed: {e}")
+            with self._lock:
+                if self._error is None: self._error = e
+            self._failed.set()
+
+    def run(self, items: Iterable):
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        threads = []
+        for i, stage in enumerate(self.stages):
+            out_q = queues[i + 1] if i + 1 < len(self.stages) else None
+            next_workers = self.stages[i + 1].workers if out_q is not None else 0
+            for w in range(stage.workers):
+                t = threading.Thread(target=self._work, args=(stage, queues[i], out_q, next_workers), name=f"{stage.name}-{w}", daemon=True)
+                t.start()
+                threads.append(t)
+        for item in items: self._put(queues[0], item)
+        for _ in range(self.stages[0].workers): self._put(queues[0], _DONE)
+        for t in threads: t.join()
+        if self._error: raise self._error
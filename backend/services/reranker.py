@@ -0,0 +1,139 @@
+import os
+import json
+import re
+from typing import List
+
+import numpy as np
+
+from services.lexical_index import tokenize
+
+RERANK_MODE = os.environ.get("RERANK_MODE", "local") # "local", "onnx" or "llm"
+RERANK_TOP_K = int(os.environ.get("RERANK_TOP_K", "20"))
+RERANK_ONNX_MODEL = os.environ.get("RERANK_ONNX_MODEL") # directory with model.onnx + tokenizer.json
+RERANK_ONNX_BATCH = 32
+
+_HAS_DIGIT = re.compile(r"\d")
+
+class Reranker:
+    """Orders retrieved chunks by relevance to the query and keeps the best top_k."""
+
+    def __init__(self, top_k: int = RERANK_TOP_K):
+        self.top_k = top_k
+
+    def scores(self, chunks: List[dict], query: str) -> np.ndarray:
+        raise NotImplementedError
+
+    def rerank(self, chunks: List[dict], query: str) -> List[dict]:
+        if not chunks: return []
+        scores = self.scores(chunks, query)
+        order = np.argsort(-scores, kind="stable")[:self.top_k]
+        return [{**chunks[i], "rerank_score": round(float(scores[i]), 4)} for i in order]
+
+def _scale_to_max(values: np.ndarray) -> np.ndarray:
+    # Keeps ratios: min-max would turn a 0.40 vs 0.45 cosine gap into 0 vs 1
+    top = values.max() if len(values) else 0
+    return values / top if top > 0 else np.zeros_like(values)
+
+class LocalReranker(Reranker):
+    """CPU reranker built from signals retrieval already produced.
+
+    Blends the vector similarity of each chunk, its reciprocal-rank-fusion score when
+    hybrid retrieval ran, and an IDF-weighted coverage of the query terms in which
+    numbers / identifiers count double (the answer prompt prioritises those). All
+    scoring after tokenisation is one matrix product over the candidate set.
+    """
+
+    def __init__(self, top_k: int = RERANK_TOP_K, w_vector: float = 0.45, w_lexical: float = 0.4, w_fusion: float = 0.15):
+        super().__init__(top_k)
+        self.w_vector, self.w_lexical, self.w_fusion = w_vector, w_lexical, w_fusion
+
+    def scores(self, chunks: List[dict], query: str) -> np.ndarray:
+        terms = sorted(set(tokenize(query)))
+        similarity = _scale_to_max(np.array([float(c.get("similarity") or 0) for c in chunks], dtype=np.float32))
+        fusion = _scale_to_max(np.array([float(c.get("rrf") or 0) for c in chunks], dtype=np.float32))
+        if not terms: return self.w_vector * similarity + self.w_fusion * fusion
+
+        column = {t: j for j, t in enumerate(terms)}
+        presence = np.zeros((len(chunks), len(terms)), dtype=np.float32)
+        for i, chunk in enumerate(chunks):
+            for token in set(tokenize(chunk.get("content", ""))):
+                j = column.get(token)
+                if j is not None: presence[i, j] = 1.0
+
+        # IDF within the candidate set: terms present in every chunk do not discriminate
+        df = presence.sum(axis=0)
+        idf = np.log1p((len(chunks) - df + 0.5) / (df + 0.5))
+        idf *= np.array([2.0 if _HAS_DIGIT.search(t) else 1.0 for t in terms], dtype=np.float32)
+        lexical = presence @ idf / idf.sum() if idf.sum() > 0 else np.zeros(len(chunks), dtype=np.float32)
+        return self.w_vector * similarity + self.w_lexical * lexical + self.w_fusion * fusion
+
+class OnnxCrossEncoderReranker(Reranker):
+    """Cross-encoder (e.g. an ms-marco MiniLM export) run with onnxruntime, scored in batches.
+
+    Needs the optional onnxruntime and tokenizers packages plus RERANK_ONNX_MODEL.
+    """
+
+    def __init__(self, model_dir: str, top_k: int = RERANK_TOP_K, batch_size: int = RERANK_ONNX_BATCH):
+        super().__init__(top_k)
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        self.session = ort.InferenceSession(os.path.join(model_dir, "model.onnx"), providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=512)
+        self.tokenizer.enable_padding()
+        self.batch_size = batch_size
+
+    def scores(self, chunks: List[dict], query: str) -> np.ndarray:
+        out = []
+        for start in range(0, len(chunks), self.batch_size):
+            batch = chunks[start:start + self.batch_size]
+            encodings = self.tokenizer.encode_batch([(query, c.get("content", "")) for c in batch])
+            feeds = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            logits = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+            out.append(np.asarray(logits, dtype=np.float32).reshape(len(batch), -1)[:, -1])
+        return np.concatenate(out)
+
+class LLMReranker(Reranker):
+    """The original gpt-4o-mini relevance judge; kept as a mode and as the fallback."""
+
+    def __init__(self, ai_service, top_k: int = RERANK_TOP_K):
+        super().__init__(top_k)
+        self.ai_service = ai_service
+
+    def rerank(self, chunks: List[dict], query: str) -> List[dict]:
+        if not chunks: return []
+        chunk_text = ""
+        for i, c in enumerate(chunks):
+            preview = c['content'][:300].replace("\n", " ")
+            chunk_text += f"[ID:{i}] {preview}...\n"
+
+        prompt = (
+            f"You are a Relevance Judge. Select the Top {self.top_k} chunks that help answer the query.\n"
+            "Prioritize chunks with: specific numbers, dates, names, or explanations.\n"
+            "Return JSON: { \"selected_indices\": [0, 4, 12, ...] }"
+        )
+
+        try:
+            response = self.ai_service.get_answer_with_backoff([
+                {"role": "system", "content": prompt},
+                {"role": "user", "content": f"Query: {query}\n\nChunks:\n{chunk_text}"}
+            ])
+            data = json.loads(response.choices[0].message.content)
+            indices = data.get("selected_indices", [])
+            selected_chunks = [chunks[i] for i in indices if 0 <= i < len(chunks)]
+            return selected_chunks if selected_chunks else chunks[:10]
+        except: return chunks[:15]
+
+def build_reranker(ai_service, mode: str = RERANK_MODE) -> Reranker:
+    if mode == "llm": return LLMReranker(ai_service)
+    if mode == "onnx":
+        try:
+            if not RERANK_ONNX_MODEL: raise ValueError("RERANK_ONNX_MODEL is not set")
+            return OnnxCrossEncoderReranker(RERANK_ONNX_MODEL)
+        except Exception as e: print(f"ONNX reranker unavailable, using local scorer: {e}")
+    return LocalReranker()
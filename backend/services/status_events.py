@@ -0,0 +1,75 @@
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Optional, Set
+
+STATUS_SUBSCRIBER_QUEUE = int(os.environ.get("STATUS_SUBSCRIBER_QUEUE", "100"))
+STATUS_HEARTBEAT = float(os.environ.get("STATUS_HEARTBEAT", "15"))
+STATUS_RETAIN = 500 # Latest event kept for this many recent documents, replayed to new subscribers
+
+class _Subscriber:
+    def __init__(self, loop: asyncio.AbstractEventLoop, doc_id: Optional[str]):
+        self.loop = loop
+        self.doc_id = doc_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=STATUS_SUBSCRIBER_QUEUE)
+
+    def offer(self, event: dict):
+        # Runs on the subscriber's loop. A slow client loses its oldest events, never the newest.
+        if self.queue.full(): self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+class StatusBroadcaster:
+    """In-process fan-out of ingestion progress events.
+
+    Ingestion threads publish(); every subscriber (an SSE connection) gets the event on its
+    own bounded queue, and the latest event per document is retained so a new subscriber
+    sees current progress at once. Nothing here touches the database.
+    """
+
+    def __init__(self):
+        self.latest: "OrderedDict[str, dict]" = OrderedDict()
+        self._subscribers: Set[_Subscriber] = set()
+        self._lock = threading.Lock()
+
+    def publish(self, doc_id: str, **fields):
+        with self._lock:
+            event = {**self.latest.get(doc_id, {}), **fields, "doc_id": doc_id, "ts": time.time()}
+            self.latest[doc_id] = event
+            self.latest.move_to_end(doc_id)
+            while len(self.latest) > STATUS_RETAIN: self.latest.popitem(last=False)
+            targets = [s for s in self._subscribers if s.doc_id is None or s.doc_id == doc_id]
+        for subscriber in targets:
+            try: subscriber.loop.call_soon_threadsafe(subscriber.offer, event)
+            except RuntimeError: pass # Loop already closed; the subscriber is going away
+
+    def forget(self, doc_id: str):
+        with self._lock: self.latest.pop(doc_id, None)
+
+    async def subscribe(self, doc_id: Optional[str] = None) -> AsyncIterator[Optional[dict]]:
+        """Yields the retained state, then live events; None every STATUS_HEARTBEAT seconds of silence."""
+        subscriber = _Subscriber(asyncio.get_running_loop(), doc_id)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            retained = [e for d, e in self.latest.items() if doc_id is None or d == doc_id]
+        try:
+            for event in retained: yield event
+            while True:
+                try: yield await asyncio.wait_for(subscriber.queue.get(), STATUS_HEARTBEAT)
+                except asyncio.TimeoutError: yield None
+        finally:
+            with self._lock: self._subscribers.discard(subscriber)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock: return {"subscribers": len(self._subscribers), "tracked_documents": len(self.latest)}
+
+_shared: Optional[StatusBroadcaster] = None
+_shared_lock = threading.Lock()
+
+def shared_status_events() -> StatusBroadcaster:
+    """The process-wide broadcaster shared by the ingestion pipeline and the SSE endpoint."""
+    global _shared
+    with _shared_lock:
+        if _shared is None: _shared = StatusBroadcaster()
+        return _shared
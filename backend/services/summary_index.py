@@ -0,0 +1,139 @@
+import os
+import re
+import time
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.answer_cache import fingerprint as files_fingerprint
+from services.vector_index import _as_vector, _normalize
+
+SUMMARY_INDEX_TTL = float(os.environ.get("SUMMARY_INDEX_TTL", "300")) # Reload a folder after this, to see other workers' ingests
+SUMMARY_PRESELECT = int(os.environ.get("SUMMARY_PRESELECT", "20")) # Deep mode: candidates shown to the file-selection prompt
+SUMMARY_FAST_TOP = int(os.environ.get("SUMMARY_FAST_TOP", "8")) # Fast mode: full summaries sent to the answer prompt
+SUMMARY_BACKFILL = os.environ.get("SUMMARY_BACKFILL", "1") == "1" # Embed summaries of older documents in the background at startup
+
+_FIELD = re.compile(r"\[(TAG|DESC|DETAILED)\]\**:\s*", re.IGNORECASE)
+
+def parse_summary(text: Optional[str]) -> Dict[str, str]:
+    """Splits a "[TAG]: .. [DESC]: .. [DETAILED]: .." summary into tag / desc / detailed.
+
+    Also accepts the stored documents.summary form ("**Content Summary:** ... ---_SEPARATOR_---").
+    A summary that ignored the format is kept whole as the detailed field.
+    """
+    text = (text or "").split("---_SEPARATOR_---")[0].replace("**Content Summary:**", "").strip()
+    parts = _FIELD.split(text)
+    fields = {"tag": "", "desc": "", "detailed": "" if len(parts) > 1 else text}
+    for name, value in zip(parts[1::2], parts[2::2]): fields[name.lower()] = value.strip(" \n*")
+    fields["tag"] = fields["tag"].split()[0].upper() if fields["tag"] else "OTHER"
+    return fields
+
+def summary_text(fields: Dict[str, str]) -> str:
+    """What gets embedded: the one-line description plus the dense detailed summary."""
+    return f"{fields['desc']}\n{fields['detailed']}".strip()
+
+def summary_columns(fields: Dict[str, str], vector: List[float]) -> dict:
+    return {"summary_tag": fields["tag"], "summary_desc": fields["desc"], "summary_detailed": fields["detailed"], "summary_embedding": vector}
+
+def summary_entry(row: dict) -> dict:
+    """Index entry from a documents row carrying the summary_* columns."""
+    tag, desc, detailed = row.get("summary_tag") or "OTHER", row.get("summary_desc") or "", row.get("summary_detailed") or ""
+    return {
+        "id": row["id"], "title": row.get("title") or "", "tag": tag, "desc": desc, "detailed": detailed,
+        "summary": f"[TAG]: {tag}\n[DESC]: {desc}\n[DETAILED]: {detailed}",
+        "vector": row.get("summary_embedding"),
+    }
+
+class _FolderSummaries:
+    def __init__(self, entries: List[dict]):
+        self.loaded_at = time.time()
+        self.entries = [{k: v for k, v in e.items() if k != "vector"} for e in entries]
+        vectors = [_as_vector(e["vector"]) if e.get("vector") is not None else None for e in entries]
+        vectors = [v if v is not None and v.size else None for v in vectors]
+        # Documents still waiting for the summary backfill get a zero row: they rank last instead of disappearing
+        dim = next((len(v) for v in vectors if v is not None), 0)
+        matrix = np.stack([v if v is not None else np.zeros(dim, dtype=np.float32) for v in vectors]) if vectors else np.zeros((0, 0), dtype=np.float32)
+        self.matrix = _normalize(matrix)
+        self.fingerprint = files_fingerprint(self.entries)
+
+class SummaryIndex:
+    """Per-folder matrix of document summary embeddings, used to preselect files for folder chat.
+
+    A folder is loaded on first use through the caller's `load` (one documents query) and then
+    kept current by ingestion and deletes, so a chat costs one matrix product instead of
+    re-reading every summary. Entries older than `ttl` are reloaded, which is how changes made
+    by other worker processes show up.
+    """
+
+    def __init__(self, ttl: float = SUMMARY_INDEX_TTL):
+        self.ttl = ttl
+        self.folders: Dict[str, _FolderSummaries] = {}
+        self._lock = threading.Lock()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._generation = 0 # Bumped by every change; a load that overlapped one is used once but not kept
+
+    def _folder(self, name: str, load: Callable[[str], List[dict]]) -> _FolderSummaries:
+        with self._lock:
+            index = self.folders.get(name)
+            if index and time.time() - index.loaded_at < self.ttl: return index
+            loading = self._loading.setdefault(name, threading.Lock())
+        with loading: # One load per folder; concurrent chats wait for it
+            with self._lock:
+                index = self.folders.get(name)
+                if index and time.time() - index.loaded_at < self.ttl: return index
+                generation = self._generation
+            index = _FolderSummaries(load(name))
+            with self._lock:
+                if generation == self._generation: self.folders[name] = index
+            return index
+
+    def search(self, folder: str, query_vector: List[float], limit: int, load: Callable[[str], List[dict]]) -> Tuple[List[dict], str]:
+        """Top `limit` files by summary similarity, plus the fingerprint of the whole folder."""
+        index = self._folder(folder, load)
+        if not index.entries: return [], index.fingerprint
+        query = _normalize(_as_vector(query_vector)[None, :])[0]
+        scores = index.matrix @ query if index.matrix.shape[1] else np.zeros(len(index.entries), dtype=np.float32)
+        top = np.argsort(-scores)[:limit]
+        return [{**index.entries[i], "similarity": float(scores[i])} for i in top], index.fingerprint
+
+    def add(self, folder: str, entry: dict):
+        """Adds or replaces one document; a folder that is not loaded yet will pick it up when it is."""
+        with self._lock:
+            self._generation += 1
+            index = self.folders.get(folder)
+            if index is None or entry.get("vector") is None: return
+            kept = [i for i, e in enumerate(index.entries) if e["id"] != entry["id"]]
+            entries = [{**index.entries[i], "vector": index.matrix[i]} for i in kept] + [entry]
+            fresh = _FolderSummaries(entries)
+            fresh.loaded_at = index.loaded_at
+            self.folders[folder] = fresh
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            self._generation += 1
+            for name, index in list(self.folders.items()):
+                kept = [i for i, e in enumerate(index.entries) if e["id"] != doc_id]
+                if len(kept) == len(index.entries): continue
+                fresh = _FolderSummaries([{**index.entries[i], "vector": index.matrix[i]} for i in kept])
+                fresh.loaded_at = index.loaded_at
+                self.folders[name] = fresh
+
+    def invalidate(self, folder: Optional[str] = None):
+        with self._lock:
+            self._generation += 1
+            if folder is None: self.folders.clear()
+            else: self.folders.pop(folder, None)
+
+    def stats(self) -> dict:
+        with self._lock: return {"folders": len(self.folders), "documents": sum(len(f.entries) for f in self.folders.values())}
+
+_shared: Optional[SummaryIndex] = None
+_shared_lock = threading.Lock()
+
+def shared_summary_index() -> SummaryIndex:
+    """The process-wide summary index shared by ingestion, folder deletes and folder chat."""
+    global _shared
+    with _shared_lock:
+        if _shared is None: _shared = SummaryIndex()
+        return _shared
@@ -0,0 +1,171 @@
+import os
+import hashlib
+import tempfile
+import threading
+from typing import BinaryIO, Dict, Optional, Tuple, Union
+
+from python_multipart.exceptions import FormParserError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+UPLOAD_SPOOL_DIR = os.environ.get("UPLOAD_SPOOL_DIR") or None # None = the system temp dir
+UPLOAD_MAX_INFLIGHT_BYTES = int(os.environ.get("UPLOAD_MAX_INFLIGHT_BYTES", str(512 * 1024 * 1024)))
+UPLOAD_MAX_FIELD_BYTES = 64 * 1024 # Text fields next to the file (folder) are kept in memory
+
+class UploadBudgetError(Exception):
+    pass
+
+class UploadFormError(Exception):
+    pass
+
+class SpooledUpload:
+    """An uploaded file on local disk, with its sha256 computed while it streamed in.
+
+    Holds its bytes against the spooler's budget until release(), which also deletes the file.
+    """
+
+    def __init__(self, spooler: "UploadSpooler", path: str, size: int, sha256: str, filename: str = ""):
+        self.spooler = spooler
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.filename = filename
+        self._released = False
+
+    def open(self) -> BinaryIO:
+        return open(self.path, "rb")
+
+    def release(self):
+        if self._released: return
+        self._released = True
+        try: os.remove(self.path)
+        except OSError: pass
+        self.spooler._give_back(self.size)
+
+class _FormReader:
+    """python-multipart callbacks: the file field is written to `out` and hashed, other fields collected as text."""
+
+    def __init__(self, file_field: str, out: BinaryIO):
+        self.file_field = file_field
+        self.out = out
+        self.digest, self.size = hashlib.sha256(), 0
+        self.filename: Optional[str] = None
+        self.fields: Dict[str, str] = {}
+        self._field_bytes = 0
+        self._header, self._value, self._disposition = b"", b"", b""
+        self._name, self._data, self._is_file = "", [], False
+        self.complete = False # The closing boundary arrived
+
+    def on_part_begin(self): self._disposition, self._data, self._is_file = b"", [], False
+    def on_header_field(self, data: bytes, start: int, end: int): self._header += data[start:end]
+    def on_header_value(self, data: bytes, start: int, end: int): self._value += data[start:end]
+
+    def on_header_end(self):
+        if self._header.lower() == b"content-disposition": self._disposition = self._value
+        self._header, self._value = b"", b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        self._name = options.get(b"name", b"").decode("utf-8", "replace")
+        self._is_file = self._name == self.file_field and b"filename" in options
+        if not self._is_file: return
+        if self.filename is not None: raise UploadFormError("Only one file per upload")
+        self.filename = options[b"filename"].decode("utf-8", "replace")
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        chunk = data[start:end]
+        if self._is_file:
+            self.digest.update(chunk)
+            self.out.write(chunk)
+            self.size += len(chunk)
+            return
+        self._field_bytes += len(chunk)
+        if self._field_bytes > UPLOAD_MAX_FIELD_BYTES: raise UploadFormError("Form fields too large")
+        self._data.append(chunk)
+
+    def on_part_end(self):
+        if not self._is_file: self.fields[self._name] = b"".join(self._data).decode("utf-8", "replace")
+
+    def on_end(self): self.complete = True
+
+    def callbacks(self) -> dict:
+        names = ("on_part_begin", "on_header_field", "on_header_value", "on_header_end", "on_headers_finished", "on_part_data", "on_part_end", "on_end")
+        return {name: getattr(self, name) for name in names}
+
+# What the engine accepts as a source PDF: raw bytes (resumed from storage) or a spooled upload
+Source = Union[bytes, SpooledUpload]
+
+class UploadSpooler:
+    """Streams uploads to temp files under a per-worker cap on bytes held at once.
+
+    An upload's declared Content-Length (or, without one, each chunk as it arrives) is reserved
+    up front, so an upload that would push the total over max_bytes fails fast with
+    UploadBudgetError instead of filling the disk.
+    The reservation lasts until the ingestion job releases its SpooledUpload.
+    """
+
+    def __init__(self, max_bytes: int = UPLOAD_MAX_INFLIGHT_BYTES, directory: Optional[str] = UPLOAD_SPOOL_DIR):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.inflight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        if directory: os.makedirs(directory, exist_ok=True)
+
+    def _reserve(self, n: int) -> bool:
+        with self._lock:
+            if self.inflight + n > self.max_bytes: return False
+            self.inflight += n
+            return True
+
+    def _give_back(self, n: int):
+        with self._lock: self.inflight -= n
+
+    def _reserve_or_refuse(self, n: int):
+        if self._reserve(n): return
+        self.rejected += 1
+        raise UploadBudgetError("Too many uploads in progress, try again shortly.")
+
+    async def spool_form(self, request, file_field: str = "file") -> Tuple[SpooledUpload, Dict[str, str]]:
+        """Streams a multipart/form-data request body: the file straight into a spool file, hashed as it
+        goes (never held in memory, never copied from a framework temp file), other fields into a dict.
+
+        A Content-Length over the budget is refused before any of the body is read; uploads without
+        one (chunked) reserve bytes as they arrive instead.
+        """
+        content_type, options = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in options: raise UploadFormError("Expected a multipart/form-data upload")
+        declared = request.headers.get("content-length", "")
+        reserved = int(declared) if declared.isdigit() else 0
+        self._reserve_or_refuse(reserved)
+        fd, path = tempfile.mkstemp(suffix=".pdf", prefix="upload-", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                reader, received = _FormReader(file_field, out), 0
+                parser = MultipartParser(options[b"boundary"], reader.callbacks())
+                async for chunk in request.stream():
+                    received += len(chunk)
+                    if received > reserved:
+                        self._reserve_or_refuse(received - reserved)
+                        reserved = received
+                    parser.write(chunk)
+                parser.finalize()
+            if not reader.complete: raise UploadFormError("Malformed upload: the body ended early")
+            if reader.filename is None: raise UploadFormError("No file in the upload")
+        except FormParserError as e:
+            self._give_back(reserved)
+            self._remove(path)
+            raise UploadFormError(f"Malformed upload: {e}")
+        except BaseException:
+            self._give_back(reserved)
+            self._remove(path)
+            raise
+        self._give_back(reserved - reader.size) # Keep holding only the file's bytes until release()
+        return SpooledUpload(self, path, reader.size, reader.digest.hexdigest(), reader.filename), reader.fields
+
+    @staticmethod
+    def _remove(path: str):
+        try: os.remove(path)
+        except OSError: pass
+
+    def stats(self) -> dict:
+        with self._lock: return {"inflight_bytes": self.inflight, "max_bytes": self.max_bytes, "rejected": self.rejected}
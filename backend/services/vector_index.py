@@ -0,0 +1,280 @@
+import os
+import json
+import uuid
+import hashlib
+import shutil
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from services.lexical_index import chunk_key
+
+LOCAL_VECTOR_INDEX = os.environ.get("LOCAL_VECTOR_INDEX", "0") == "1"
+VECTOR_INDEX_DIR = os.environ.get("VECTOR_INDEX_DIR") or os.path.join(tempfile.gettempdir(), "vector_index")
+VECTOR_INDEX_MODE = os.environ.get("VECTOR_INDEX_MODE", "exact") # "exact" or "ivf"
+IVF_MIN_ROWS = 20000 # Below this, exact search is already fast enough
+IVF_NPROBE = int(os.environ.get("VECTOR_INDEX_NPROBE", "8"))
+COMPACT_AFTER = 5000 # Pending rows / tombstones before a folder is rewritten to disk
+REBUILD_PAGE_SIZE = 1000
+
+# Columns kept next to each vector so search results can stand in for the RPC rows
+META_COLUMNS = ["id", "document_id", "page_number", "content", "bboxes", "image_url", "title"]
+
+def _as_vector(value) -> np.ndarray:
+    # PostgREST returns pgvector columns as '[0.1,0.2,...]' strings
+    if isinstance(value, str): value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+def _process_alive(pid: int) -> bool:
+    try: os.kill(pid, 0)
+    except ProcessLookupError: return False
+    except OSError: pass # Exists, owned by someone else
+    return True
+
+def _remove_stale(root: str):
+    """Deletes index directories left behind by worker processes that are gone."""
+    if not os.path.isdir(root): return
+    for entry in os.scandir(root):
+        pid = entry.name.split("-", 1)[0]
+        if entry.is_dir() and pid.isdigit() and int(pid) != os.getpid() and not _process_alive(int(pid)):
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+def _kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), size=min(len(vectors), k * 40), replace=False)]
+    centroids = sample[rng.choice(len(sample), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(k):
+            members = sample[assign == c]
+            if len(members): centroids[c] = members.mean(axis=0)
+        centroids = _normalize(centroids)
+    return centroids
+
+class _FolderIndex:
+    """Vectors of one folder: a memory-mapped base matrix on disk plus an in-memory delta.
+
+    Rows are never removed in place; deletes are tombstoned and dropped on compaction.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.base = np.zeros((0, 0), dtype=np.float32)
+        self.delta: List[np.ndarray] = []
+        self.meta: List[dict] = []
+        self.dead = set()
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: Optional[List[np.ndarray]] = None
+
+    def __len__(self): return len(self.meta)
+
+    def pending(self) -> int: return len(self.delta) + len(self.dead)
+
+    def matrix_rows(self, positions: np.ndarray) -> np.ndarray:
+        """Vectors at the given (ascending) positions, reading only those rows from the mmap."""
+        n_base = len(self.base)
+        in_base, in_delta = positions[positions < n_base], positions[positions >= n_base] - n_base
+        parts = []
+        if len(in_base): parts.append(np.asarray(self.base[in_base]))
+        if len(in_delta): parts.append(np.stack([self.delta[i] for i in in_delta]))
+        return np.concatenate(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+
+    def add(self, vectors: np.ndarray, meta: List[dict]):
+        self.delta.extend(_normalize(vectors))
+        self.meta.extend(meta)
+
+    def candidates(self, query: np.ndarray) -> np.ndarray:
+        """Row positions worth scoring: IVF-probed base rows plus every delta row, or everything."""
+        n_base = len(self.base)
+        if self.centroids is None or self.lists is None:
+            positions = np.arange(len(self.meta))
+        else:
+            probe = np.argsort(-(self.centroids @ query))[:IVF_NPROBE]
+            positions = np.concatenate([self.lists[p] for p in probe] + [np.arange(n_base, len(self.meta))])
+        if self.dead: positions = positions[~np.isin(positions, list(self.dead))]
+        return positions
+
+    def compact(self, mode: str):
+        alive = [i for i in range(len(self.meta)) if i not in self.dead]
+        matrix = self.matrix_rows(np.asarray(alive, dtype=np.int64)) if alive else np.zeros((0, 0), dtype=np.float32)
+        meta = [self.meta[i] for i in alive]
+        os.makedirs(self.path, exist_ok=True)
+        tmp = self.path + ".tmp"
+        os.makedirs(tmp, exist_ok=True)
+        np.save(os.path.join(tmp, "vectors.npy"), matrix)
+        with open(os.path.join(tmp, "meta.json"), "w") as f: json.dump(meta, f)
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(tmp, self.path)
+        self.base = np.load(os.path.join(self.path, "vectors.npy"), mmap_mode="r")
+        self.delta, self.meta, self.dead = [], meta, set()
+        self.centroids, self.lists = None, None
+        if mode == "ivf" and len(self.base) >= IVF_MIN_ROWS:
+            self.centroids = _kmeans(np.asarray(self.base), int(np.sqrt(len(self.base))))
+            assign = np.argmax(self.base @ self.centroids.T, axis=1)
+            self.lists = [np.flatnonzero(assign == c) for c in range(len(self.centroids))]
+
+class LocalVectorIndex:
+    """Optional in-process vector index over document_pages, one matrix per folder.
+
+    Supabase stays the source of truth: the index is rebuilt from document_pages on
+    startup and kept current by the ingest / delete paths of this process. Documents
+    it does not know about are reported as missing so callers can fall back to the RPC.
+
+    Files live in a directory of their own per process and rebuild ("<pid>-<hex>" under
+    root), so worker processes sharing VECTOR_INDEX_DIR never map each other's matrices.
+    """
+
+    def __init__(self, root: str = VECTOR_INDEX_DIR, mode: str = VECTOR_INDEX_MODE):
+        self.root = root
+        self.directory = os.path.join(root, f"{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        self.mode = mode
+        self.ready = False
+        self.folders: Dict[str, _FolderIndex] = {}
+        self.doc_folder: Dict[str, str] = {}
+        self.doc_rows: Dict[str, List[int]] = {}
+        self._journal: Optional[List[tuple]] = None # Adds / removes / moves seen while rebuild() runs
+        self._lock = threading.RLock()
+
+    def _folder(self, name: str) -> _FolderIndex:
+        if name not in self.folders:
+            self.folders[name] = _FolderIndex(os.path.join(self.directory, hashlib.sha1(name.encode("utf-8")).hexdigest()[:16]))
+        return self.folders[name]
+
+    def has_document(self, doc_id: str) -> bool:
+        return self.ready and doc_id in self.doc_folder
+
+    def add(self, folder: str, rows: List[dict]):
+        """rows are document_pages rows including 'embedding'."""
+        with self._lock:
+            if self._journal is not None: self._journal.append(("add", folder, rows))
+            self._add(folder, rows)
+
+    def _add(self, folder: str, rows: List[dict]):
+        if not rows: return
+        with self._lock:
+            index = self._folder(folder)
+            start = len(index)
+            index.add(np.stack([_as_vector(r["embedding"]) for r in rows]), [{k: r.get(k) for k in META_COLUMNS} for r in rows])
+            for pos, row in enumerate(rows, start):
+                doc_id = str(row["document_id"])
+                self.doc_folder[doc_id] = folder
+                self.doc_rows.setdefault(doc_id, []).append(pos)
+            if index.pending() >= COMPACT_AFTER: self._compact(folder)
+
+    def remove_document(self, doc_id: str):
+        with self._lock:
+            if self._journal is not None: self._journal.append(("remove", doc_id))
+            folder = self.doc_folder.pop(doc_id, None)
+            positions = self.doc_rows.pop(doc_id, [])
+            if folder is None: return
+            index = self.folders[folder]
+            index.dead.update(positions)
+            if index.pending() >= COMPACT_AFTER: self._compact(folder)
+
+    def move_folder(self, old: str, new: str):
+        with self._lock:
+            if self._journal is not None: self._journal.append(("move", old, new))
+            if old not in self.folders: return
+            source = self.folders[old]
+            alive = [i for i in range(len(source)) if i not in source.dead]
+            if alive:
+                rows = [dict(source.meta[i]) for i in alive]
+                vectors = source.matrix_rows(np.asarray(alive, dtype=np.int64))
+                for row, vector in zip(rows, vectors): row["embedding"] = vector
+                for doc_id in {str(r["document_id"]) for r in rows}: self.doc_rows.pop(doc_id, None)
+                self._add(new, rows)
+            shutil.rmtree(source.path, ignore_errors=True)
+            del self.folders[old]
+
+    def _compact(self, folder: str):
+        index = self.folders[folder]
+        index.compact(self.mode)
+        for doc_id in [d for d, f in self.doc_folder.items() if f == folder]: self.doc_rows[doc_id] = []
+        for pos, meta in enumerate(index.meta): self.doc_rows[str(meta["document_id"])].append(pos)
+
+    def search(self, query_vector: List[float], doc_ids: Optional[List[str]] = None, folder: Optional[str] = None,
+               match_count: int = 45, match_threshold: float = 0.0, per_doc_limit: Optional[int] = None) -> List[dict]:
+        """Exact (or IVF-probed) cosine search, scoped to documents and/or a folder."""
+        query = _normalize(_as_vector(query_vector)[None, :])[0]
+        with self._lock:
+            if doc_ids is not None:
+                # One target per document, so per_doc_limit caps each document's share
+                targets = [(self.folders[self.doc_folder[d]], np.asarray(self.doc_rows.get(d, []), dtype=np.int64))
+                           for d in doc_ids if d in self.doc_folder and (folder is None or self.doc_folder[d] == folder)]
+            else:
+                names = [folder] if folder is not None else list(self.folders)
+                targets = [(self.folders[f], self.folders[f].candidates(query)) for f in names if f in self.folders]
+            limit = min(match_count, per_doc_limit or match_count)
+
+            results = []
+            for index, positions in targets:
+                if not len(positions): continue
+                positions = np.sort(positions)
+                scores = index.matrix_rows(positions) @ query
+                keep = np.flatnonzero(scores > match_threshold)
+                top = keep[np.argsort(-scores[keep])[:limit if doc_ids is not None else match_count]]
+                results.extend({**index.meta[positions[i]], "similarity": float(scores[i])} for i in top)
+        results.sort(key=lambda r: r["similarity"], reverse=True)
+        return results[:match_count]
+
+    def _replay(self, journal: List[tuple]):
+        # Ingests and deletes that ran during a rebuild scan may be missing from (or stale in) the pages read
+        for op, *args in journal:
+            if op == "remove": self.remove_document(*args)
+            elif op == "move": self.move_folder(*args)
+            else:
+                folder, rows = args
+                known = {chunk_key(self.folders[self.doc_folder[d]].meta[p]) for d in {str(r["document_id"]) for r in rows}
+                         if d in self.doc_folder for p in self.doc_rows.get(d, [])}
+                self._add(folder, [r for r in rows if chunk_key(r) not in known])
+
+    def rebuild(self, supabase):
+        """Reloads every folder from document_pages and writes the memory-mapped files."""
+        _remove_stale(self.root)
+        fresh = LocalVectorIndex(self.root, self.mode)
+        with self._lock: self._journal = []
+        try:
+            start = 0
+            while True:
+                res = supabase.table("document_pages")\
+                    .select(", ".join(META_COLUMNS + ["folder", "embedding"]))\
+                    .order("id")\
+                    .range(start, start + REBUILD_PAGE_SIZE - 1)\
+                    .execute()
+                rows = [r for r in (res.data or []) if r.get("embedding")]
+                by_folder: Dict[str, List[dict]] = {}
+                for row in rows: by_folder.setdefault(row.get("folder") or "General", []).append(row)
+                for folder, folder_rows in by_folder.items(): fresh.add(folder, folder_rows)
+                if len(res.data or []) < REBUILD_PAGE_SIZE: break
+                start += REBUILD_PAGE_SIZE
+            for folder in fresh.folders: fresh._compact(folder)
+            with self._lock:
+                fresh._replay(self._journal)
+                old_directory = self.directory
+                self.folders, self.doc_folder, self.doc_rows, self.directory = fresh.folders, fresh.doc_folder, fresh.doc_rows, fresh.directory
+                self.ready = True
+            shutil.rmtree(old_directory, ignore_errors=True) # Open memory maps of the old files stay valid
+        finally:
+            with self._lock: self._journal = None
+        print(f"Local vector index ready: {sum(len(f) for f in self.folders.values())} rows in {len(self.folders)} folders")
+
+    def start_rebuild(self, supabase):
+        def run():
+            try: self.rebuild(supabase)
+            except Exception as e: print(f"Local vector index rebuild failed, using Supabase search: {e}")
+        threading.Thread(target=run, name="vector-index-rebuild", daemon=True).start()
+
+_shared: Optional[LocalVectorIndex] = None
+
+def shared_vector_index() -> Optional[LocalVectorIndex]:
+    """The process-wide index, or None when LOCAL_VECTOR_INDEX is off."""
+    global _shared
+    if LOCAL_VECTOR_INDEX and _shared is None: _shared = LocalVectorIndex()
+    return _shared
@@ -0,0 +1,6 @@
+-- Idempotent ingestion: lets BulkWriter upsert document_pages rows on
+-- (document_id, page_number, chunk_index) when IDEMPOTENT_INGEST=1.
+alter table document_pages add column if not exists chunk_index integer;
+
+create unique index if not exists document_pages_chunk_key
+    on document_pages (document_id, page_number, chunk_index);
@@ -0,0 +1,8 @@
+-- Restart-safe ingestion jobs: IngestionQueue records the last completed stage
+-- (queued -> stored -> ocr -> indexed -> done) so retries resume from there.
+alter table documents add column if not exists ingest_stage text default 'queued';
+alter table documents add column if not exists ingest_attempts integer not null default 0;
+alter table documents add column if not exists ingest_error text;
+
+-- Rows that predate staged ingestion are complete
+update documents set ingest_stage = 'done' where status = 'ready' and ingest_stage = 'queued';
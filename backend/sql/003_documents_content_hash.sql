@@ -0,0 +1,6 @@
+-- Content-hash deduplication: documents remember the SHA-256 of their source so
+-- ingestion can reuse cached OCR / chunk embeddings / summary (see IngestCache).
+alter table documents add column if not exists content_hash text;
+alter table documents add column if not exists cache_hit boolean not null default false;
+
+create index if not exists documents_content_hash_idx on documents (content_hash);
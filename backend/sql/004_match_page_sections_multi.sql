@@ -0,0 +1,41 @@
+-- Folder deep mode: one vector search across several documents, returning the
+-- merged top match_count chunks with at most per_doc_limit chunks per document.
+create or replace function match_page_sections_multi(
+    query_embedding vector(1536),
+    match_threshold float,
+    match_count int,
+    filter_doc_ids text[] default null,
+    filter_folder text default null,
+    per_doc_limit int default 20
+)
+returns table (
+    id text,
+    document_id text,
+    title text,
+    content text,
+    page_number int,
+    bboxes jsonb,
+    similarity float
+)
+language sql stable
+as $$
+    select id, document_id, title, content, page_number, bboxes, similarity
+    from (
+        select
+            dp.id::text as id,
+            dp.document_id::text as document_id,
+            dp.title,
+            dp.content,
+            dp.page_number,
+            to_jsonb(dp.bboxes) as bboxes,
+            1 - (dp.embedding <=> query_embedding) as similarity,
+            row_number() over (partition by dp.document_id order by dp.embedding <=> query_embedding) as doc_rank
+        from document_pages dp
+        where (filter_doc_ids is null or dp.document_id::text = any(filter_doc_ids))
+          and (filter_folder is null or dp.folder = filter_folder)
+          and 1 - (dp.embedding <=> query_embedding) > match_threshold
+    ) ranked
+    where doc_rank <= per_doc_limit
+    order by similarity desc
+    limit match_count;
+$$;
@@ -0,0 +1,4 @@
+-- Keyset pagination for /documents: newest first on (created_at, id), optionally
+-- filtered by folder (see MistralEngine.get_documents).
+create index if not exists documents_created_at_id_idx on documents (created_at desc, id desc);
+create index if not exists documents_folder_created_at_id_idx on documents (folder, created_at desc, id desc);
@@ -0,0 +1,9 @@
+-- Structured, embedded document summaries for folder chat (see services/summary_index.py).
+-- The [TAG] / [DESC] / [DETAILED] fields are parsed once at ingestion and DESC + DETAILED
+-- is embedded, so file selection ranks summaries by similarity instead of prompting with all
+-- of them. Rows ingested earlier are embedded by a background backfill at startup
+-- (MistralEngine.backfill_summaries, SUMMARY_BACKFILL=1).
+alter table documents add column if not exists summary_tag text;
+alter table documents add column if not exists summary_desc text;
+alter table documents add column if not exists summary_detailed text;
+alter table documents add column if not exists summary_embedding vector(1536);
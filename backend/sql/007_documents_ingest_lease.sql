@@ -0,0 +1,8 @@
+-- Ingestion leases: the worker process that owns a 'processing' document refreshes
+-- ingest_heartbeat every INGEST_HEARTBEAT_SECONDS, and IngestionQueue.recover() only
+-- reclaims documents whose heartbeat is older than INGEST_LEASE_SECONDS. The default
+-- gives jobs already in flight (and rows inserted by older workers) one lease period.
+alter table documents add column if not exists ingest_owner text;
+alter table documents add column if not exists ingest_heartbeat timestamptz default now();
+
+create index if not exists documents_processing_heartbeat_idx on documents (ingest_heartbeat) where status = 'processing';
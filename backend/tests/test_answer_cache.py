@@ -0,0 +1,91 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from services import answer_cache as answer_cache_module
+from services.answer_cache import AnswerCache, fingerprint
+
+ANSWER = {"answer": "Revenue grew 12%.", "citations": []}
+
+def test_hits_need_the_same_scope_fingerprint_and_a_similar_question():
+    cache = AnswerCache(threshold=0.95)
+    cache.put("doc:a", "a:v1", [1.0, 0.0], ANSWER, ["a"])
+    assert cache.get("doc:a", "a:v1", [0.99, 0.05]) == ANSWER
+    assert cache.get("doc:a", "a:v1", [0.6, 0.8]) is None # A different question
+    assert cache.get("doc:a", "a:v2", [1.0, 0.0]) is None # The document changed since
+    assert cache.get("doc:b", "a:v1", [1.0, 0.0]) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 3
+
+def test_invalidation_by_document_and_folder():
+    cache = AnswerCache()
+    cache.put("doc:a", "a:v1", [1.0, 0.0], ANSWER, ["a"])
+    cache.put("folder:Reports:deep", "f", [1.0, 0.0], ANSWER, ["a", "b"])
+    cache.put("folder:Reports:fast", "f", [1.0, 0.0], ANSWER, ["c"])
+    cache.put("folder:Other:fast", "g", [1.0, 0.0], ANSWER, ["d"])
+    cache.invalidate("b")
+    assert cache.get("folder:Reports:deep", "f", [1.0, 0.0]) is None and cache.get("doc:a", "a:v1", [1.0, 0.0])
+    cache.invalidate(folder="Reports")
+    assert cache.get("folder:Reports:fast", "f", [1.0, 0.0]) is None and cache.get("folder:Other:fast", "g", [1.0, 0.0])
+    assert cache.stats()["invalidations"] == 2
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache_module.time, "time", lambda: now[0])
+    cache = AnswerCache(ttl=60)
+    cache.put("doc:a", "a:v1", [1.0, 0.0], ANSWER, ["a"])
+    now[0] += 59
+    assert cache.get("doc:a", "a:v1", [1.0, 0.0])
+    now[0] += 2
+    assert cache.get("doc:a", "a:v1", [1.0, 0.0]) is None and cache.stats()["entries"] == 0
+
+def test_least_recently_used_entries_are_evicted():
+    cache = AnswerCache(max_entries=2)
+    cache.put("doc:a", "a", [1.0, 0.0], ANSWER, ["a"])
+    cache.put("doc:b", "b", [1.0, 0.0], ANSWER, ["b"])
+    cache.get("doc:a", "a", [1.0, 0.0])
+    cache.put("doc:c", "c", [1.0, 0.0], ANSWER, ["c"])
+    assert cache.get("doc:b", "b", [1.0, 0.0]) is None and cache.get("doc:a", "a", [1.0, 0.0])
+
+def test_folder_fingerprint_changes_with_the_document_set():
+    files = [{"id": "a", "summary": "one"}, {"id": "b", "summary": "two"}]
+    assert fingerprint(files) == fingerprint(files[::-1])
+    assert fingerprint(files) != fingerprint(files[:1])
+    assert fingerprint(files) != fingerprint([files[0], {"id": "b", "summary": "two, re-summarised"}])
+
+def _document(fakes, status, content_hash="h1"):
+    fakes.supabase.tables["documents"] = [{"id": "doc", "title": "doc.pdf", "folder": "General", "status": status, "content_hash": content_hash}]
+
+def test_single_document_fingerprint_carries_its_version(app_module, fakes):
+    engine = app_module.ocr_engine
+    _document(fakes, "processing")
+    assert engine.document_fingerprint("doc") == "" # Never cache answers over a half-ingested document
+    _document(fakes, "ready")
+    assert engine.document_fingerprint("doc") == "doc:h1"
+    _document(fakes, "ready", "h2")
+    assert engine.document_fingerprint("doc") == "doc:h2"
+    assert engine.document_fingerprint("missing") == ""
+
+@pytest.mark.parametrize("message, refined, history, fingerprint_, cacheable", [
+    ("What was revenue in 2023?", "What was revenue in 2023?", [], "doc:h1", True),
+    ("What was revenue in 2023?", "What was revenue in 2023?", [], "", False),
+    ("And the year before?", "And the year before?", [{"role": "user", "content": "Revenue in 2023?"}], "doc:h1", False),
+    ("And the year before?", "What was revenue in 2022?", [{"role": "user", "content": "Revenue in 2023?"}], "doc:h1", True),
+])
+def test_only_turns_with_a_complete_key_are_cached(app_module, message, refined, history, fingerprint_, cacheable):
+    request = app_module.ChatRequest(message=message, document_id="doc", history=history)
+    turn = app_module.ChatTurn("single_doc", refined, [1.0], scope="doc:doc", fingerprint=fingerprint_)
+    assert app_module._cacheable(request, turn) is cacheable
+
+def test_repeated_question_is_answered_from_the_cache_until_the_document_changes(app_module, fakes):
+    app_module.answer_cache.clear()
+    client = TestClient(app_module.app)
+    _document(fakes, "ready")
+    body = {"message": "What does the report say about revenue?", "document_id": "doc"}
+    def chat_calls():
+        before = fakes.log.snapshot()["openai.chat"]
+        assert client.post("/chat", json=body).status_code == 200
+        return fakes.log.snapshot()["openai.chat"] - before
+
+    assert chat_calls() == 1
+    assert chat_calls() == 0
+    _document(fakes, "ready", "h2") # Re-ingested elsewhere: this worker's entry no longer matches
+    assert chat_calls() == 1
@@ -0,0 +1,29 @@
+import json
+
+import pytest
+
+from services.openai_service import AnswerFieldParser
+
+def _stream(raw: str, step: int) -> str:
+    parser = AnswerFieldParser()
+    return "".join(parser.feed(raw[i:i + step]) for i in range(0, len(raw), step))
+
+@pytest.mark.parametrize("step", [1, 2, 3, 5, 7, 1000])
+def test_streamed_answer_matches_json_decoding_at_any_split(step):
+    answer = 'Line one\nQuote: "x" \\ path/to é ünïcode — and an emoji 😀 done'
+    raw = json.dumps({"answer": answer, "quotes": ["x"]}) # ASCII-escaped, so the emoji is a 😀 pair
+    assert _stream(raw, step) == answer
+
+def test_output_is_valid_utf8_when_the_model_emits_lone_surrogates():
+    text = _stream('{"answer": "a\\ud83d b\\ude00 c\\ud83d"}', 4)
+    assert text == "a� b� c�"
+    text.encode("utf-8")
+
+def test_text_after_the_answer_string_is_ignored():
+    parser = AnswerFieldParser()
+    assert parser.feed('{"answer": "done", "quotes": ["not streamed"]}') == "done"
+    assert parser.feed(' trailing') == "" and parser.state == "done"
+
+def test_non_string_answer_streams_nothing():
+    parser = AnswerFieldParser()
+    assert parser.feed('{"answer": null}') == "" and parser.state == "done"
@@ -0,0 +1,88 @@
+import httpx
+import pytest
+from postgrest.exceptions import APIError
+
+from benchmarks.fakes import CallLog, FakeSupabase, Latency
+from services import bulk_writer
+from services.bulk_writer import BulkWriteError, BulkWriter, is_row_error
+
+class FlakySupabase:
+    """FakeSupabase whose writes fail whenever fail(rows) returns an exception."""
+
+    def __init__(self, fail=lambda rows: None):
+        self.db = FakeSupabase(Latency().scaled(0), CallLog())
+        self.fail = fail
+        self.requests = 0
+
+    def table(self, name):
+        query = self.db.table(name)
+        execute = query.execute
+        def checked():
+            self.requests += 1
+            error = self.fail(query.payload) if query.op in ("insert", "upsert") else None
+            if error: raise error
+            return execute()
+        query.execute = checked
+        return query
+
+    def rows(self): return self.db.tables.get("pages", [])
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(bulk_writer.time, "sleep", lambda seconds: None)
+
+def _rows(n): return [{"i": i, "content": "x"} for i in range(n)]
+
+def duplicate_of(bad):
+    return lambda rows: APIError({"code": "23505", "message": "duplicate key"}) if any(r["i"] in bad for r in rows) else None
+
+def test_rows_are_written_in_size_limited_batches():
+    supabase = FlakySupabase()
+    with BulkWriter(supabase, "pages", batch_size=200) as writer: writer.extend(_rows(450))
+    assert supabase.requests == 3 and len(supabase.rows()) == 450 and writer.rows_written == 450
+
+def test_byte_limit_starts_a_new_batch():
+    supabase = FlakySupabase()
+    with BulkWriter(supabase, "pages", batch_size=1000, max_bytes=100) as writer: writer.extend(_rows(10))
+    assert supabase.requests > 1 and len(supabase.rows()) == 10
+
+def test_a_bad_row_only_costs_its_own_sub_batch():
+    supabase = FlakySupabase(duplicate_of({7}))
+    writer = BulkWriter(supabase, "pages")
+    writer.extend(_rows(200))
+    with pytest.raises(BulkWriteError) as failed: writer.flush()
+    assert [r["i"] for r in failed.value.failed_rows] == [7]
+    assert len(supabase.rows()) == 199
+    assert supabase.requests <= 2 * 8 + 1 # One bisection path, no retries of constraint errors
+
+def test_transient_errors_fail_the_whole_batch_without_splitting():
+    supabase = FlakySupabase(lambda rows: httpx.ConnectError("connection refused"))
+    writer = BulkWriter(supabase, "pages", max_attempts=3)
+    writer.extend(_rows(200))
+    with pytest.raises(BulkWriteError) as failed: writer.flush()
+    assert supabase.requests == 3 and len(failed.value.failed_rows) == 200
+
+def test_requests_per_batch_are_capped():
+    supabase = FlakySupabase(duplicate_of(set(range(200))))
+    writer = BulkWriter(supabase, "pages", max_requests=32)
+    writer.extend(_rows(200))
+    with pytest.raises(BulkWriteError) as failed: writer.flush()
+    assert supabase.requests == 32 and len(failed.value.failed_rows) == 200
+
+def test_upserts_make_rewrites_idempotent():
+    supabase = FlakySupabase()
+    for _ in range(2):
+        with BulkWriter(supabase, "pages", on_conflict="i") as writer: writer.extend(_rows(5))
+    assert len(supabase.rows()) == 5
+
+@pytest.mark.parametrize("error, row_level", [
+    (APIError({"code": "23505"}), True),       # unique violation
+    (APIError({"code": "22P02"}), True),       # invalid input syntax
+    (APIError({"code": 413}), True),           # payload too large: smaller batches help
+    (APIError({"code": 503}), False),
+    (APIError({"code": 429}), False),
+    (APIError({"code": "PGRST301"}), False),   # JWT errors say nothing about the rows
+    (httpx.ReadTimeout("timed out"), False),
+])
+def test_only_row_level_errors_split(error, row_level):
+    assert is_row_error(error) is row_level
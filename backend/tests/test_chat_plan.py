@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+import pytest
+
+from services import deadline as deadline_module
+from services.deadline import Deadline
+from services.openai_service import minor_rewrite
+
+HISTORY = [{"role": "user", "content": "How did revenue develop?"}, {"role": "assistant", "content": "Revenue grew 12%."}]
+
+@pytest.mark.parametrize("question, refined, minor", [
+    ("why is it so low in the report", "why is it so low in the report?", True),
+    ("Why is it low?", "Why is the $5M revenue in the 2023 report considered low?", False),
+    ("and 2022?", "and 2022?", True),
+])
+def test_minor_rewrite(question, refined, minor):
+    assert minor_rewrite(question, refined) is minor
+
+@pytest.fixture
+def plan(app_module, monkeypatch):
+    """Runs _plan for a deep folder turn with a stubbed rewrite, embedding, summary search and selection."""
+    calls = {"embed": [], "select": []}
+
+    def get_embedding(text):
+        calls["embed"].append(text)
+        return [1.0, float(len(text))]
+
+    monkeypatch.setattr(app_module.ocr_engine, "get_embedding", get_embedding)
+    monkeypatch.setattr(app_module.ocr_engine, "find_folder_files", lambda folder, vector, limit: ([{"id": "a", "title": "a.pdf"}], "fp"))
+
+    def run(message, refined, history=HISTORY):
+        async def scenario():
+            started = asyncio.Event()
+            async def generate_refined_query(history, question):
+                if history: await asyncio.wait_for(started.wait(), 1) # Only returns once selection is under way
+                return refined
+            async def select_relevant_files(files, question):
+                calls["select"].append(question)
+                started.set()
+                return [f["id"] for f in files]
+            monkeypatch.setattr(app_module.ai_service, "generate_refined_query", generate_refined_query)
+            monkeypatch.setattr(app_module.ai_service, "select_relevant_files", select_relevant_files)
+            request = app_module.ChatRequest(message=message, folder_name="Reports", mode="deep", history=history)
+            turn = await app_module._plan(request, Deadline())
+            return turn, await turn.select_task
+        return asyncio.run(scenario())
+
+    run.calls = calls
+    return run
+
+def test_selection_on_the_raw_question_overlaps_the_rewrite_and_is_kept(plan):
+    turn, selected = plan("why is it so low in the report", "why is it so low in the report?")
+    assert selected == ["a"] and turn.refined_query.endswith("?") # Not the fallback: the rewrite did not wait on selection in vain
+    assert plan.calls == {"embed": ["why is it so low in the report"], "select": ["why is it so low in the report"]}
+
+def test_a_real_rewrite_redoes_the_preselection(plan):
+    refined = "Why is the $5M revenue in the 2023 report considered low?"
+    turn, selected = plan("Why is it low?", refined)
+    assert plan.calls["embed"] == ["Why is it low?", refined] and plan.calls["select"][-1] == refined
+    assert turn.query_vector == [1.0, float(len(refined))] and selected == ["a"]
+
+def test_embedding_timeout_leaves_the_turn_uncached(app_module, monkeypatch):
+    monkeypatch.setitem(deadline_module.STAGE_TIMEOUTS, "embed", 0.05)
+    monkeypatch.setattr(app_module.ocr_engine, "get_embedding", lambda text: time.sleep(0.5) or [1.0])
+    request = app_module.ChatRequest(message="What was the revenue?", folder_name="Reports", mode="simple")
+    turn = asyncio.run(app_module._plan(request, Deadline()))
+    assert turn.query_vector is None and turn.files == [] and not app_module._cacheable(request, turn)
@@ -0,0 +1,32 @@
+from services.citations import CitationResolver
+
+CHUNKS = [
+    {"content": "Revenue grew 12% in Q3, driven by strong demand in Europe.", "page": 2, "source": "report.pdf", "id": "a", "document_id": "d1"},
+    {"content": "Operating costs remained stable while margins improved to 31 percent.", "page": 3, "source": "report.pdf", "id": "b", "document_id": "d1"},
+    {"content": "Management expects growth next year across all regions.", "page": 4, "source": "outlook.pdf", "id": "c", "document_id": "d2"},
+]
+
+def test_exact_quote_resolves_to_its_chunk_and_offsets():
+    quote = "margins improved to 31 percent."
+    [citation] = CitationResolver(CHUNKS).resolve([quote])
+    assert (citation["id"], citation["page"], citation["document_id"]) == ("b", 3, "d1")
+    assert CHUNKS[1]["content"][citation["start"]:citation["end"]] == quote
+
+def test_matching_ignores_case_and_curly_quotes():
+    [citation] = CitationResolver(CHUNKS).resolve(["MANAGEMENT EXPECTS “growth” next year"])
+    assert citation["id"] == "c"
+    assert CHUNKS[2]["content"][citation["start"]:citation["end"]] == "Management expects growth next year"
+
+def test_quote_across_a_chunk_boundary_goes_to_the_chunk_holding_most_of_it():
+    quote = "strong demand in Europe. Operating costs"
+    ci, start, end = CitationResolver(CHUNKS).locate(quote)
+    assert ci == 0
+    assert CHUNKS[0]["content"][start:end] == "strong demand in Europe."
+
+def test_short_quotes_are_matched_by_scanning():
+    ci, start, end = CitationResolver(CHUNKS).locate("Revenue grew")
+    assert ci == 0 and CHUNKS[0]["content"][start:end] == "Revenue grew"
+
+def test_unrelated_quotes_are_dropped():
+    resolver = CitationResolver(CHUNKS)
+    assert resolver.resolve(["the board approved a new share buyback programme", ""]) == []
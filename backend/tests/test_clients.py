@@ -0,0 +1,36 @@
+import httpx
+import pytest
+
+from services import clients as clients_module
+from services.clients import ClientRegistry
+
+def test_supabase_shares_one_pooled_http_client(monkeypatch):
+    monkeypatch.setenv("SUPABASE_URL", "https://project.supabase.co")
+    monkeypatch.setenv("SUPABASE_KEY", "service-key")
+    registry = ClientRegistry()
+    supabase = registry.supabase()
+    assert registry.supabase() is supabase
+    session = supabase.postgrest.session
+    assert isinstance(session, httpx.Client) and supabase.storage._client is session
+    assert session.timeout.connect == clients_module.HTTP_CONNECT_TIMEOUT and session.timeout.read == clients_module.SUPABASE_TIMEOUT
+    pool = session._transport._pool
+    assert pool._max_connections == clients_module.HTTP_MAX_CONNECTIONS and pool._max_keepalive_connections == clients_module.HTTP_MAX_KEEPALIVE
+    assert pool._http2 == clients_module.HTTP2
+
+def test_requests_keep_absolute_urls_and_auth_headers(monkeypatch):
+    monkeypatch.setenv("SUPABASE_URL", "https://project.supabase.co")
+    monkeypatch.setenv("SUPABASE_KEY", "service-key")
+    seen = []
+    def handler(request):
+        seen.append((str(request.url), request.headers["apikey"]))
+        return httpx.Response(200, json=[])
+    supabase = ClientRegistry().supabase()
+    supabase.postgrest.session._transport = httpx.MockTransport(handler)
+    supabase.table("documents").select("id").eq("id", "1").execute()
+    assert seen == [("https://project.supabase.co/rest/v1/documents?select=id&id=eq.1", "service-key")]
+
+def test_missing_credentials_fail_only_on_use(monkeypatch):
+    monkeypatch.delenv("SUPABASE_URL", raising=False)
+    registry = ClientRegistry()
+    with pytest.raises(ValueError, match="SUPABASE_URL"): registry.supabase()
+    assert registry.created() == []
@@ -0,0 +1,119 @@
+import os
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from services import pdf_cache
+from services.pdf_cache import SourcePDFCache
+
+PDF = b"%PDF-1.4\n" + bytes(range(256)) * 8
+
+@pytest.fixture
+def client(app_module, monkeypatch, tmp_path):
+    sources = {"doc": PDF}
+    failures = []
+    def fetch(doc_id):
+        if failures: raise failures.pop()
+        return sources.get(doc_id)
+    monkeypatch.setattr(app_module, "pdf_cache", SourcePDFCache(fetch, str(tmp_path)))
+    client = TestClient(app_module.app) # No context manager: startup hooks stay off
+    client.failures = failures
+    return client
+
+def test_full_download_sets_validators(client):
+    res = client.get("/documents/doc/download")
+    assert res.status_code == 200 and res.content == PDF
+    assert res.headers["etag"] == f'"doc-{len(PDF)}"' and res.headers["accept-ranges"] == "bytes"
+
+@pytest.mark.parametrize("header, start, end", [("bytes=0-99", 0, 99), ("bytes=100-", 100, len(PDF) - 1), ("bytes=-50", len(PDF) - 50, len(PDF) - 1)])
+def test_range_requests_return_partial_content(client, header, start, end):
+    res = client.get("/documents/doc/download", headers={"Range": header})
+    assert res.status_code == 206 and res.content == PDF[start:end + 1]
+    assert res.headers["content-range"] == f"bytes {start}-{end}/{len(PDF)}"
+
+def test_unsatisfiable_range(client):
+    res = client.get("/documents/doc/download", headers={"Range": f"bytes={len(PDF)}-"})
+    assert res.status_code == 416 and res.headers["content-range"] == f"bytes */{len(PDF)}"
+
+def test_matching_etag_is_not_modified(client):
+    etag = client.get("/documents/doc/download").headers["etag"]
+    res = client.get("/documents/doc/download", headers={"If-None-Match": etag})
+    assert res.status_code == 304 and res.content == b""
+
+def test_missing_source_is_404(client):
+    assert client.get("/documents/nope/download").status_code == 404
+
+def test_storage_failure_is_503_and_not_cached(client):
+    client.failures.append(ConnectionError("storage unreachable"))
+    res = client.get("/documents/doc/download")
+    assert res.status_code == 503 and res.headers["retry-after"] == "5"
+    assert client.get("/documents/doc/download").status_code == 200
+
+def test_waiters_retry_a_failed_shared_download(tmp_path, monkeypatch):
+    started, release, waiting, calls = threading.Event(), threading.Event(), threading.Event(), []
+    class WatchedEvent(threading.Event):
+        def wait(self, timeout=None):
+            waiting.set()
+            return super().wait(timeout)
+    def fetch(doc_id):
+        calls.append(doc_id)
+        if len(calls) == 1:
+            started.set()
+            release.wait()
+            raise ConnectionError("reset by peer")
+        return PDF
+    errors, paths = [], []
+    def first():
+        try: cache.get("doc")
+        except ConnectionError as e: errors.append(e)
+    owner = threading.Thread(target=first)
+    waiter = threading.Thread(target=lambda: paths.append(cache.get("doc")))
+    # Patched after the threads exist: Thread.start() waits on an Event of its own
+    monkeypatch.setattr(pdf_cache.threading, "Event", WatchedEvent)
+    cache = SourcePDFCache(fetch, str(tmp_path))
+    owner.start()
+    started.wait()
+    waiter.start()
+    waiting.wait() # The second request is blocked on the first one's download
+    release.set()
+    owner.join()
+    waiter.join()
+    assert len(errors) == 1 and len(calls) == 2
+    with open(paths[0], "rb") as f: assert f.read() == PDF
+
+def test_cache_evicts_least_recently_used_by_bytes(tmp_path):
+    cache = SourcePDFCache(lambda doc_id: PDF, str(tmp_path), max_bytes=len(PDF) * 2)
+    first = cache.get("a")
+    cache.get("b")
+    cache.get("a")
+    cache.get("c")
+    assert os.path.exists(first) and cache.stats()["files"] == 2
+    assert cache.get("b") and cache.stats()["misses"] == 4
+
+def test_eviction_waits_for_files_being_served(client, app_module):
+    cache = app_module.pdf_cache
+    cache.max_bytes = len(PDF)
+    get = cache.get
+    def get_then_evict(doc_id, pin=False):
+        path = get(doc_id, pin)
+        for other in ("b", "c"): get(other) # Other downloads push the served file out of the budget
+        return path
+    cache.get = get_then_evict
+    cache.fetch = lambda doc_id: PDF
+    res = client.get("/documents/doc/download")
+    assert res.status_code == 200 and res.content == PDF
+    assert not cache._pins
+
+def test_unpin_removes_a_file_evicted_while_served(tmp_path):
+    cache = SourcePDFCache(lambda doc_id: PDF, str(tmp_path))
+    path = cache.get("doc", pin=True)
+    cache.evict("doc")
+    assert os.path.exists(path)
+    cache.unpin("doc")
+    assert not os.path.exists(path) and cache.stats()["files"] == 0
+
+@pytest.mark.parametrize("headers", [{"Range": f"bytes={len(PDF)}-"}, {"If-None-Match": f'"doc-{len(PDF)}"'}, {}])
+def test_every_response_releases_its_pin(client, app_module, headers):
+    client.get("/documents/doc/download", headers=headers)
+    assert not app_module.pdf_cache._pins
@@ -0,0 +1,39 @@
+import pytest
+
+from benchmarks.fakes import CallLog, FakeServices, FakeSupabase, Latency
+from benchmarks.synthetic_pdf import document_pages, make_pdf
+from services.ingest_cache import IngestCache
+
+def _cache(supabase, embedding_model="text-embedding-3-small"):
+    return IngestCache(supabase, "mistral-ocr-latest", "v1", embedding_model, "gpt-4o-mini")
+
+def test_summary_embedding_is_kept_for_the_same_embedding_model_only():
+    supabase = FakeSupabase(Latency().scaled(0), CallLog())
+    _cache(supabase).save_summary("hash", "[TAG]: REPORT", [0.1, 0.2])
+    assert _cache(supabase).load_summary_with_embedding("hash") == ("[TAG]: REPORT", [0.1, 0.2])
+    assert _cache(supabase, "text-embedding-3-large").load_summary_with_embedding("hash") == ("[TAG]: REPORT", None)
+    assert _cache(supabase).load_summary("missing") is None
+
+@pytest.fixture
+def services():
+    fakes = FakeServices(Latency().scaled(0))
+    fakes.install()
+    return fakes
+
+def _ingest(engine, fakes, doc_id, pdf):
+    fakes.supabase.table("documents").insert({"id": doc_id, "title": f"{doc_id}.pdf", "folder": "General", "status": "processing", "ingest_stage": "queued"}).execute()
+    before = fakes.log.snapshot()
+    engine.process_pdf_background(doc_id, pdf, f"{doc_id}.pdf", "General")
+    after = fakes.log.snapshot()
+    return {name: after[name] - before[name] for name in after if after[name] != before[name]}
+
+def test_duplicate_upload_makes_no_model_calls(services):
+    from services.mistral_engine import MistralEngine
+    engine = MistralEngine()
+    pdf = make_pdf(document_pages(0, 2))
+    first = _ingest(engine, services, "first", pdf)
+    assert first["openai.embeddings"] and first["mistral.ocr"]
+    duplicate = _ingest(engine, services, "duplicate", pdf)
+    assert not [name for name in duplicate if name.startswith(("openai.", "mistral."))]
+    row = next(r for r in services.supabase.tables["documents"] if r["id"] == "duplicate")
+    assert row["status"] == "ready" and row["summary_embedding"]
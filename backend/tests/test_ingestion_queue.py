@@ -0,0 +1,117 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fakes import CallLog, FakeSupabase, Latency
+from services import ingestion_queue
+from services.ingestion_queue import IngestionQueue, _timestamp
+
+class FakeEngine:
+    def __init__(self):
+        self.supabase = FakeSupabase(Latency().scaled(0), CallLog())
+        self.status_events = SimpleNamespace(publish=lambda doc_id, **fields: None)
+        self.listing_cache = SimpleNamespace(invalidate=lambda: None)
+        self.processed = []
+
+    def process_pdf_background(self, doc_id, source, filename, folder): self.processed.append(doc_id)
+
+    def document(self, doc_id): return next(r for r in self.supabase.tables["documents"] if r["id"] == doc_id)
+
+def _queue(engine, **kwargs):
+    queue = IngestionQueue(engine, **kwargs)
+    queue.lease_seconds = 60
+    return queue
+
+def _job(engine, doc_id, owner="other-worker", age=0.0, stage="ocr", attempts=None):
+    engine.supabase.tables.setdefault("documents", []).append({
+        "id": doc_id, "title": f"{doc_id}.pdf", "folder": "General", "status": "processing", "ingest_stage": stage,
+        "ingest_attempts": attempts, "ingest_owner": owner, "ingest_heartbeat": _timestamp(-age)})
+
+def test_only_jobs_with_an_expired_lease_are_reclaimed():
+    engine = FakeEngine()
+    queue = _queue(engine)
+    _job(engine, "live", age=10)
+    _job(engine, "expired", age=600, attempts=1)
+    asyncio.run(queue.recover())
+    assert [queue.queue.get_nowait().doc_id] == ["expired"] and queue.queue.empty()
+    assert engine.document("expired")["ingest_owner"] == queue.owner and engine.document("expired")["ingest_attempts"] == 2
+    assert engine.document("live")["ingest_owner"] == "other-worker"
+
+def test_own_jobs_are_never_reclaimed():
+    engine = FakeEngine()
+    queue = _queue(engine)
+    _job(engine, "mine", owner=queue.owner, age=600)
+    asyncio.run(queue.recover())
+    assert queue.queue.empty()
+
+def test_jobs_that_never_reached_storage_are_failed():
+    engine = FakeEngine()
+    queue = _queue(engine)
+    _job(engine, "queued", age=600, stage="queued")
+    asyncio.run(queue.recover())
+    assert queue.queue.empty() and engine.document("queued")["status"] == "failed"
+
+def test_two_workers_cannot_claim_the_same_job():
+    engine = FakeEngine()
+    first, second = _queue(engine), _queue(engine)
+    second.owner = "second-worker"
+    _job(engine, "doc", age=600)
+    row = dict(engine.document("doc"))
+    cutoff = _timestamp(-60)
+    assert first._claim(row, cutoff) and not second._claim(row, cutoff)
+    assert engine.document("doc")["ingest_owner"] == first.owner
+
+def test_recovery_hands_jobs_back_instead_of_waiting_on_a_full_queue():
+    engine = FakeEngine()
+    queue = _queue(engine, max_pending=1)
+    _job(engine, "a", age=600)
+    _job(engine, "b", age=600)
+    claim = queue._claim
+    def claim_then_upload_arrives(row, cutoff):
+        claimed = claim(row, cutoff)
+        if not queue.queue.full(): queue.queue.put_nowait(SimpleNamespace(doc_id="upload"))
+        return claimed
+
+    queue._claim = claim_then_upload_arrives
+    asyncio.run(asyncio.wait_for(queue.recover(), 5))
+    released = engine.document("a")
+    assert released["ingest_owner"] is None and released["ingest_attempts"] is None
+    assert released["ingest_heartbeat"] < _timestamp(-60) # Reclaimable straight away by any worker
+    assert engine.document("b")["ingest_owner"] == "other-worker"
+
+def test_heartbeats_continue_while_recovery_is_stuck(monkeypatch):
+    monkeypatch.setattr(ingestion_queue, "INGEST_HEARTBEAT_SECONDS", 0.01)
+    engine = FakeEngine()
+    queue = _queue(engine, concurrency=0)
+    _job(engine, "mine", owner=queue.owner, age=600)
+    _job(engine, "finished", owner=queue.owner, age=600)
+    engine.document("finished")["status"] = "ready"
+
+    async def scenario():
+        async def stuck(): await asyncio.Event().wait()
+        queue.recover = stuck
+        await queue.start()
+        await asyncio.sleep(0.1)
+        await queue.stop()
+
+    asyncio.run(scenario())
+    assert engine.document("mine")["ingest_heartbeat"] > _timestamp(-5)
+    assert engine.document("finished")["ingest_heartbeat"] < _timestamp(-60)
+
+def test_recovered_jobs_are_processed_by_the_workers():
+    engine = FakeEngine()
+    queue = _queue(engine)
+    _job(engine, "expired", age=600)
+
+    async def scenario():
+        await queue.start()
+        while not engine.processed: await asyncio.sleep(0.01)
+        await queue.stop()
+
+    asyncio.run(scenario())
+    assert engine.processed == ["expired"]
+
+@pytest.mark.parametrize("column", ["ingest_owner", "ingest_heartbeat"])
+def test_new_uploads_carry_a_lease(column):
+    assert _queue(FakeEngine()).lease()[column]
@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+from services.lexical_index import BM25Index, chunk_key, reciprocal_rank_fusion, tokenize
+
+def _rows(*contents):
+    return [{"id": f"r{i}", "page_number": i + 1, "content": c} for i, c in enumerate(contents)]
+
+def test_tokenize_keeps_identifiers_whole_and_indexes_their_parts():
+    tokens = tokenize("Invoice INV-2023-001 for the acme.com account")
+    assert "inv-2023-001" in tokens and "2023" in tokens and "acme.com" in tokens
+    assert "the" not in tokens and "for" not in tokens
+
+def test_exact_terms_rank_first_and_search_respects_document_scope():
+    index = BM25Index()
+    index.add("d1", _rows("quarterly revenue summary", "invoice INV-2023-001 total due"))
+    index.add("d2", _rows("invoice terms and conditions"))
+    hits = index.search("INV-2023-001", limit=5)
+    assert hits[0]["document_id"] == "d1" and hits[0]["page"] == 2
+    assert {h["document_id"] for h in index.search("invoice", ["d2"])} == {"d2"}
+
+def test_adding_the_same_chunk_twice_is_a_no_op_and_remove_updates_statistics():
+    index = BM25Index()
+    index.add("d1", _rows("alpha beta"))
+    index.add("d1", _rows("alpha beta"))
+    index.add("d2", _rows("alpha gamma"))
+    assert index.total_chunks == 2 and index.df["alpha"] == 2
+    index.remove_document("d1")
+    assert index.total_chunks == 1 and index.df["alpha"] == 1 and "beta" not in index.df
+    assert index.search("beta") == []
+
+class _SlowPages:
+    """document_pages stand-in whose first read lets the test run ingests mid-rebuild."""
+
+    def __init__(self, rows, during_scan):
+        self.rows, self.during_scan = rows, during_scan
+
+    def table(self, name): return self
+    def select(self, columns): return self
+    def order(self, column): return self
+    def range(self, start, end): return self
+
+    def execute(self):
+        self.during_scan()
+        return SimpleNamespace(data=self.rows)
+
+def test_rebuild_keeps_changes_made_while_it_scans():
+    index = BM25Index()
+    pages = [{"id": 1, "document_id": "old", "page_number": 1, "content": "alpha report"},
+             {"id": 2, "document_id": "deleted", "page_number": 1, "content": "gamma report"}]
+
+    def ingest_and_delete():
+        index.add("new", _rows("delta invoice"))
+        index.remove_document("deleted")
+
+    index.rebuild(_SlowPages(pages, ingest_and_delete))
+    assert index.ready and sorted(index.docs) == ["new", "old"]
+    assert [h["document_id"] for h in index.search("invoice")] == ["new"]
+    assert index.search("gamma") == []
+
+def test_rrf_rewards_agreement_and_keeps_the_first_lists_copy():
+    vector = [{"document_id": "d", "page": 1, "content": "a", "similarity": 0.9},
+              {"document_id": "d", "page": 2, "content": "b", "similarity": 0.8}]
+    lexical = [{"document_id": "d", "page": 2, "content": "b", "bm25": 4.0},
+               {"document_id": "d", "page": 3, "content": "c", "bm25": 2.0}]
+    fused = reciprocal_rank_fusion([vector, lexical])
+    assert [f["content"] for f in fused] == ["b", "a", "c"]
+    assert fused[0]["similarity"] == 0.8 and "bm25" not in fused[0]
+    assert fused[0]["rrf"] == round(1 / 62 + 1 / 61, 6)
+    assert chunk_key(vector[1]) == chunk_key({**lexical[0], "page_number": 2})
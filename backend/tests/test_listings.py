@@ -0,0 +1,67 @@
+import base64
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+@pytest.fixture
+def client(app_module, fakes):
+    app_module.listing_cache.invalidate()
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    fakes.supabase.tables["folders"] = [{"id": 1, "name": "General"}, {"id": 2, "name": "Reports"}]
+    fakes.supabase.tables["documents"] = [{
+        "id": str(uuid.UUID(int=i)), "title": f"doc-{i}.pdf", "folder": "Reports" if i % 2 else "General", "status": "ready",
+        "created_at": (start + timedelta(hours=i // 2)).isoformat(), # Pairs share a timestamp, so the id breaks ties
+        "summary": "[TAG]: REPORT", "summary_tag": "REPORT", "summary_desc": f"Document {i}",
+    } for i in range(9)]
+    return TestClient(app_module.app)
+
+def _pages(client, **params):
+    pages, cursor = [], None
+    while True:
+        res = client.get("/documents", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert res.status_code == 200
+        pages.append([d["id"] for d in res.json()["documents"]])
+        cursor = res.json()["next_cursor"]
+        if not cursor: return pages
+
+def test_cursor_pages_cover_every_document_once_newest_first(client, fakes):
+    pages = _pages(client, limit=4)
+    assert [len(p) for p in pages] == [4, 4, 1]
+    expected = sorted(fakes.supabase.tables["documents"], key=lambda d: (d["created_at"], d["id"]), reverse=True)
+    assert sum(pages, []) == [d["id"] for d in expected]
+
+def test_folder_filter_pages_within_the_folder(client, fakes):
+    ids = sum(_pages(client, folder="Reports", limit=2), [])
+    assert sorted(ids) == sorted(d["id"] for d in fakes.supabase.tables["documents"] if d["folder"] == "Reports")
+
+def test_tags_are_only_sent_when_asked_for(client):
+    plain = client.get("/documents", params={"limit": 1}).json()["documents"][0]
+    tagged = client.get("/documents", params={"limit": 1, "include_tags": "true"}).json()["documents"][0]
+    assert "summary_tag" not in plain and "summary" not in plain
+    assert tagged["summary_tag"] == "REPORT" and tagged["summary_desc"]
+
+@pytest.mark.parametrize("cursor", [
+    "not-base64!",
+    base64.urlsafe_b64encode(b'["yesterday", "x"]').decode(),
+    base64.urlsafe_b64encode(json.dumps(["2026-01-01T00:00:00+00:00", "1) or (1=1"]).encode()).decode(),
+    base64.urlsafe_b64encode(b'{"a": 1}').decode(),
+])
+def test_malformed_cursors_are_rejected(client, cursor):
+    res = client.get("/documents", params={"cursor": cursor})
+    assert res.status_code == 400 and "Invalid cursor" in res.json()["detail"]
+
+def test_unchanged_listings_revalidate_with_304(client, app_module, fakes):
+    first = client.get("/documents", params={"folder": "Reports"})
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "no-cache"
+    assert client.get("/documents", params={"folder": "Reports"}, headers={"If-None-Match": etag}).status_code == 304
+    fakes.supabase.tables["documents"][1]["title"] = "renamed.pdf"
+    app_module.listing_cache.invalidate() # What ingestion and deletes do
+    changed = client.get("/documents", params={"folder": "Reports"}, headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+
+def test_folders_come_with_document_counts(client):
+    assert client.get("/folders").json() == {"folders": ["General", "Reports"], "counts": {"General": 5, "Reports": 4}}
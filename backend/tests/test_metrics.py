@@ -0,0 +1,73 @@
+import asyncio
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+
+from services.metrics import MetricsRegistry, server_timing_header, start_request_timing, timed
+
+def _value(text, name, **labels):
+    selector = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    return float(re.search(rf"^{re.escape(name)}{{{re.escape(selector)}}} (\S+)$", text, re.M).group(1))
+
+def test_render_writes_cumulative_histograms_and_counters():
+    registry = MetricsRegistry()
+    for seconds in (0.003, 0.2, 0.2, 400.0): registry.observe("embedding", seconds, tokens=10)
+    registry.observe("storage.upload", 0.01, nbytes=2048, error=True)
+    text = registry.render()
+    assert _value(text, "rag_stage_seconds_bucket", stage="embedding", le="0.005") == 1
+    assert _value(text, "rag_stage_seconds_bucket", stage="embedding", le="0.25") == 3
+    assert _value(text, "rag_stage_seconds_bucket", stage="embedding", le="300.0") == 3
+    assert _value(text, "rag_stage_seconds_bucket", stage="embedding", le="+Inf") == 4
+    assert _value(text, "rag_stage_seconds_sum", stage="embedding") == pytest.approx(400.403)
+    assert _value(text, "rag_stage_tokens_total", stage="embedding") == 40
+    assert _value(text, "rag_stage_bytes_total", stage="storage.upload") == 2048
+    assert _value(text, "rag_stage_errors_total", stage="storage.upload") == 1
+    assert "# TYPE rag_stage_seconds histogram" in text and text.endswith("\n")
+
+def test_timed_counts_errors_and_sample_fields():
+    registry = MetricsRegistry()
+    with registry.timed("summary") as sample: sample["tokens"] = 7
+    with pytest.raises(ValueError):
+        with registry.timed("summary"): raise ValueError("model refused")
+    text = registry.render()
+    assert _value(text, "rag_stage_seconds_count", stage="summary") == 2
+    assert _value(text, "rag_stage_tokens_total", stage="summary") == 7
+    assert _value(text, "rag_stage_errors_total", stage="summary") == 1
+
+def test_request_timings_follow_the_request_into_threads():
+    def blocking_call():
+        with timed("supabase.select.documents"): pass
+
+    async def request():
+        timings = start_request_timing()
+        with timed("embedding"): pass
+        await asyncio.to_thread(blocking_call)
+        return [stage for stage, _ in timings]
+
+    assert asyncio.run(request()) == ["embedding", "supabase.select.documents"]
+
+def test_server_timing_header_sums_repeated_stages():
+    header = server_timing_header([("embedding", 0.010), ("search", 0.0305), ("embedding", 0.005)])
+    assert header == 'embedding;dur=15.0;desc="2x", search;dur=30.5;desc="1x"'
+    assert server_timing_header([]) == ""
+
+@pytest.fixture
+def client(app_module, fakes, monkeypatch):
+    app_module.listing_cache.invalidate()
+    def get_documents(*args):
+        with timed("supabase.select.documents"): return {"documents": [], "next_cursor": None}
+    monkeypatch.setattr(app_module.ocr_engine, "get_documents", get_documents)
+    return TestClient(app_module.app)
+
+def test_server_timing_is_opt_in_per_request(client):
+    assert "server-timing" not in client.get("/documents").headers
+    header = client.get("/documents", params={"folder": "Reports"}, headers={"X-Server-Timing": "1"}).headers["server-timing"]
+    stages = [entry.split(";")[0] for entry in header.split(", ")]
+    assert stages == ["supabase.select.documents", "total"]
+
+def test_metrics_endpoint_serves_prometheus_text(client):
+    client.get("/documents", params={"folder": "Metrics"})
+    res = client.get("/metrics")
+    assert res.status_code == 200 and res.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert _value(res.text, "rag_stage_seconds_count", stage="supabase.select.documents") >= 1
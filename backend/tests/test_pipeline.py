@@ -0,0 +1,45 @@
+import threading
+
+import pytest
+
+from services.pipeline import StagePipeline
+
+def test_items_flow_through_every_stage_and_flush_runs_once():
+    out, lock, buffered = [], threading.Lock(), []
+    def batch(item):
+        with lock:
+            buffered.append(item)
+            if len(buffered) < 4: return None
+            ready = list(buffered)
+            buffered.clear()
+        return [ready]
+    def flush():
+        return [list(buffered)] if buffered else None
+    def collect(batch_):
+        with lock: out.extend(batch_)
+
+    pipeline = StagePipeline(queue_size=2)
+    pipeline.add_stage("double", lambda x: [x * 2], workers=3)
+    pipeline.add_stage("batch", batch, flush=flush)
+    pipeline.add_stage("collect", collect, workers=2)
+    pipeline.run(range(10))
+    assert sorted(out) == [x * 2 for x in range(10)]
+
+def test_first_error_stops_every_stage_and_is_reraised():
+    seen = []
+    def explode(x):
+        if x == 3: raise ValueError("bad page 3")
+        return [x]
+
+    pipeline = StagePipeline(queue_size=1)
+    pipeline.add_stage("ocr", lambda x: [x], workers=2)
+    pipeline.add_stage("embed", explode)
+    pipeline.add_stage("write", lambda x: seen.append(x), flush=lambda: seen.append("flushed"))
+    with pytest.raises(ValueError, match="bad page 3"):
+        pipeline.run(range(10_000)) # Upstream is blocked on full queues; run() must still return
+    assert "flushed" not in seen and len(seen) < 10_000
+
+def test_flush_errors_propagate():
+    pipeline = StagePipeline()
+    pipeline.add_stage("buffer", lambda x: None, flush=lambda: (_ for _ in ()).throw(RuntimeError("flush failed")))
+    with pytest.raises(RuntimeError, match="flush failed"): pipeline.run([1, 2])
@@ -0,0 +1,90 @@
+import asyncio
+import json
+import threading
+
+from services import status_events
+from services.status_events import StatusBroadcaster
+
+async def _take(stream, n):
+    return [await asyncio.wait_for(stream.__anext__(), 1) for _ in range(n)]
+
+def test_new_subscribers_get_the_latest_state_of_their_documents():
+    events = StatusBroadcaster()
+    events.publish("a", stage="ocr", pages_total=4)
+    events.publish("a", pages_ocr=2)
+    events.publish("b", stage="embed")
+
+    async def scenario():
+        stream = events.subscribe("a")
+        [event] = await _take(stream, 1)
+        await stream.aclose()
+        return event
+
+    event = asyncio.run(scenario())
+    assert (event["doc_id"], event["stage"], event["pages_total"], event["pages_ocr"]) == ("a", "ocr", 4, 2)
+
+def test_events_published_from_threads_reach_matching_subscribers():
+    events = StatusBroadcaster()
+
+    async def scenario():
+        every, one = events.subscribe(), events.subscribe("b")
+        first = asyncio.ensure_future(_take(every, 2))
+        second = asyncio.ensure_future(_take(one, 1))
+        await asyncio.sleep(0.01) # Both subscribed before anything is published
+        for doc_id in ("a", "b"):
+            worker = threading.Thread(target=events.publish, args=(doc_id,), kwargs={"status": "ready"})
+            worker.start()
+            worker.join()
+        received = [e["doc_id"] for e in await first], [e["doc_id"] for e in await second]
+        await every.aclose()
+        await one.aclose()
+        return received
+
+    assert asyncio.run(scenario()) == (["a", "b"], ["b"])
+    assert events.stats()["subscribers"] == 0
+
+def test_slow_subscribers_lose_the_oldest_events(monkeypatch):
+    monkeypatch.setattr(status_events, "STATUS_SUBSCRIBER_QUEUE", 2)
+    events = StatusBroadcaster()
+
+    async def scenario():
+        stream = events.subscribe("a")
+        pending = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.01)
+        for page in range(1, 6): events.publish("a", pages_ocr=page)
+        await asyncio.sleep(0.01)
+        received = [await pending] + await _take(stream, 1)
+        await stream.aclose()
+        return [e["pages_ocr"] for e in received]
+
+    assert asyncio.run(scenario()) == [4, 5]
+
+def test_silence_yields_a_heartbeat(monkeypatch):
+    monkeypatch.setattr(status_events, "STATUS_HEARTBEAT", 0.01)
+    events = StatusBroadcaster()
+
+    async def scenario():
+        stream = events.subscribe()
+        received = await _take(stream, 1)
+        await stream.aclose()
+        return received
+
+    assert asyncio.run(scenario()) == [None]
+
+def test_ingestion_events_endpoint_streams_status_events(app_module, monkeypatch):
+    monkeypatch.setattr(status_events, "STATUS_HEARTBEAT", 0.01)
+    app_module.status_events.publish("sse-doc", stage="ocr", status="processing")
+
+    async def scenario():
+        response = await app_module.ingestion_events("sse-doc")
+        body = response.body_iterator
+        chunks = await _take(body, 2)
+        await body.aclose()
+        return response, chunks
+
+    response, (status, keepalive) = asyncio.run(scenario())
+    app_module.status_events.forget("sse-doc")
+    assert response.media_type == "text/event-stream" and response.headers["cache-control"] == "no-cache"
+    name, data = status.strip().split("\n")
+    assert name == "event: status" and json.loads(data[len("data: "):])["stage"] == "ocr"
+    assert keepalive == ": keepalive\n\n"
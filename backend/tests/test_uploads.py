@@ -0,0 +1,98 @@
+import asyncio
+import hashlib
+import os
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from services.upload_spool import UploadBudgetError, UploadFormError, UploadSpooler
+
+PDF = b"%PDF-1.4\n" + bytes(range(256)) * 64
+BOUNDARY = "spool-test-boundary"
+
+def _body(filename="report.pdf", data=PDF, folder="Reports"):
+    parts = [f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="folder"\r\n\r\n{folder}\r\n'.encode()] if folder else []
+    parts.append(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\nContent-Type: application/pdf\r\n\r\n'.encode() + data + b"\r\n")
+    return b"".join(parts) + f"--{BOUNDARY}--\r\n".encode()
+
+def _request(body, declare_length=True, chunk=1000):
+    reads = []
+    async def stream():
+        for i in range(0, len(body), chunk):
+            reads.append(i)
+            yield body[i:i + chunk]
+    headers = {"content-type": f"multipart/form-data; boundary={BOUNDARY}", **({"content-length": str(len(body))} if declare_length else {})}
+    return SimpleNamespace(headers=headers, stream=stream, reads=reads)
+
+def test_file_is_streamed_to_one_spool_file_with_its_hash(tmp_path):
+    spooler = UploadSpooler(directory=str(tmp_path))
+    upload, fields = asyncio.run(spooler.spool_form(_request(_body())))
+    assert fields == {"folder": "Reports"} and upload.filename == "report.pdf"
+    assert upload.size == len(PDF) and upload.sha256 == hashlib.sha256(PDF).hexdigest()
+    with upload.open() as f: assert f.read() == PDF
+    assert os.listdir(tmp_path) == [os.path.basename(upload.path)]
+    assert spooler.stats()["inflight_bytes"] == len(PDF) # Multipart overhead is handed back straight away
+    upload.release()
+    assert spooler.stats()["inflight_bytes"] == 0 and not os.listdir(tmp_path)
+
+def test_declared_length_over_budget_is_refused_before_reading(tmp_path):
+    spooler = UploadSpooler(max_bytes=len(PDF), directory=str(tmp_path))
+    request = _request(_body())
+    with pytest.raises(UploadBudgetError): asyncio.run(spooler.spool_form(request))
+    assert request.reads == [] and spooler.stats() == {"inflight_bytes": 0, "max_bytes": len(PDF), "rejected": 1}
+    assert not os.listdir(tmp_path)
+
+def test_undeclared_length_is_refused_once_it_passes_the_budget(tmp_path):
+    spooler = UploadSpooler(max_bytes=len(PDF) // 2, directory=str(tmp_path))
+    request = _request(_body(), declare_length=False)
+    with pytest.raises(UploadBudgetError): asyncio.run(spooler.spool_form(request))
+    assert 0 < len(request.reads) < len(_body()) // 1000
+    assert spooler.stats()["inflight_bytes"] == 0 and not os.listdir(tmp_path)
+
+@pytest.mark.parametrize("body, error", [
+    (_body(folder=None).replace(b'name="file"', b'name="other"'), "No file"),
+    (_body()[:-40], "Malformed"),
+    (_body(folder="x" * 70000), "too large"),
+], ids=["no-file", "truncated", "huge-field"])
+def test_bad_forms_are_rejected_and_cleaned_up(tmp_path, body, error):
+    spooler = UploadSpooler(directory=str(tmp_path))
+    with pytest.raises(UploadFormError, match=error): asyncio.run(spooler.spool_form(_request(body)))
+    assert spooler.stats()["inflight_bytes"] == 0 and not os.listdir(tmp_path)
+
+@pytest.fixture
+def client(app_module, fakes, monkeypatch, tmp_path):
+    submitted = []
+    monkeypatch.setattr(app_module, "upload_spooler", UploadSpooler(max_bytes=len(PDF) * 2, directory=str(tmp_path)))
+    monkeypatch.setattr(app_module.ingest_queue, "submit", submitted.append)
+    client = TestClient(app_module.app)
+    client.submitted = submitted
+    return client
+
+def _post(client, **kwargs):
+    return client.post("/upload", content=_body(**kwargs), headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"})
+
+def test_upload_queues_the_spooled_file(client, app_module, fakes):
+    res = _post(client)
+    assert res.status_code == 200
+    [job] = client.submitted
+    assert (job.doc_id, job.filename, job.folder) == (res.json()["doc_id"], "report.pdf", "Reports")
+    row = next(r for r in fakes.supabase.tables["documents"] if r["id"] == job.doc_id)
+    assert row["folder"] == "Reports" and row["ingest_stage"] == "queued"
+    job.release()
+    assert app_module.upload_spooler.stats()["inflight_bytes"] == 0
+
+def test_non_pdf_is_rejected_and_released(client, app_module, tmp_path):
+    res = _post(client, filename="notes.txt")
+    assert res.status_code == 400 and res.json()["detail"] == "File must be a PDF"
+    assert app_module.upload_spooler.stats()["inflight_bytes"] == 0 and not os.listdir(tmp_path)
+
+def test_over_budget_upload_is_503(client, app_module):
+    res = _post(client, data=PDF * 3)
+    assert res.status_code == 503 and res.headers["retry-after"] == "5"
+    assert app_module.upload_spooler.stats()["rejected"] == 1 and not client.submitted
+
+def test_full_queue_is_503_before_spooling(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module.ingest_queue, "full", lambda: True)
+    assert _post(client).status_code == 503
+    assert app_module.upload_spooler.stats()["inflight_bytes"] == 0 and not client.submitted
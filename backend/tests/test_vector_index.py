@@ -0,0 +1,100 @@
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from services import vector_index
+from services.vector_index import LocalVectorIndex
+
+DIM = 16
+
+def _rows(doc_id, n, folder="General", seed=0):
+    rng = np.random.default_rng(seed)
+    return [{"document_id": doc_id, "page_number": i + 1, "content": f"{doc_id} chunk {i}", "folder": folder,
+             "embedding": rng.normal(size=DIM).astype(np.float32).tolist()} for i in range(n)]
+
+@pytest.fixture
+def index(tmp_path):
+    index = LocalVectorIndex(str(tmp_path))
+    index.ready = True
+    return index
+
+def test_search_finds_the_row_and_respects_scope(index):
+    a, b = _rows("a", 5, seed=1), _rows("b", 5, "Other", seed=2)
+    index.add("General", a)
+    index.add("Other", b)
+    hit = index.search(a[3]["embedding"], match_count=1)[0]
+    assert (hit["document_id"], hit["page_number"]) == ("a", 4) and hit["similarity"] == pytest.approx(1.0)
+    assert {r["document_id"] for r in index.search(a[3]["embedding"], folder="Other")} == {"b"}
+    assert {r["document_id"] for r in index.search(a[3]["embedding"], ["b"])} == {"b"}
+    assert index.has_document("a") and not index.has_document("c")
+
+def test_removed_documents_disappear_before_and_after_compaction(index, monkeypatch):
+    index.add("General", _rows("a", 5, seed=1))
+    index.add("General", _rows("b", 5, seed=2))
+    index.remove_document("a")
+    assert {r["document_id"] for r in index.search(_rows("a", 1, seed=1)[0]["embedding"])} == {"b"}
+    index._compact("General")
+    assert len(index.folders["General"]) == 5 and index.doc_rows["b"] == list(range(5))
+    assert os.path.exists(os.path.join(index.folders["General"].path, "vectors.npy"))
+    query = _rows("b", 3, seed=2)[2]["embedding"]
+    assert index.search(query, match_count=1)[0]["page_number"] == 3
+
+def test_ivf_probes_find_the_nearest_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_index, "IVF_MIN_ROWS", 100)
+    index = LocalVectorIndex(str(tmp_path), mode="ivf")
+    rows = _rows("a", 400, seed=3)
+    index.add("General", rows)
+    index._compact("General")
+    folder = index.folders["General"]
+    assert folder.centroids is not None and sum(len(l) for l in folder.lists) == 400
+    assert len(folder.candidates(vector_index._normalize(np.asarray([rows[7]["embedding"]], dtype=np.float32))[0])) < 400
+    assert index.search(rows[7]["embedding"], match_count=1)[0]["page_number"] == 8
+
+def test_move_folder_keeps_the_vectors(index):
+    rows = _rows("a", 3, "Old")
+    index.add("Old", rows)
+    index.move_folder("Old", "General")
+    assert "Old" not in index.folders and index.doc_folder["a"] == "General"
+    assert index.search(rows[1]["embedding"], folder="General", match_count=1)[0]["page_number"] == 2
+
+class _Pages:
+    """document_pages stand-in that runs `during_scan` while rebuild() is reading."""
+
+    def __init__(self, rows, during_scan):
+        self.rows, self.during_scan = rows, during_scan
+
+    def table(self, name): return self
+    def select(self, columns): return self
+    def order(self, column): return self
+    def range(self, start, end): return self
+
+    def execute(self):
+        self.during_scan()
+        return SimpleNamespace(data=self.rows)
+
+def test_rebuild_keeps_changes_made_while_it_scans(index):
+    stored, deleted, ingested = _rows("stored", 3, seed=1), _rows("deleted", 3, seed=2), _rows("ingested", 4, seed=3)
+    def ingest_and_delete():
+        index.add("General", ingested[:2]) # Written before the scan read document_pages
+        index.add("General", ingested[2:]) # Written after it
+        index.remove_document("deleted")
+
+    index.rebuild(_Pages(stored + deleted + ingested[:2], ingest_and_delete))
+    assert sorted(index.doc_folder) == ["ingested", "stored"]
+    assert len(index.doc_rows["ingested"]) == 4 # Rows both scanned and journaled are indexed once
+    assert index.search(deleted[0]["embedding"], ["deleted"]) == []
+    assert index.search(ingested[3]["embedding"], match_count=1)[0]["page_number"] == 4
+
+def test_each_process_and_rebuild_writes_its_own_directory(tmp_path):
+    index = LocalVectorIndex(str(tmp_path))
+    first = index.directory
+    index.rebuild(_Pages(_rows("a", 3), lambda: None))
+    assert index.directory != first and os.path.basename(index.directory).startswith(f"{os.getpid()}-")
+    assert index.folders["General"].path.startswith(index.directory)
+
+    dead = tmp_path / "999999999-deadbeef"
+    dead.mkdir()
+    LocalVectorIndex(str(tmp_path)).rebuild(_Pages([], lambda: None))
+    assert not dead.exists() and os.path.isdir(index.directory)
@@ -6,6 +6,7 @@ import rehypeKatex from 'rehype-katex';
 import 'katex/dist/katex.min.css';
 import { Mic, Send, ArrowLeft, StopCircle, Loader2, Quote, MapPin, FileText, ChevronRight } from 'lucide-react';
 import Link from 'next/link';
+import { streamChat } from '../../../lib/streamChat';
 
 // PDF VIEWER IMPORTS
 import { Worker, Viewer, DocumentLoadEvent } from '@react-pdf-viewer/core';
@@ -173,13 +174,14 @@ export default function ChatPage({ params }: { params: Promise<{ docId: string }
     setIsLoading(true);
     try {
       const historyPayload = messages.map(m => ({ role: m.role === 'user' ? 'user' : 'assistant', content: m.content }));
-      const response = await fetch(`${BACKEND_URL}/chat`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ message: messageToSend, document_id: docId, history: historyPayload }),
+      let answer = "";
+      const data = await streamChat(BACKEND_URL, { message: messageToSend, document_id: docId, history: historyPayload }, (text) => {
+        const started = answer !== "";
+        answer += text;
+        setIsLoading(false);
+        setMessages(prev => [...(started ? prev.slice(0, -1) : prev), { role: 'ai', content: answer }]);
       });
-      const data = await response.json();
-      setMessages(prev => [...prev, { role: 'ai', content: data.answer, citations: data.citations }]);
+      setMessages(prev => [...(answer ? prev.slice(0, -1) : prev), { role: 'ai', content: data.answer || answer, citations: data.citations }]);
     } catch (error) { setMessages(prev => [...prev, { role: 'ai', content: "Sorry, something went wrong." }]); }
     finally { setIsLoading(false); }
   };
@@ -214,7 +216,7 @@ export default function ChatPage({ params }: { params: Promise<{ docId: string }
             {messages.map((m, i) => (
                 <div key={i} className={`flex flex-col ${m.role === 'user' ? 'items-end' : 'items-start'}`}>
                     <div className={`p-4 max-w-[85%] rounded-2xl text-sm leading-relaxed shadow-sm ${m.role === 'user' ? 'bg-black text-white rounded-br-none' : 'bg-white border border-gray-200 text-gray-800 rounded-bl-none'}`}>
-                        {m.role === 'ai' ? <div className="prose prose-sm"><Typewriter content={m.content} animate={i === messages.length - 1} /></div> : <div className="prose prose-sm prose-invert"><ReactMarkdown>{m.content}</ReactMarkdown></div>}
+                        {m.role === 'ai' ? <div className="prose prose-sm"><Typewriter content={m.content} /></div> : <div className="prose prose-sm prose-invert"><ReactMarkdown>{m.content}</ReactMarkdown></div>}
                     </div>
 
                     {m.role === 'ai' && m.citations && m.citations.length > 0 && (
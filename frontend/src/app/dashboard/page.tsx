@@ -8,6 +8,7 @@ import {
   CheckCircle2, AlertCircle, Clock, FileText, ChevronRight, ChevronDown, Maximize2
 } from 'lucide-react';
 import ReactMarkdown from 'react-markdown';
+import { streamChat } from '../../lib/streamChat';
 
 // PDF VIEWER IMPORTS
 import { Worker, Viewer, DocumentLoadEvent } from '@react-pdf-viewer/core';
@@ -21,13 +22,15 @@ import '@react-pdf-viewer/search/lib/styles/index.css';
 // ⚠️ REPLACE WITH YOUR RENDER URL
 const BACKEND_URL = "https://insightkai.onrender.com";
 const SITE_PASSWORD = "kai2025"; 
+const DOCS_PAGE_SIZE = 60; // Documents per /documents page; more load as the folder is scrolled
 
 interface Doc {
   id: string;
   title: string;
   folder: string;
   status: string;
-  summary: string;
+  summary_tag?: string | null;
+  summary_desc?: string | null;
   upload_date: string;
 }
 
@@ -70,7 +73,16 @@ const groupCitations = (citations: any[]) => {
 
 export default function Dashboard() {
   const [folders, setFolders] = useState<string[]>([]);
+  const [folderCounts, setFolderCounts] = useState<{ [folder: string]: number }>({});
+  // Only the open folder's documents are loaded, one keyset page at a time
   const [docs, setDocs] = useState<Doc[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
+  const [listVersion, setListVersion] = useState(0);
+  const docsShown = useRef(0);
+  const listRequest = useRef(0);
+  const loadMoreRef = useRef<HTMLDivElement>(null);
+  const [ingestProgress, setIngestProgress] = useState<{ [docId: string]: any }>({});
   const [currentFolder, setCurrentFolder] = useState<string | null>(null);
   
   // -- NEW: ACTIVE DOC STATE (SPLIT VIEW) --
@@ -188,6 +200,28 @@ export default function Dashboard() {
     }
   }, []);
 
+  // Ingestion progress is pushed by the backend; the list is only reloaded when a document finishes
+  useEffect(() => {
+    if (!isAuthenticated) return;
+    const source = new EventSource(`${BACKEND_URL}/ingestion/events`);
+    source.addEventListener('status', (e) => {
+      const event = JSON.parse((e as MessageEvent).data);
+      setIngestProgress(prev => ({ ...prev, [event.doc_id]: event }));
+      if (event.status === 'ready' || event.status === 'failed') refreshData();
+    });
+    return () => source.close();
+  }, [isAuthenticated]);
+
+  const describeProgress = (p: any) => {
+    if (!p) return null;
+    if (p.error) return "Retrying after error...";
+    if (p.summary || p.stage === 'indexed') return "Writing summary...";
+    if (p.chunks_indexed) return `Indexed ${p.chunks_indexed} chunks`;
+    if (p.chunks_embedded) return `Embedded ${p.chunks_embedded} chunks`;
+    if (p.pages_total) return `OCR ${p.pages_ocr || 0}/${p.pages_total} pages`;
+    return p.stage === 'queued' ? "Queued" : "Processing...";
+  };
+
   useEffect(() => {
     const processNext = async () => {
       if (isProcessingQueue) return;
@@ -203,26 +237,79 @@ export default function Dashboard() {
         formData.append('file', item.file);
         formData.append('folder', currentFolder || "General");
         const res = await fetch(`${BACKEND_URL}/upload`, { method: 'POST', body: formData });
+        if (res.status === 503) {
+          // Backend ingestion queue is full: put the item back and retry when the server says so
+          const retryAfter = Number(res.headers.get('Retry-After')) || 5;
+          setUploadQueue(prev => prev.map((i, idx) => idx === nextItemIndex ? { ...i, status: 'pending' } : i));
+          await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+          setIsProcessingQueue(false);
+          return;
+        }
         if (!res.ok) throw new Error("Upload failed");
         setUploadQueue(prev => prev.map((i, idx) => idx === nextItemIndex ? { ...i, status: 'completed' } : i));
         refreshData();
       } catch (e) { setUploadQueue(prev => prev.map((i, idx) => idx === nextItemIndex ? { ...i, status: 'error' } : i)); }
 
-      const remaining = uploadQueue.filter(i => i.status === 'pending').length;
-      if (remaining > 1) await new Promise(resolve => setTimeout(resolve, 10000));
       setIsProcessingQueue(false);
     };
     processNext();
   }, [uploadQueue, isProcessingQueue, currentFolder]);
 
+  const fetchDocs = async (folder: string, cursor: string | null, limit: number): Promise<{ documents: Doc[], next_cursor: string | null }> => {
+    // Cards only show the tag and one-line description
+    const params = new URLSearchParams({ folder, include_tags: 'true', limit: String(Math.min(limit, 500)) });
+    if (cursor) params.set('cursor', cursor);
+    const res = await fetch(`${BACKEND_URL}/documents?${params}`);
+    if (!res.ok) throw new Error(`Listing failed: ${res.status}`);
+    return res.json();
+  };
+
+  // Reloads the folder list and counts; the open folder's documents reload through listVersion
   const refreshData = async () => {
+    setListVersion(v => v + 1);
     try {
-        const [resFolders, resDocs] = await Promise.all([ fetch(`${BACKEND_URL}/folders`), fetch(`${BACKEND_URL}/documents`) ]);
-        setFolders((await resFolders.json()).folders || ["General"]);
-        setDocs((await resDocs.json()).documents || []);
+        const data = await (await fetch(`${BACKEND_URL}/folders`)).json();
+        setFolders(data.folders || ["General"]);
+        setFolderCounts(data.counts || {});
     } catch (e) { console.error("Error fetching data", e); }
   };
 
+  useEffect(() => { docsShown.current = 0; }, [currentFolder]);
+
+  // First page of the open folder; a refresh reloads as many documents as were already on screen
+  useEffect(() => {
+    const request = ++listRequest.current;
+    if (!isAuthenticated || !currentFolder) { setDocs([]); setNextCursor(null); return; }
+    fetchDocs(currentFolder, null, Math.max(DOCS_PAGE_SIZE, docsShown.current)).then(page => {
+      if (request !== listRequest.current) return;
+      docsShown.current = page.documents.length;
+      setDocs(page.documents);
+      setNextCursor(page.next_cursor);
+    }).catch(e => console.error("Error fetching documents", e));
+  }, [isAuthenticated, currentFolder, listVersion]);
+
+  const loadMoreDocs = async () => {
+    if (!currentFolder || !nextCursor || isLoadingMore) return;
+    const request = listRequest.current;
+    setIsLoadingMore(true);
+    try {
+        const page = await fetchDocs(currentFolder, nextCursor, DOCS_PAGE_SIZE);
+        if (request !== listRequest.current) return; // Folder changed or the list was reloaded meanwhile
+        setDocs(prev => { docsShown.current = prev.length + page.documents.length; return [...prev, ...page.documents]; });
+        setNextCursor(page.next_cursor);
+    } catch (e) { console.error("Error fetching documents", e); }
+    finally { setIsLoadingMore(false); }
+  };
+
+  // Next page once the end of the list scrolls into view
+  useEffect(() => {
+    const sentinel = loadMoreRef.current;
+    if (!sentinel || !nextCursor || isLoadingMore) return;
+    const observer = new IntersectionObserver(entries => { if (entries[0].isIntersecting) loadMoreDocs(); }, { rootMargin: '400px' });
+    observer.observe(sentinel);
+    return () => observer.disconnect();
+  }, [nextCursor, isLoadingMore, currentFolder]);
+
   const handleLogin = () => {
     if (passwordInput === SITE_PASSWORD) {
         localStorage.setItem('auth_token', SITE_PASSWORD);
@@ -256,7 +343,6 @@ export default function Dashboard() {
   const handleFileSelect = (e: React.ChangeEvent<HTMLInputElement>) => { if (!e.target.files) return; setUploadQueue(prev => [...prev, ...Array.from(e.target.files!).map(file => ({ id: Math.random().toString(36).substr(2, 9), file, status: 'pending' as const }))]); if (fileInputRef.current) fileInputRef.current.value = ''; };
   const cancelUploads = () => setUploadQueue(prev => prev.filter(i => i.status !== 'pending'));
   const clearCompleted = () => setUploadQueue([]);
-  const parseSummary = (rawSummary: string) => { if (!rawSummary) return { tag: null, desc: null }; const tagMatch = rawSummary.match(/\[TAG\]:\s*(.*?)(?=\n|\[|$)/i); const descMatch = rawSummary.match(/\[DESC\]:\s*(.*?)(?=\n|\[|$)/i); return { tag: tagMatch ? tagMatch[1].trim().toUpperCase() : "FILE", desc: descMatch ? descMatch[1].trim() : "No description." }; };
   const getTagColor = (tag: string) => { const colors: any = { 'INVOICE': 'bg-rose-50 text-rose-600 border-rose-200', 'RESEARCH': 'bg-purple-50 text-purple-600 border-purple-200', 'FINANCIAL': 'bg-emerald-50 text-emerald-600 border-emerald-200', 'LEGAL': 'bg-blue-50 text-blue-600 border-blue-200', 'RECEIPT': 'bg-amber-50 text-amber-600 border-amber-200', 'OTHER': 'bg-gray-50 text-gray-600 border-gray-200' }; return colors[tag] || colors['OTHER']; };
 
   // --- CHAT ---
@@ -275,13 +361,14 @@ export default function Dashboard() {
     
     try {
       const historyPayload = chatMessages.map(m => ({ role: m.role === 'user' ? 'user' : 'assistant', content: m.content }));
-      const res = await fetch(`${BACKEND_URL}/chat`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ message: msgToSend, folder_name: currentFolder, mode: chatMode, history: historyPayload }),
+      let answer = "";
+      const data = await streamChat(BACKEND_URL, { message: msgToSend, folder_name: currentFolder, mode: chatMode, history: historyPayload }, (text) => {
+        const started = answer !== "";
+        answer += text;
+        setIsChatLoading(false);
+        setChatMessages(prev => [...(started ? prev.slice(0, -1) : prev), { role: 'ai', content: answer }]);
       });
-      const data = await res.json();
-      setChatMessages(prev => [...prev, { role: 'ai', content: data.answer, citations: data.citations || [] }]);
+      setChatMessages(prev => [...(answer ? prev.slice(0, -1) : prev), { role: 'ai', content: data.answer || answer, citations: data.citations || [] }]);
     } catch (e) { setChatMessages(prev => [...prev, { role: 'ai', content: "Error reaching backend." }]); } 
     finally { setIsChatLoading(false); }
   };
@@ -395,7 +482,7 @@ export default function Dashboard() {
                                         {folder !== "General" && <button onClick={(e) => handleDeleteFolder(folder, e)} className="text-gray-300 hover:text-red-500 transition"><Trash2 size={16}/></button>}
                                     </div>
                                     <h3 className="font-bold text-lg text-gray-900 mb-1">{folder}</h3>
-                                    <p className="text-xs text-gray-400 font-medium">{docs.filter(d => d.folder === folder).length} items</p>
+                                    <p className="text-xs text-gray-400 font-medium">{folderCounts[folder] ?? 0} items</p>
                                 </div>
                             ))}
                         </div>
@@ -403,8 +490,8 @@ export default function Dashboard() {
 
                     {currentFolder && (
                         <div className="grid grid-cols-1 md:grid-cols-2 xl:grid-cols-3 gap-4">
-                            {docs.filter(doc => doc.folder === currentFolder).map((doc) => {
-                                const { tag, desc } = parseSummary(doc.summary);
+                            {docs.map((doc) => {
+                                const tag = doc.summary_tag ? doc.summary_tag.toUpperCase() : null; const desc = doc.summary_tag ? (doc.summary_desc || "No description.") : null;
                                 return (
                                     <div key={doc.id} className="group bg-white p-5 rounded-3xl border border-gray-200 hover:border-blue-300 hover:shadow-md transition-all flex items-start gap-4 relative overflow-hidden h-full">
                                         {doc.status === 'processing' && <div className="absolute top-0 left-0 w-full h-1 bg-blue-100"><div className="h-full bg-blue-500 animate-progress origin-left"></div></div>}
@@ -440,17 +527,22 @@ export default function Dashboard() {
                                                 {tag && <span className={`shrink-0 px-2 py-0.5 rounded-lg text-[10px] font-extrabold border uppercase tracking-wider ${getTagColor(tag)}`}>{tag}</span>}
                                             </div>
                                             <p className="text-xs text-gray-500 leading-relaxed whitespace-normal break-words">{desc}</p>
-                                            <div className="flex gap-4 mt-4 text-[10px] font-bold text-gray-300 uppercase tracking-widest"><span className="flex items-center gap-1"><FileClock size={10}/> {doc.upload_date}</span></div>
+                                            <div className="flex gap-4 mt-4 text-[10px] font-bold text-gray-300 uppercase tracking-widest"><span className="flex items-center gap-1"><FileClock size={10}/> {doc.upload_date}</span>{doc.status === 'processing' && describeProgress(ingestProgress[doc.id]) && <span className="text-blue-400">{describeProgress(ingestProgress[doc.id])}</span>}</div>
                                         </div>
                                     </div>
                                 );
                             })}
-                            {docs.filter(doc => doc.folder === currentFolder).length === 0 && (
+                            {docs.length === 0 && (
                                 <div className="col-span-full flex flex-col items-center justify-center py-20 border-2 border-dashed border-gray-200 rounded-3xl text-gray-400">
                                     <UploadCloud size={40} className="mb-4 text-gray-300"/>
                                     <p className="font-medium">No files yet.</p>
                                 </div>
                             )}
+                            {nextCursor && (
+                                <div ref={loadMoreRef} className="col-span-full flex justify-center py-6 text-gray-300">
+                                    {isLoadingMore && <Loader2 size={20} className="animate-spin"/>}
+                                </div>
+                            )}
                         </div>
                     )}
                 </div>
@@ -494,7 +586,7 @@ export default function Dashboard() {
             {chatMessages.map((m, i) => (
                 <div key={i} className={`flex flex-col ${m.role === 'user' ? 'items-end' : 'items-start'}`}>
                     <div className={`p-5 max-w-[85%] rounded-2xl text-sm leading-relaxed shadow-sm ${m.role === 'user' ? 'bg-black text-white rounded-br-none' : 'bg-white border border-gray-100 text-gray-700 rounded-bl-none'}`}>
-                        {m.role === 'ai' ? <div className="prose prose-sm"><Typewriter content={m.content} animate={i === chatMessages.length - 1} /></div> : <div className="prose prose-sm prose-invert"><ReactMarkdown>{m.content}</ReactMarkdown></div>}
+                        {m.role === 'ai' ? <div className="prose prose-sm"><Typewriter content={m.content} /></div> : <div className="prose prose-sm prose-invert"><ReactMarkdown>{m.content}</ReactMarkdown></div>}
                     </div>
                     
                     {/* CITATIONS */}
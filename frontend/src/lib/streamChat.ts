@@ -0,0 +1,30 @@
+// Reads /chat/stream (Server-Sent Events): calls onToken for each "token" event and
+// resolves with the final answer and citations, or throws on an "error" event.
+export const streamChat = async (backendUrl: string, body: object, onToken: (text: string) => void) => {
+  const res = await fetch(`${backendUrl}/chat/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(body),
+  });
+  if (!res.ok || !res.body) throw new Error(`Chat failed: ${res.status}`);
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  const result = { answer: "", citations: [] as any[] };
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const events = buffer.split("\n\n");
+    buffer = events.pop() || "";
+    for (const raw of events) {
+      const event = raw.match(/^event: (.*)$/m)?.[1];
+      const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] || "{}");
+      if (event === 'token') onToken(data.text);
+      else if (event === 'citations') result.citations = data.citations;
+      else if (event === 'done') result.answer = data.answer;
+      else if (event === 'error') throw new Error(data.message);
+    }
+  }
+  return result;
+};